@@ -0,0 +1,61 @@
+"""Index build, incremental add and query latency of the BM25 keyword index on a synthetic corpus.
+
+Usage:
+    python -m benchmarks.bench_bm25                      # ~50k chunks, ~1M+ postings
+    python -m benchmarks.bench_bm25 --docs 200000
+
+Words are drawn from a Zipf distribution so postings list lengths look like natural text.
+"""
+
+import argparse
+import statistics
+import tempfile
+import time
+
+import numpy as np
+
+from runbook.rag_tools.rag_bm25 import BM25Index
+
+
+def _corpus(docs: int, words_per_doc: int, vocab: int, rng: np.random.Generator) -> list[str]:
+    words = np.minimum(rng.zipf(1.2, size=(docs, words_per_doc)), vocab)
+    return [" ".join(f"w{w}" for w in row) for row in words]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--docs", type=int, default=50_000)
+    parser.add_argument("--words", type=int, default=60)
+    parser.add_argument("--vocab", type=int, default=50_000)
+    parser.add_argument("--queries", type=int, default=500)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    texts = _corpus(args.docs, args.words, args.vocab, rng)
+
+    with tempfile.TemporaryDirectory() as root:
+        index = BM25Index(root)
+        start = time.perf_counter()
+        index.add(list(range(args.docs)), list(range(args.docs)), texts)
+        print(f"build: {time.perf_counter() - start:.2f}s, {len(index)} docs, {index.num_postings} postings")
+
+        start = time.perf_counter()
+        index.add([args.docs], [args.docs], texts[:1])
+        print(f"incremental add: {(time.perf_counter() - start) * 1000:.1f}ms")
+
+        start = time.perf_counter()
+        index = BM25Index(root)
+        print(f"load: {(time.perf_counter() - start) * 1000:.1f}ms")
+
+        queries = [" ".join(f"w{w}" for w in rng.integers(1, 2000, size=4)) for _ in range(args.queries)]
+        timings = []
+        for query in queries:
+            start = time.perf_counter()
+            index.search(query, k=10)
+            timings.append(time.perf_counter() - start)
+        p95 = statistics.quantiles(timings, n=20)[-1]
+        print(f"query: p50 {statistics.median(timings) * 1000:.2f}ms | p95 {p95 * 1000:.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
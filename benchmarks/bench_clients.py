@@ -0,0 +1,113 @@
+"""Connections opened and request latency with LLM clients per event, per session or shared across the process.
+
+Usage:
+    python -m benchmarks.bench_clients                            # 50 sessions x 5 prompts against a local stub
+    python -m benchmarks.bench_clients --sessions 200 --delay-ms 20
+
+The stub answers `/api/chat` after `--delay-ms` over HTTP/1.1 keep-alive and counts the TCP connections it
+accepts. Sessions run concurrently, each sending its prompts one after the other. Against a remote provider
+every avoided connection also saves a TLS handshake, which the local stub doesn't have.
+"""
+
+import argparse
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+from runbook import llm_tools
+from runbook.llm_tools import AsyncLLMClient, LLMConfig, get_async_ai_client
+
+MESSAGES = [{"role": "user", "content": "how do I rotate the access key"}]
+
+
+class _StubOllama(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        time.sleep(self.server.delay)
+        data = json.dumps({"model": "stub", "message": {"role": "assistant", "content": "ok"}, "done": True}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+class _StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024  # listen backlog, the default 5 drops connections when many sessions connect at once
+
+
+def _start_stub(delay: float) -> ThreadingHTTPServer:
+    server = _StubServer(("127.0.0.1", 0), _StubOllama)
+    server.delay, server.connections, server.lock = delay, 0, threading.Lock()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+async def _timed_request(client, latencies: list[float]) -> None:
+    start = time.perf_counter()
+    await client.chat_completion("stub", MESSAGES, cache=False)
+    latencies.append(time.perf_counter() - start)
+
+
+async def _session(mode: str, url: str, prompts: int, latencies: list[float]) -> None:
+    match mode:
+        case "per event":
+            for _ in range(prompts):
+                client = AsyncLLMClient(base_url=url)
+                await _timed_request(client, latencies)
+                await client.close()
+        case "per session":
+            client = AsyncLLMClient(base_url=url)
+            for _ in range(prompts):
+                await _timed_request(client, latencies)
+            await client.close()
+        case "shared":
+            for _ in range(prompts):
+                await _timed_request(get_async_ai_client("ollama", url), latencies)
+
+
+async def _run(mode: str, url: str, sessions: int, prompts: int) -> tuple[list[float], float]:
+    latencies: list[float] = []
+    start = time.perf_counter()
+    await asyncio.gather(*(_session(mode, url, prompts, latencies) for _ in range(sessions)))
+    return latencies, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=50)
+    parser.add_argument("--prompts", type=int, default=5)
+    parser.add_argument("--delay-ms", type=float, default=5.0)
+    args = parser.parse_args()
+
+    LLMConfig.ai_response_cache = False
+    for mode in ("per event", "per session", "shared"):
+        llm_tools.get_client_registry().clear()
+        server = _start_stub(args.delay_ms / 1000)
+        url = f"http://127.0.0.1:{server.server_port}/v1"
+        latencies, wall = asyncio.run(_run(mode, url, args.sessions, args.prompts))
+        print(
+            f"{mode:>11}: {server.connections:5d} connections | mean {np.mean(latencies) * 1000:7.2f}ms | "
+            f"p95 {np.percentile(latencies, 95) * 1000:7.2f}ms | wall {wall:6.2f}s"
+        )
+        server.shutdown()
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""Compare the local HTML->Markdown converter against the LLM conversion on a corpus of saved pages.
+
+Usage:
+    python -m benchmarks.bench_markdown ./saved/rag/pages          # local converter only
+    python -m benchmarks.bench_markdown ./saved/rag/pages --llm    # also run the LLM path (slow)
+
+Pages can be saved with e.g. `curl -o ./saved/rag/pages/page.html <url>`.
+"""
+
+import argparse
+import statistics
+import time
+from pathlib import Path
+
+from runbook.llm_tools import LLMClient, LLMConfig, create_html_parse_prompt, get_content_ollama_api
+from runbook.rag_tools.rag_markdown import html_to_markdown
+from rxconstants import rag_docs_file_dir
+
+
+def _time(fn, *args) -> tuple[float, str]:
+    start = time.perf_counter()
+    out = fn(*args)
+    return time.perf_counter() - start, out
+
+
+def _llm_convert(client: LLMClient, html: str) -> str:
+    resp = client.chat_completion(
+        model=LLMConfig.ai_model,
+        messages=create_html_parse_prompt(html_content=html),
+        stream=False,
+        temperature=0.5,
+    )
+    return get_content_ollama_api(resp)
+
+
+def _summary(name: str, timings: list[float]) -> str:
+    return (
+        f"{name:>6}: total {sum(timings):8.3f}s | mean {statistics.mean(timings) * 1000:9.1f}ms | "
+        f"max {max(timings) * 1000:9.1f}ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("corpus", nargs="?", default=f"{rag_docs_file_dir}/pages")
+    parser.add_argument("--llm", action="store_true", help="also time the LLM conversion")
+    args = parser.parse_args()
+
+    pages = sorted(Path(args.corpus).glob("*.html"))
+    if not pages:
+        raise SystemExit(f"no .html pages found in {args.corpus}")
+
+    client = LLMClient(base_url=LLMConfig.ai_provider_url, api_key=LLMConfig.ai_provider_api_key) if args.llm else None
+    local_times, llm_times = [], []
+
+    for page in pages:
+        html = page.read_text(errors="replace")
+        local_t, markdown = _time(html_to_markdown, html)
+        local_times.append(local_t)
+        line = f"{page.name:<40} {len(html):>9,}B html -> {len(markdown):>8,}B md | local {local_t * 1000:8.1f}ms"
+
+        if client:
+            llm_t, llm_markdown = _time(_llm_convert, client, html)
+            llm_times.append(llm_t)
+            line += f" | llm {llm_t:7.2f}s ({len(llm_markdown):,}B)"
+        print(line)
+
+    print()
+    print(_summary("local", local_times))
+    if llm_times:
+        print(_summary("llm", llm_times))
+        print(f"speedup: {sum(llm_times) / sum(local_times):,.0f}x")
+
+
+if __name__ == "__main__":
+    main()
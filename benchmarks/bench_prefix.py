@@ -0,0 +1,107 @@
+"""Prompt prefix shared by consecutive chat requests of a runbook, folding the history every turn vs in steps.
+
+Usage:
+    python -m benchmarks.bench_prefix                     # 40 turns, offline
+    python -m benchmarks.bench_prefix --turns 80 --llm    # also send the requests, print ollama's prompt eval
+
+An inference server only re-evaluates a prompt after the prefix it shares with what it processed before
+(ollama / llama.cpp keep the KV cache of the last prompt per slot). Offline, the shared prefix of each request
+with the previous one is measured on the rendered messages. With `--llm` each request of the stepped policy is
+sent to the model (1 token answer) and ollama's prompt eval count and duration are printed per turn: turns
+with a reused prefix evaluate much faster.
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from runbook.db_models import ChatInteraction
+from runbook.llm_tools import (
+    LLMClient,
+    LLMConfig,
+    create_messages_for_chat_completion,
+    history_fold_point,
+    history_overflow,
+)
+from runbook.utils import estimate_tokens
+
+WORDS = "the cluster access key rotate create delete token workspace admin console run command with and to".split()
+CONTEXT = "\n\n".join(f"[{n}] Keys ({n}.md)\n" + " ".join(WORDS * 6) for n in range(1, 5))
+
+
+def _render(messages: list[dict]) -> str:
+    def text(content) -> str:
+        return content if isinstance(content, str) else "".join(part["text"] for part in content)
+
+    return "".join(f"<{message['role']}>{text(message['content'])}" for message in messages)
+
+
+def _shared_prefix(a: str, b: str) -> int:
+    n = min(len(a), len(b))
+    mismatch = np.flatnonzero(
+        np.frombuffer(a[:n].encode("utf-32-le"), np.uint32) != np.frombuffer(b[:n].encode("utf-32-le"), np.uint32)
+    )
+    return int(mismatch[0]) if mismatch.size else n
+
+
+def _conversation(turns: int, answer_words: int, fold, rng: np.random.Generator):
+    """Yield the messages of each turn, folding history into a (fake) summary the way `fold` decides."""
+    history: list[ChatInteraction] = []
+    summary, summarized, updates = "", 0, 0
+    for i in range(turns):
+        prompt = f"question {i}: " + " ".join(rng.choice(WORDS, size=12))
+        yield (
+            create_messages_for_chat_completion(
+                history, prompt, context=CONTEXT, summary=summary, summarized_turns=summarized
+            ),
+            updates,
+        )
+        answer = " ".join(rng.choice(WORDS, size=answer_words))
+        history.append(ChatInteraction(prompt=prompt, answer=answer, chat_participant_user_name="user"))
+        if (target := fold(history, summarized)) != summarized:
+            summarized, updates = target, updates + 1
+            summary = f"summary of turns 0-{summarized}: " + " ".join(WORDS * 20)
+
+
+def _eager(history: list[ChatInteraction], summarized: int) -> int:
+    # fold exactly what overflows, i.e. on every turn once the budget is reached
+    return max(summarized, history_overflow(history, LLMConfig.ai_history_tokens))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--turns", type=int, default=40)
+    parser.add_argument("--answer-words", type=int, default=150)
+    parser.add_argument("--llm", action="store_true")
+    args = parser.parse_args()
+
+    for name, fold in (("every turn", _eager), ("in steps", history_fold_point)):
+        previous, shared, total, updates = "", [], 0, 0
+        for messages, updates in _conversation(args.turns, args.answer_words, fold, np.random.default_rng(0)):
+            rendered = _render(messages)
+            prefix = _shared_prefix(previous, rendered)
+            shared.append(prefix / len(rendered))
+            total += estimate_tokens(rendered[prefix:])
+            previous = rendered
+        print(
+            f"{name:>10}: shared prefix mean {np.mean(shared[1:]):6.1%} | {total:7d} tokens to evaluate | "
+            f"{updates:3d} summary requests"
+        )
+
+    if not args.llm:
+        return
+    client = LLMClient(base_url=LLMConfig.ai_provider_url, api_key=LLMConfig.ai_provider_api_key)
+    for turn, (messages, _) in enumerate(
+        _conversation(args.turns, args.answer_words, history_fold_point, np.random.default_rng(0))
+    ):
+        start = time.perf_counter()
+        resp = client.chat_completion(LLMConfig.ai_model, messages, cache=False, max_tokens=1)
+        print(
+            f"turn {turn:3d}: {resp.prompt_eval_count or 0:6d} prompt tokens evaluated in "
+            f"{(resp.prompt_eval_duration or 0) / 1e9:6.2f}s | request {time.perf_counter() - start:6.2f}s"
+        )
+
+
+if __name__ == "__main__":
+    main()
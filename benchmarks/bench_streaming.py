@@ -0,0 +1,108 @@
+"""Websocket frames and bytes sent to the browser while streaming an answer, per token vs coalesced flushes.
+
+Usage:
+    python -m benchmarks.bench_streaming                  # answers of 250, 1000 and 4000 tokens at 50 tokens/s
+    python -m benchmarks.bench_streaming --tokens 1000 --token-ms 5 --history 20
+
+A frame is one state update (the JSON of the vars that changed) or one scroll event. Streaming per token sends
+the whole `chat_interactions` list and a scroll per token, coalesced streaming sends the answer and a scroll
+per flush plus the list once at the end. "coalesced" sends the whole answer so far on every flush, "settled"
+only its tail and the rest every `STREAM_SETTLE_CHARS` (see llm_tools.append_streamed). Computed vars and the
+protocol envelope are left out.
+"""
+
+import argparse
+import asyncio
+import json
+from collections.abc import AsyncIterator
+
+import numpy as np
+
+from runbook.llm_tools import (
+    STREAM_FLUSH_CHARS,
+    STREAM_FLUSH_INTERVAL,
+    STREAM_SETTLE_CHARS,
+    append_streamed,
+    coalesce_deltas,
+)
+from rxconstants import INPUT_BOX_ID
+
+WORDS = "the cluster access key rotate create delete token workspace admin console run command with and to".split()
+SCROLL_EVENT = json.dumps(
+    {"name": "_call_script", "payload": {"javascript_code": f"document.getElementById('{INPUT_BOX_ID}')"}}
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def _interaction(prompt: str, answer: str) -> dict:
+    return {"prompt": prompt, "answer": answer, "chat_participant_user_name": "user", "interaction_id": 1}
+
+
+async def _tokens(tokens: list[str], clock: FakeClock, token_s: float) -> AsyncIterator[str]:
+    for token in tokens:
+        clock.now += token_s
+        yield token
+
+
+def _per_token(history: list[dict], tokens: list[str]) -> tuple[int, int]:
+    frames, sent, answer = 0, 0, ""
+    for token in tokens:
+        answer += token
+        sent += len(json.dumps({"chat_interactions": [*history, _interaction("q", answer)]}))
+        sent += len(SCROLL_EVENT)
+        frames += 2
+    return frames, sent
+
+
+async def _coalesced(history: list[dict], tokens: list[str], token_s: float, interval: float, chars: int, settle: int):
+    clock = FakeClock()
+    frames, sent, answer = 0, 0, ""
+    settled, tail = "", ""
+    async for text in coalesce_deltas(_tokens(tokens, clock, token_s), interval=interval, max_chars=chars, clock=clock):
+        answer += text
+        if settle:
+            previous = settled
+            settled, tail = append_streamed(settled, tail, text, settle_chars=settle)
+            changed = {"streaming_answer": settled, "streaming_tail": tail} if settled != previous else {}
+            sent += len(json.dumps(changed or {"streaming_tail": tail}))
+        else:
+            sent += len(json.dumps({"streaming_answer": answer}))
+        sent += len(SCROLL_EVENT)
+        frames += 2
+    sent += len(json.dumps({"chat_interactions": [*history, _interaction("q", answer)]}))
+    return frames + 1, sent
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tokens", type=int, nargs="+", default=[250, 1000, 4000])
+    parser.add_argument("--token-ms", type=float, default=20.0)
+    parser.add_argument("--history", type=int, default=5)
+    parser.add_argument("--answer-chars", type=int, default=3000)
+    parser.add_argument("--interval-ms", type=float, default=STREAM_FLUSH_INTERVAL * 1000)
+    parser.add_argument("--chars", type=int, default=STREAM_FLUSH_CHARS)
+    parser.add_argument("--settle-chars", type=int, default=STREAM_SETTLE_CHARS)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    history = [_interaction(f"question {i}", "x" * args.answer_chars) for i in range(args.history)]
+    for size in args.tokens:
+        tokens = [f" {WORDS[i]}" for i in rng.integers(len(WORDS), size=size)]
+        print(f"{size} tokens, {len(''.join(tokens))} chars")
+        frames, sent = _per_token(history, tokens)
+        print(f"  per token: {frames:6d} frames | {sent / 1e6:8.3f} MB")
+        token_s, interval = args.token_ms / 1000, args.interval_ms / 1000
+        for name, settle in (("coalesced", 0), ("settled", args.settle_chars)):
+            frames, sent = asyncio.run(_coalesced(history, tokens, token_s, interval, args.chars, settle))
+            print(f"  {name:>9}: {frames:6d} frames | {sent / 1e6:8.3f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""Recall@k vs latency of the IVF vector index against exact brute-force search.
+
+Usage:
+    python -m benchmarks.bench_vector                              # 200k synthetic 384-d vectors
+    python -m benchmarks.bench_vector --rows 500000 --nprobe 4 8 16 32 64
+
+Vectors are clustered synthetic data (real embeddings cluster by topic), queries are perturbed rows.
+The index is written to a temp dir so load time from disk is measured too.
+"""
+
+import argparse
+import statistics
+import tempfile
+import time
+
+import numpy as np
+
+from runbook.rag_tools.rag_embed import normalize
+from runbook.rag_tools.rag_vector import IVFVectorIndex, VectorIndex
+
+
+def _clustered(rows: int, dim: int, clusters: int, rng: np.random.Generator) -> np.ndarray:
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    vectors = centers[rng.integers(clusters, size=rows)]
+    vectors += 0.5 * rng.standard_normal((rows, dim)).astype(np.float32)
+    return normalize(vectors)
+
+
+def _timed_search(index: VectorIndex, queries: np.ndarray, k: int) -> tuple[list[set[int]], list[float]]:
+    results, timings = [], []
+    for query in queries:
+        start = time.perf_counter()
+        hits = index.search(query, k=k)
+        timings.append(time.perf_counter() - start)
+        results.append({chunk_id for chunk_id, _ in hits})
+    return results, timings
+
+
+def _ms(timings: list[float]) -> str:
+    p95 = statistics.quantiles(timings, n=20)[-1]
+    return f"p50 {statistics.median(timings) * 1000:7.2f}ms | p95 {p95 * 1000:7.2f}ms"
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--clusters", type=int, default=500)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--nlist", type=int, default=None)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 8, 16, 32, 64])
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    vectors = _clustered(args.rows, args.dim, args.clusters, rng)
+    queries = normalize(vectors[rng.choice(args.rows, size=args.queries)] + 0.1 * rng.standard_normal((1, args.dim)))
+
+    with tempfile.TemporaryDirectory() as root:
+        start = time.perf_counter()
+        index = IVFVectorIndex(root, nlist=args.nlist, train_min_rows=args.rows)
+        index.add(list(range(args.rows)), [0] * args.rows, vectors, model="bench")
+        print(f"build: {time.perf_counter() - start:.2f}s, nlist {len(index._snapshot.ivf.centroids)}")
+
+        start = time.perf_counter()
+        exact = VectorIndex(root)
+        print(f"load flat: {(time.perf_counter() - start) * 1000:.1f}ms")
+        start = time.perf_counter()
+        index = IVFVectorIndex(root)
+        print(f"load ivf:  {(time.perf_counter() - start) * 1000:.1f}ms")
+
+        truth, timings = _timed_search(exact, queries, args.k)
+        print(f"{'exact':>10}: recall@{args.k} 1.000 | {_ms(timings)}")
+
+        for nprobe in args.nprobe:
+            index.nprobe = nprobe
+            results, timings = _timed_search(index, queries, args.k)
+            recall = statistics.mean(len(got & want) / args.k for got, want in zip(results, truth))
+            print(f"{f'nprobe={nprobe}':>10}: recall@{args.k} {recall:.3f} | {_ms(timings)}")
+
+
+if __name__ == "__main__":
+    main()
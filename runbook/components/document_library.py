@@ -33,6 +33,10 @@ def document_source_card(doc: DocumentSource):
                 text_overflow="ellipsis",
                 color=rx.color("slate", 11),
             ),
+            rx.cond(
+                ChatState.parsing_document_id == doc.id,
+                rx.text(ChatState.parse_progress_text, size="1", color=rx.color("slate", 11)),
+            ),
             rx.text(
                 # description,
                 width="100%",
@@ -51,9 +55,16 @@ def document_source_card(doc: DocumentSource):
         rx.hstack(
             rx.box(
                 rx.tooltip(badge_with_icon("move-up-right"), content="refresh page"),
-                on_click=rx.redirect("https://docs.databricks.com", external=True),
+                on_click=ChatState.refresh_document(doc.id),
+            ),
+            rx.box(
+                rx.tooltip(badge_with_icon("file-cog"), content="parse document"),
+                on_click=ChatState.regenerate_parsed_document(doc.id, "local"),
+            ),
+            rx.box(
+                rx.tooltip(badge_with_icon("sparkles"), content="parse and polish with LLM"),
+                on_click=ChatState.regenerate_parsed_document(doc.id, "polish"),
             ),
-            rx.tooltip(badge_with_icon("file-cog"), content="edit document"),
             rx.box(
                 rx.tooltip(badge_with_icon("trash-2"), content="delete document"),
                 on_click=delete_on_click,
@@ -17,6 +17,10 @@ class Runbook(rx.Model, table=True):
     status: str = "active"  # active, archived, draft, exported
     created_at: datetime = datetime.now(tz=tz)
 
+    # rolling summary of the oldest `summarized_turns` chat interactions, sent instead of them (see llm_tools)
+    history_summary: str = ""
+    summarized_turns: int = 0
+
     updated_at: datetime | None = Field(
         default_factory=lambda: datetime.now(tz=tz),
         nullable=False,
@@ -66,9 +70,16 @@ class DocumentSource(DocumentBase, table=True):
     """A table for storing HTML pages in the database."""
 
     path: str
-    content: str  # either the raw html or the parsed html content
+    # bodies live in the content-addressed blob store (rag_tools.rag_blob), these hold the blob hashes
+    raw_blob: str | None = None  # original html
+    content_blob: str | None = None  # main content html with boilerplate (nav, footer, scripts, etc) stripped
+    parsed_blob: str | None = None  # markdown
+    # inline bodies, only populated on rows created before the blob store
+    content: str = ""
     parsed_content: str | None = ""
     meta: dict = Field(default_factory=dict, sa_column=Column(JSON))
+    # last re-fetch, whatever its outcome (`updated_at` only moves when the content changed), see rag_refresh
+    checked_at: datetime | None = Field(default=None, index=True)
 
     title: str | None = None
     content_type: ContentType = ContentType.DEFAULT
@@ -77,6 +88,26 @@ class DocumentSource(DocumentBase, table=True):
         return f"DocSrc(urls={self.path}, title={self.title}, content_type={self.content_type})"
 
 
+class DocumentChunk(rx.Model, table=True):
+    """A retrievable passage of a DocumentSource's parsed (markdown) content."""
+
+    source_id: int = Field(foreign_key="documentsource.id", index=True)
+    chunk_index: int
+    text: str
+    heading: str = ""  # heading path the chunk is under, e.g. "Install > Linux"
+
+    # character offsets of `text` in the parsed content it was cut from
+    start_offset: int
+    end_offset: int
+    num_tokens: int
+
+    # hash of the parsed content + chunking params, chunking is skipped if this is unchanged
+    source_hash: str = Field(index=True)
+
+    def __repr__(self):
+        return f"DocChunk(source_id={self.source_id}, chunk_index={self.chunk_index}, heading={self.heading})"
+
+
 DocumentTableLookup = {
     "documentsource": DocumentSource,
 }
@@ -84,5 +115,6 @@ DocumentTableLookup = {
 TableLookup = {
     "runbook": Runbook,
     "chatinteraction": ChatInteraction,
+    "documentchunk": DocumentChunk,
     **DocumentTableLookup,
 }
@@ -1,12 +1,16 @@
+import re
+import weakref
 from datetime import datetime
 from functools import wraps
 from typing import Callable, ParamSpec, TypeVar
 
 import reflex as rx
-from sqlmodel import Session, column, or_, select
+from sqlalchemy import Engine, text
+from sqlalchemy.exc import OperationalError
+from sqlmodel import Session, col, or_, select
 from sqlmodel.sql.expression import SelectOfScalar
 
-from runbook.db_models import ChatInteraction, DocumentSource, Runbook
+from runbook.db_models import ChatInteraction, DocumentChunk, DocumentSource, Runbook
 from rxconstants import MAX_QUESTIONS, tz
 
 Params = ParamSpec("Params")
@@ -29,9 +33,10 @@ def with_session(fn: Callable[..., ReturnType]) -> Callable[..., ReturnType]:
 
     @wraps(fn)
     def wrapper(*args, **kwargs) -> ReturnType:
-        session = kwargs.get("session")
+        # `session=None` counts as not given, so callers can pass an optional session through
+        session = kwargs.pop("session", None)
         if session is not None:
-            return fn(*args, **kwargs)
+            return fn(*args, **kwargs, session=session)
         else:
             with rx.session() as new_session:
                 return fn(*args, **kwargs, session=new_session)
@@ -102,6 +107,22 @@ def create_new_runbook(username: str, *, session: Session) -> Runbook:
         raise
 
 
+@with_session
+def update_runbook_history_summary(runbook_id: int, summary: str, summarized_turns: int, *, session: Session) -> None:
+    """Store the rolling summary of a runbook's oldest chat interactions.
+
+    Args:
+        runbook_id: The runbook to update
+        summary: Summary of the first `summarized_turns` chat interactions
+        summarized_turns: The number of chat interactions the summary covers
+        session: The database session to use
+    """
+    if runbook := session.get(Runbook, runbook_id):
+        runbook.history_summary = summary
+        runbook.summarized_turns = summarized_turns
+        session.commit()
+
+
 # Chat Interaction Operations
 @with_session
 def fetch_messages(
@@ -122,20 +143,16 @@ def fetch_messages(
         limit: Maximum number of messages to return
 
     Returns:
-        A sequence of chat interactions ordered by timestamp descending
+        A sequence of chat interactions ordered by timestamp descending, or by relevance when filtering
     """
+    if filter_str:
+        hits = search_chat_interactions(filter_str, username=username, limit=limit, session=session)
+        return [chat_interaction for chat_interaction, _ in hits]
+
     query: SelectOfScalar[ChatInteraction] = select(ChatInteraction).where(
         ChatInteraction.chat_participant_user_name == username
     )
 
-    if filter_str:
-        query = query.where(
-            or_(
-                column(ChatInteraction.prompt).ilike(f"%{filter_str}%"),
-                column(ChatInteraction.answer).ilike(f"%{filter_str}%"),
-            ),
-        )
-
     query = query.order_by(ChatInteraction.timestamp.desc())
     if limit:
         query = query.limit(limit)
@@ -156,9 +173,11 @@ def get_runbook_chat_interactions(
         session: The database session to use
 
     Returns:
-        A sequence of chat interactions for the runbook
+        A sequence of chat interactions for the runbook, oldest first
     """
-    query: SelectOfScalar[ChatInteraction] = select(ChatInteraction).where(ChatInteraction.interaction_id == runbook_id)
+    query: SelectOfScalar[ChatInteraction] = (
+        select(ChatInteraction).where(ChatInteraction.interaction_id == runbook_id).order_by(ChatInteraction.id)
+    )
     return list(session.exec(query).all())
 
 
@@ -239,3 +258,170 @@ def delete_document_source(source_id: int, *, session: Session) -> bool:
         return True
 
     return False
+
+
+# Full Text Search
+# SQLite FTS5 indexes over chat history and document chunks, kept in sync with their tables by triggers.
+# Other databases (or SQLite builds without FTS5) fall back to `ilike` scans.
+
+FTS_TABLES: dict[str, tuple[str, tuple[str, ...]]] = {
+    # fts table: (content table, indexed columns)
+    "chatinteraction_fts": ("chatinteraction", ("prompt", "answer")),
+    "documentchunk_fts": ("documentchunk", ("heading", "text")),
+}
+FTS_TOKEN_RE = re.compile(r"\w+")
+SNIPPET_CHARS = 160
+
+_fts_ready: "weakref.WeakKeyDictionary[Engine, bool]" = weakref.WeakKeyDictionary()
+
+
+def _fts_ddl(fts_table: str, content_table: str, columns: tuple[str, ...]) -> list[str]:
+    cols = ", ".join(columns)
+    new = ", ".join(f"new.{c}" for c in columns)
+    old = ", ".join(f"old.{c}" for c in columns)
+    delete_old = f"INSERT INTO {fts_table}({fts_table}, rowid, {cols}) VALUES ('delete', old.id, {old});"
+    insert_new = f"INSERT INTO {fts_table}(rowid, {cols}) VALUES (new.id, {new});"
+    return [
+        f"CREATE VIRTUAL TABLE {fts_table} USING fts5({cols}, content='{content_table}', content_rowid='id', "
+        "tokenize='porter unicode61', prefix='2 3')",
+        f"CREATE TRIGGER IF NOT EXISTS {fts_table}_ai AFTER INSERT ON {content_table} BEGIN {insert_new} END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts_table}_ad AFTER DELETE ON {content_table} BEGIN {delete_old} END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts_table}_au AFTER UPDATE OF {cols} ON {content_table} "
+        f"BEGIN {delete_old} {insert_new} END",
+        # index the rows that existed before the fts table
+        f"INSERT INTO {fts_table}({fts_table}) VALUES ('rebuild')",
+    ]
+
+
+def ensure_fts(session: Session) -> bool:
+    """Create the FTS5 tables and triggers if needed, checked once per engine.
+
+    Returns:
+        True if full text search is available on this database
+    """
+    engine = session.get_bind().engine
+    if (ready := _fts_ready.get(engine)) is not None:
+        return ready
+
+    ready = engine.dialect.name == "sqlite"
+    if ready:
+        try:
+            with engine.begin() as conn:
+                existing = {row[0] for row in conn.execute(text("SELECT name FROM sqlite_master WHERE type='table'"))}
+                for fts_table, (content_table, columns) in FTS_TABLES.items():
+                    if fts_table not in existing and content_table in existing:
+                        for statement in _fts_ddl(fts_table, content_table, columns):
+                            conn.execute(text(statement))
+        except OperationalError as err:
+            print(f"Full text search unavailable, falling back to ilike: {err}")
+            ready = False
+
+    _fts_ready[engine] = ready
+    return ready
+
+
+def fts_match_query(query: str) -> str:
+    """Turn free text into a safe FTS5 query: every word must match, the last one as a prefix (search as you type)."""
+    tokens = FTS_TOKEN_RE.findall(query)
+    if not tokens:
+        return ""
+    return " ".join([*(f'"{t}"' for t in tokens[:-1]), f'"{tokens[-1]}"*'])
+
+
+def _fallback_snippet(body: str, query: str) -> str:
+    match = re.search(re.escape(query), body, re.IGNORECASE)
+    start = max((match.start() if match else 0) - SNIPPET_CHARS // 4, 0)
+    return ("…" if start else "") + body[start : start + SNIPPET_CHARS]
+
+
+@with_session
+def search_chat_interactions(
+    query: str,
+    *,
+    session: Session,
+    username: str | None = None,
+    limit: int = MAX_QUESTIONS,
+) -> list[tuple[ChatInteraction, str]]:
+    """Ranked full text search over chat prompts and answers.
+
+    Args:
+        query: Free text to search for
+        session: The database session to use
+        username: Only search this user's chat interactions
+        limit: Maximum number of results
+
+    Returns:
+        (chat interaction, snippet) pairs, best match first
+    """
+    if not (match := fts_match_query(query)):
+        return []
+
+    if ensure_fts(session):
+        sql = (
+            "SELECT c.id, snippet(chatinteraction_fts, -1, '', '', '…', 24) FROM chatinteraction_fts "
+            "JOIN chatinteraction c ON c.id = chatinteraction_fts.rowid WHERE chatinteraction_fts MATCH :match"
+        )
+        if username is not None:
+            sql += " AND c.chat_participant_user_name = :username"
+        rows = session.execute(
+            text(sql + " ORDER BY rank LIMIT :limit"), {"match": match, "username": username, "limit": limit}
+        ).all()
+        by_id = {
+            chat_interaction.id: chat_interaction
+            for chat_interaction in session.exec(
+                select(ChatInteraction).where(col(ChatInteraction.id).in_([row[0] for row in rows]))
+            )
+        }
+        return [(by_id[row_id], snippet) for row_id, snippet in rows if row_id in by_id]
+
+    fallback = select(ChatInteraction).where(
+        or_(
+            col(ChatInteraction.prompt).ilike(f"%{query}%"),
+            col(ChatInteraction.answer).ilike(f"%{query}%"),
+        ),
+    )
+    if username is not None:
+        fallback = fallback.where(ChatInteraction.chat_participant_user_name == username)
+    fallback = fallback.order_by(ChatInteraction.timestamp.desc()).limit(limit)
+    return [(c, _fallback_snippet(f"{c.prompt}\n{c.answer}", query)) for c in session.exec(fallback).all()]
+
+
+@with_session
+def search_documents(query: str, *, session: Session, limit: int = MAX_QUESTIONS) -> list[tuple[DocumentSource, str]]:
+    """Ranked full text search over the chunks of non-deleted documents, one result per document.
+
+    Returns:
+        (document source, snippet of its best matching chunk) pairs, best match first
+    """
+    if not (match := fts_match_query(query)):
+        return []
+
+    if ensure_fts(session):
+        rows = session.execute(
+            text(
+                "SELECT c.source_id, snippet(documentchunk_fts, -1, '', '', '…', 24) FROM documentchunk_fts "
+                "JOIN documentchunk c ON c.id = documentchunk_fts.rowid "
+                "JOIN documentsource s ON s.id = c.source_id "
+                "WHERE documentchunk_fts MATCH :match AND s.is_deleted = 0 ORDER BY rank LIMIT :limit"
+            ),
+            # several chunks of a document can match, fetch extra to still fill `limit` documents
+            {"match": match, "limit": limit * 5},
+        ).all()
+    else:
+        chunks = session.exec(
+            select(DocumentChunk)
+            .join(DocumentSource, DocumentChunk.source_id == DocumentSource.id)
+            .where(DocumentSource.is_deleted == False, col(DocumentChunk.text).ilike(f"%{query}%"))
+            .limit(limit * 5)
+        ).all()
+        rows = [(chunk.source_id, _fallback_snippet(chunk.text, query)) for chunk in chunks]
+
+    snippets: dict[int, str] = {}
+    for source_id, snippet in rows:
+        snippets.setdefault(source_id, snippet)
+    source_ids = list(snippets)[:limit]
+    by_id = {
+        source.id: source
+        for source in session.exec(select(DocumentSource).where(col(DocumentSource.id).in_(source_ids)))
+    }
+    return [(by_id[source_id], snippets[source_id]) for source_id in source_ids if source_id in by_id]
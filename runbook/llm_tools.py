@@ -1,13 +1,45 @@
+import asyncio
+import hashlib
+import json
 import os
-from enum import Enum
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque
+from collections.abc import AsyncIterator, Awaitable, Callable, Iterator
+from contextlib import asynccontextmanager, suppress
+from dataclasses import dataclass, field
+from datetime import datetime
+from enum import Enum, IntEnum
+from functools import partial
+from pathlib import Path
+from typing import TypeVar
 
+import httpx
 import ollama
 
 from runbook.db_models import ChatInteraction
 from runbook.rag_tools import prompt
+from runbook.rag_tools.prompt import (
+    rag_chat_system_prompt,
+    rag_context_template,
+    rag_history_summary_prompt,
+    rag_history_summary_template,
+    rag_runbook_prompt,
+)
+from runbook.utils import estimate_tokens, truncate_tokens
 
 AI_MODEL: str = "UNKNOWN"
 
+T = TypeVar("T")
+
+# streamed answers are pushed to the browser in batches, see coalesce_deltas
+STREAM_FLUSH_INTERVAL: float = 0.05  # seconds
+STREAM_FLUSH_CHARS: int = 200
+STREAM_SETTLE_CHARS: int = 1000
+
+DEFAULT_KEEP_WARM_HOURS: str = "8-18"
+
 # redefinitions
 
 
@@ -15,14 +47,64 @@ def chat(*args, **kwargs) -> ollama.ChatResponse:
     return ollama.chat(*args, **kwargs)
 
 
+def _keep_alive(value: str) -> str | float:
+    # ollama takes a duration ("30m") or seconds, a negative number keeps the model loaded indefinitely
+    try:
+        return float(value)
+    except ValueError:
+        return value
+
+
 class LLMConfig:
     ai_provider = os.environ.get("AI_PROVIDER", "ollama")
     ai_provider_api_key = os.environ.get("AI_PROVIDER_API_KEY", "ollama")
     ai_provider_url = os.environ.get("AI_PROVIDER_URL", "http://localhost:11434/v1")
+    # several hosts serving the same models, comma separated, requests are spread over them (see AsyncLLMPool)
+    ai_provider_urls = [url.strip() for url in os.environ.get("AI_PROVIDER_URLS", ai_provider_url).split(",")]
+    ai_provider_urls = [url for url in ai_provider_urls if url]
+    # seconds before an endpoint that failed is tried again
+    ai_health_check_interval = float(os.environ.get("AI_HEALTH_CHECK_INTERVAL", 30))
 
     # other
     ai_model = os.environ.get("AI_MODEL", "llama3.2-vision:11b")  # ollama default
 
+    # embeddings for document retrieval, "hash" is a deterministic local embedder (no server needed)
+    ai_embed_provider = os.environ.get("AI_EMBED_PROVIDER", "ollama")
+    ai_embed_model = os.environ.get("AI_EMBED_MODEL", "nomic-embed-text")
+
+    # seconds, a generation may legitimately take minutes but a dead server should fail fast
+    ai_request_timeout = float(os.environ.get("AI_REQUEST_TIMEOUT", 300))
+    ai_connect_timeout = float(os.environ.get("AI_CONNECT_TIMEOUT", 10))
+    # idle connections kept open per client, users take longer than httpx's default 5s between two prompts
+    ai_keepalive_connections = int(os.environ.get("AI_KEEPALIVE_CONNECTIONS", 20))
+    ai_keepalive_expiry = float(os.environ.get("AI_KEEPALIVE_EXPIRY", 120))
+
+    # the model's context window (sent as ollama `num_ctx` with every request), the prompt gets what is left after
+    # the answer's max_tokens. Chat turns older than the newest `ai_history_tokens` are folded into a rolling
+    # summary of the runbook
+    ai_context_tokens = int(os.environ.get("AI_CONTEXT_TOKENS", 8192))
+    ai_history_tokens = int(os.environ.get("AI_HISTORY_TOKENS", 2000))
+    ai_history_summary_words = int(os.environ.get("AI_HISTORY_SUMMARY_WORDS", 300))
+
+    # how long ollama keeps the model loaded after a request, loading it again takes tens of seconds
+    ai_keep_alive = _keep_alive(os.environ.get("AI_KEEP_ALIVE", "30m"))
+    # local hours ("8-18", "22-6" wraps midnight) in which the model is pinged every `ai_keep_warm_interval`
+    # seconds so it stays loaded through idle periods, empty to only warm it up at startup
+    ai_keep_warm_hours = os.environ.get("AI_KEEP_WARM_HOURS", DEFAULT_KEEP_WARM_HOURS)
+    ai_keep_warm_interval = float(os.environ.get("AI_KEEP_WARM_INTERVAL", 600))
+
+    # requests in flight to the model server at once, the rest wait in LLMScheduler's queue
+    ai_concurrency = int(os.environ.get("AI_CONCURRENCY", 4))
+
+    # exact match cache of model responses, see ResponseCache
+    ai_response_cache = os.environ.get("AI_RESPONSE_CACHE", "1") == "1"
+    ai_response_cache_path = os.environ.get("AI_RESPONSE_CACHE_PATH", "./saved/llm_cache.sqlite3")
+    ai_response_cache_max_bytes = int(os.environ.get("AI_RESPONSE_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+
+    # chunked document conversion, see rag_tools.rag_mapreduce
+    ai_parse_chunk_tokens = int(os.environ.get("AI_PARSE_CHUNK_TOKENS", 2000))
+    ai_parse_concurrency = int(os.environ.get("AI_PARSE_CONCURRENCY", 4))
+
     ai_model_chat_completion_kwargs = {
         # ignore these but keeping as they were on original
         # "top_k": 50
@@ -40,8 +122,456 @@ class ResponseType(Enum):
     FULL = "full"
 
 
+def ollama_host(url: str | None) -> str | None:
+    # LLMConfig urls point at the openai compatible `/v1` path, ollama's native api lives at the root
+    if url and url.rstrip("/").endswith("/v1"):
+        return url.rstrip("/")[: -len("/v1")]
+    return url
+
+
+def _http_limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_keepalive_connections=LLMConfig.ai_keepalive_connections,
+        keepalive_expiry=LLMConfig.ai_keepalive_expiry,
+    )
+
+
+def _ollama_messages(messages: list[dict]) -> list[dict]:
+    # ollama wants plain string content, flatten openai style `[{"type": "text", "text": ...}]` parts
+    def _text(content) -> str:
+        if isinstance(content, list):
+            return "".join(part.get("text", "") for part in content)
+        return content
+
+    return [{**message, "content": _text(message["content"])} for message in messages]
+
+
+def _ollama_options(kwargs: dict) -> dict:
+    # ollama's default context is much smaller than the prompt budget, it would silently cut the start of the
+    # prompt, so the context window is always sent (a loaded model is also reloaded when num_ctx changes)
+    renamed = {"max_tokens": "num_predict", "repetition_penalty": "repeat_penalty", "truncate": "num_ctx"}
+    return {"num_ctx": LLMConfig.ai_context_tokens, **{renamed.get(key, key): value for key, value in kwargs.items()}}
+
+
+def response_cache_key(provider: str, model: str, messages: list[dict], kwargs: dict) -> str:
+    """Content hash of everything that determines a response, message content parts are flattened first."""
+    payload = {"provider": provider, "model": model, "messages": _ollama_messages(messages), "kwargs": kwargs}
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class ResponseCache:
+    """Exact match cache of model responses in a SQLite file, evicting least recently used beyond `max_bytes`.
+
+    Only the response text is stored, a cached streamed response is replayed as a single chunk. The total size
+    is read once when the file is opened and kept up to date from there. Hits only note the access time in
+    memory, they are written `touch_batch` at a time or before evicting, so reads don't write.
+    """
+
+    def __init__(self, path: str | Path, max_bytes: int = LLMConfig.ai_response_cache_max_bytes, touch_batch: int = 64):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.touch_batch = touch_batch
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._touched: dict[str, float] = {}
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # chat completions run in worker threads, a single connection is shared under the lock
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS response "
+            "(key TEXT PRIMARY KEY, content TEXT NOT NULL, size INTEGER NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS response_accessed_at ON response (accessed_at)")
+        (self._total,) = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM response").fetchone()
+
+    @property
+    def stats(self) -> dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses}
+
+    @property
+    def total_bytes(self) -> int:
+        return self._total
+
+    def get(self, key: str) -> str | None:
+        with self._lock:
+            row = self._conn.execute("SELECT content FROM response WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._touched[key] = time.time()
+            if len(self._touched) >= self.touch_batch:
+                self._flush_touched()
+            self.hits += 1
+            return row[0]
+
+    def put(self, key: str, content: str) -> None:
+        size = len(content.encode())
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                row = self._conn.execute("SELECT size FROM response WHERE key = ?", (key,)).fetchone()
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO response (key, content, size, accessed_at) VALUES (?, ?, ?, ?)",
+                    (key, content, size, time.time()),
+                )
+                self._touched.pop(key, None)
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._total += size - (row[0] if row else 0)
+            if self._total > self.max_bytes:
+                # least recently used has to account for the hits not written yet
+                self._flush_touched()
+                self._evict(self._total - self.max_bytes)
+
+    def _flush_touched(self) -> None:
+        if self._touched:
+            self._conn.execute("BEGIN")
+            self._conn.executemany(
+                "UPDATE response SET accessed_at = ? WHERE key = ?",
+                [(accessed_at, key) for key, accessed_at in self._touched.items()],
+            )
+            self._conn.execute("COMMIT")
+            self._touched.clear()
+
+    def _evict(self, excess: int) -> None:
+        stale = []
+        for key, size in self._conn.execute("SELECT key, size FROM response ORDER BY accessed_at"):
+            if excess <= 0:
+                break
+            stale.append((key,))
+            excess -= size
+            self._total -= size
+        self._conn.executemany("DELETE FROM response WHERE key = ?", stale)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM response")
+            self._touched.clear()
+            self._total = 0
+
+
+_response_cache: ResponseCache | None = None
+
+
+def get_response_cache() -> ResponseCache:
+    global _response_cache
+    if _response_cache is None:
+        _response_cache = ResponseCache(LLMConfig.ai_response_cache_path)
+    return _response_cache
+
+
+def _cached_response(model: str, content: str) -> ollama.ChatResponse:
+    return ollama.ChatResponse(model=model, message=ollama.Message(role="assistant", content=content), done=True)
+
+
 class LLMClient(ollama.Client):
-    # all of these sdk's are annoying/problematic af
+    # all of these sdk's are annoying/problematic af, keep the openai style `chat_completion` used around the
+    # app and translate it onto ollama's native chat api
+
+    def __init__(self, base_url: str | None = None, api_key: str | None = None, **kwargs):
+        headers = {"Authorization": f"Bearer {api_key}"} if api_key else None
+        kwargs.setdefault("limits", _http_limits())
+        super().__init__(host=ollama_host(base_url), headers=headers, **kwargs)
+
+    def chat_completion(self, model: str, messages: list[dict], stream: bool = False, cache: bool = True, **kwargs):
+        """Chat completion, served from the response cache if the same request was completed before.
+
+        Args:
+            model: Model name
+            messages: Openai style messages
+            stream: Return an iterator of response chunks instead of one response
+            cache: Set False to always call the model, the new response still replaces the cached one
+            **kwargs: Generation options (temperature, max_tokens, ...)
+        """
+        response_cache = get_response_cache() if LLMConfig.ai_response_cache else None
+        key = response_cache_key(str(self._client.base_url), model, messages, kwargs)
+        if cache and response_cache and (content := response_cache.get(key)) is not None:
+            cached = _cached_response(model, content)
+            return iter([cached]) if stream else cached
+
+        resp = self.chat(
+            model=model,
+            messages=_ollama_messages(messages),
+            stream=stream,
+            options=_ollama_options(kwargs),
+            keep_alive=LLMConfig.ai_keep_alive,
+        )
+        if response_cache is None:
+            return resp
+        if stream:
+            return self._record_stream(resp, response_cache, key)
+
+        response_cache.put(key, get_content_ollama_api(resp))
+        return resp
+
+    @staticmethod
+    def _record_stream(
+        resp: Iterator[ollama.ChatResponse], response_cache: ResponseCache, key: str
+    ) -> Iterator[ollama.ChatResponse]:
+        # only a stream that ran to completion is cached, not one that failed or was abandoned half way
+        parts = []
+        for item in resp:
+            parts.append(get_content_ollama_api(item))
+            yield item
+        response_cache.put(key, "".join(parts))
+
+
+class AsyncLLMClient(ollama.AsyncClient):
+    """Async counterpart of LLMClient for the chat, requests and streams don't block the event loop.
+
+    The httpx connection pool is reused across requests, keep one instance around rather than one per call.
+    Cancelling the awaiting task (or closing a stream early) closes the underlying response.
+    """
+
+    def __init__(
+        self,
+        base_url: str | None = None,
+        api_key: str | None = None,
+        timeout: float = LLMConfig.ai_request_timeout,
+        **kwargs,
+    ):
+        headers = {"Authorization": f"Bearer {api_key}"} if api_key else None
+        kwargs.setdefault("limits", _http_limits())
+        super().__init__(
+            host=ollama_host(base_url),
+            headers=headers,
+            timeout=httpx.Timeout(timeout, connect=LLMConfig.ai_connect_timeout),
+            **kwargs,
+        )
+        # part of the response cache key, pooled endpoints serving the same models share it
+        self.cache_scope = str(self._client.base_url)
+
+    async def ping(self) -> None:
+        """Raise if the server can't be reached, cheap enough for health checks."""
+        resp = await self._client.get("/api/version", timeout=LLMConfig.ai_connect_timeout)
+        resp.raise_for_status()
+
+    async def warm_up(self, model: str, keep_alive: str | float = LLMConfig.ai_keep_alive) -> float:
+        """Load `model` into memory (ollama loads on a chat request without messages).
+
+        Returns:
+            The seconds it took, the model load time if it wasn't loaded yet
+        """
+        start = time.perf_counter()
+        await self.chat(model=model, messages=[], keep_alive=keep_alive, options=_ollama_options({}))
+        return time.perf_counter() - start
+
+    async def chat_completion(
+        self, model: str, messages: list[dict], stream: bool = False, cache: bool = True, **kwargs
+    ) -> ollama.ChatResponse | AsyncIterator[ollama.ChatResponse]:
+        """Chat completion, see `LLMClient.chat_completion`. A stream is consumed with `async for`."""
+        response_cache = get_response_cache() if LLMConfig.ai_response_cache else None
+        key = response_cache_key(self.cache_scope, model, messages, kwargs)
+        if cache and response_cache and (content := await asyncio.to_thread(response_cache.get, key)) is not None:
+            cached = _cached_response(model, content)
+            return self._replay(cached) if stream else cached
+
+        resp = await self.chat(
+            model=model,
+            messages=_ollama_messages(messages),
+            stream=stream,
+            options=_ollama_options(kwargs),
+            keep_alive=LLMConfig.ai_keep_alive,
+        )
+        if response_cache is None:
+            return resp
+        if stream:
+            return self._record_stream(resp, response_cache, key)
+
+        await asyncio.to_thread(response_cache.put, key, get_content_ollama_api(resp))
+        return resp
+
+    @staticmethod
+    async def _replay(cached: ollama.ChatResponse) -> AsyncIterator[ollama.ChatResponse]:
+        yield cached
+
+    @staticmethod
+    async def _record_stream(
+        resp: AsyncIterator[ollama.ChatResponse], response_cache: ResponseCache, key: str
+    ) -> AsyncIterator[ollama.ChatResponse]:
+        parts = []
+        try:
+            async for item in resp:
+                parts.append(get_content_ollama_api(item))
+                yield item
+        finally:
+            # closing early (cancel/stop) has to reach ollama's generator to release the http response
+            await resp.aclose()
+        await asyncio.to_thread(response_cache.put, key, "".join(parts))
+
+
+def _is_unreachable(err: BaseException) -> bool:
+    # worth retrying on another endpoint: nothing was generated, the server is down or refuses more work
+    if isinstance(err, ollama.ResponseError):
+        return err.status_code == 503
+    return isinstance(err, (ConnectionError, httpx.ConnectError, httpx.ConnectTimeout))
+
+
+@dataclass
+class EndpointStats:
+    """Load and health of one pooled endpoint, latency is the time to the first response item in seconds."""
+
+    window: int = 100
+    in_flight: int = 0
+    requests: int = 0
+    errors: int = 0
+    healthy: bool = True
+    failed_at: float = 0.0
+    last_error: str = ""
+    latencies: deque[float] = field(default_factory=deque)
+
+    @property
+    def mean_latency(self) -> float:
+        return sum(self.latencies) / len(self.latencies) if self.latencies else 0.0
+
+    def succeeded(self, seconds: float) -> None:
+        self.requests += 1
+        self.healthy = True
+        self.latencies.append(seconds)
+        if len(self.latencies) > self.window:
+            self.latencies.popleft()
+
+    def failed(self, err: BaseException, now: float) -> None:
+        self.errors += 1
+        self.last_error = str(err)
+        self.healthy = False
+        self.failed_at = now
+
+    def as_dict(self) -> dict[str, float | str]:
+        return {
+            "in_flight": self.in_flight,
+            "requests": self.requests,
+            "errors": self.errors,
+            "healthy": self.healthy,
+            "mean_latency": self.mean_latency,
+            "last_error": self.last_error,
+        }
+
+
+@dataclass(eq=False)
+class PoolEndpoint:
+    url: str
+    client: AsyncLLMClient
+    stats: EndpointStats = field(default_factory=EndpointStats)
+
+
+class AsyncLLMPool:
+    """AsyncLLMClient spread over several hosts serving the same models, with the same `chat_completion`.
+
+    Each request goes to the healthy endpoint with the fewest requests in flight (the faster one on a tie). An
+    endpoint that can't be reached is marked unhealthy and the request is retried on the next one, the
+    endpoint is only tried again `health_check_interval` seconds later (or after `check_health`). When every
+    endpoint is marked unhealthy they are all tried anyway, rather than failing without asking.
+    """
+
+    def __init__(
+        self,
+        urls: list[str],
+        api_key: str | None = None,
+        health_check_interval: float = LLMConfig.ai_health_check_interval,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        if not urls:
+            raise ValueError("AsyncLLMPool needs at least one endpoint url")
+        self.health_check_interval = health_check_interval
+        self._clock = clock
+        self.endpoints = [PoolEndpoint(url, AsyncLLMClient(base_url=url, api_key=api_key)) for url in urls]
+        cache_scope = ",".join(sorted(endpoint.client.cache_scope for endpoint in self.endpoints))
+        for endpoint in self.endpoints:
+            endpoint.client.cache_scope = cache_scope
+
+    @property
+    def stats(self) -> dict[str, dict[str, float | str]]:
+        return {endpoint.url: endpoint.stats.as_dict() for endpoint in self.endpoints}
+
+    def _pick(self, tried: set[PoolEndpoint]) -> PoolEndpoint | None:
+        untried = [endpoint for endpoint in self.endpoints if endpoint not in tried]
+        now = self._clock()
+        available = [
+            endpoint
+            for endpoint in untried
+            if endpoint.stats.healthy or now - endpoint.stats.failed_at >= self.health_check_interval
+        ]
+        return min(
+            available or untried,
+            key=lambda endpoint: (endpoint.stats.in_flight, endpoint.stats.mean_latency),
+            default=None,
+        )
+
+    async def check_health(self) -> dict[str, bool]:
+        """Ping every endpoint, updating whether it is healthy."""
+
+        async def probe(endpoint: PoolEndpoint) -> None:
+            try:
+                await endpoint.client.ping()
+                endpoint.stats.healthy = True
+            except Exception as err:
+                endpoint.stats.failed(err, self._clock())
+
+        await asyncio.gather(*(probe(endpoint) for endpoint in self.endpoints))
+        return {endpoint.url: endpoint.stats.healthy for endpoint in self.endpoints}
+
+    async def chat_completion(
+        self, model: str, messages: list[dict], stream: bool = False, cache: bool = True, **kwargs
+    ) -> ollama.ChatResponse | AsyncIterator[ollama.ChatResponse]:
+        """Chat completion on the least busy endpoint, see `LLMClient.chat_completion`.
+
+        A stream fails over until its first chunk arrived, an endpoint going down half way through an answer
+        is an error like with a single client since the partial answer can't be continued elsewhere.
+
+        Raises:
+            ConnectionError: If no endpoint could be reached
+        """
+        tried: set[PoolEndpoint] = set()
+        while endpoint := self._pick(tried):
+            tried.add(endpoint)
+            endpoint.stats.in_flight += 1
+            start = time.perf_counter()
+            try:
+                resp = await endpoint.client.chat_completion(model, messages, stream=stream, cache=cache, **kwargs)
+                first = await anext(resp, None) if stream else None
+            except Exception as err:
+                endpoint.stats.in_flight -= 1
+                if not _is_unreachable(err):
+                    endpoint.stats.errors += 1
+                    endpoint.stats.last_error = str(err)
+                    raise
+                endpoint.stats.failed(err, self._clock())
+                print(f"LLM endpoint {endpoint.url} unreachable, failing over: {err}")
+                continue
+            except BaseException:
+                endpoint.stats.in_flight -= 1
+                raise
+
+            endpoint.stats.succeeded(time.perf_counter() - start)
+            if not stream:
+                endpoint.stats.in_flight -= 1
+                return resp
+            return self._track_stream(first, resp, endpoint.stats)
+
+        raise ConnectionError(f"no LLM endpoint reachable: {', '.join(endpoint.url for endpoint in tried)}")
+
+    @staticmethod
+    async def _track_stream(
+        first: ollama.ChatResponse | None, resp: AsyncIterator[ollama.ChatResponse], stats: EndpointStats
+    ) -> AsyncIterator[ollama.ChatResponse]:
+        # the endpoint counts as busy until the stream ends or is closed
+        try:
+            if first is not None:
+                yield first
+                async for item in resp:
+                    yield item
+        except Exception as err:
+            stats.errors += 1
+            stats.last_error = str(err)
+            raise
+        finally:
+            stats.in_flight -= 1
+            await resp.aclose()
 
 
 def _fix_chat_completion_kwargs_openai(kwargs: dict) -> dict:
@@ -58,7 +588,57 @@ def _fix_chat_completion_kwargs_openai(kwargs: dict) -> dict:
 _non_ollama_error = "Only using Ollama for now due to issues with Together"
 
 
-def get_ai_client(ai_provider="ollama", ai_provider_url=None, ai_provider_api_key=None) -> LLMClient:
+class ClientRegistry:
+    """Process wide LLM clients, built on first use and shared by every session and background event.
+
+    Clients are keyed by (provider, url, api key), so their keep-alive connections are reused across sessions
+    instead of each one opening its own. Async clients are kept per event loop since their connections belong
+    to the loop they were opened on, entries of closed loops are dropped.
+
+    Clients are safe to share: httpx pools are thread and task safe, and LLMClient/AsyncLLMClient keep no per
+    request state.
+    """
+
+    def __init__(self):
+        self.created = 0
+        self.reused = 0
+        self._lock = threading.Lock()
+        self._clients: dict[tuple, LLMClient | AsyncLLMClient | AsyncLLMPool] = {}
+
+    def __len__(self) -> int:
+        return len(self._clients)
+
+    def get(self, key: tuple, factory: Callable[[], T], loop: asyncio.AbstractEventLoop | None = None) -> T:
+        # construction does no I/O, building under the lock guarantees a single client per key
+        with self._lock:
+            if (client := self._clients.get((loop, *key))) is not None:
+                self.reused += 1
+                return client
+            self._clients = {k: c for k, c in self._clients.items() if k[0] is None or not k[0].is_closed()}
+            client = self._clients[(loop, *key)] = factory()
+            self.created += 1
+            return client
+
+    def clear(self) -> None:
+        with self._lock:
+            self._clients.clear()
+
+
+_client_registry = ClientRegistry()
+
+
+def get_client_registry() -> ClientRegistry:
+    return _client_registry
+
+
+def _running_loop() -> asyncio.AbstractEventLoop | None:
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+
+
+def _new_ai_client(ai_provider: str, ai_provider_url: str | None, ai_provider_api_key: str | None) -> LLMClient:
     match ai_provider:
         case "ollama":
             return LLMClient(base_url=ai_provider_url, api_key=ai_provider_api_key)
@@ -68,6 +648,119 @@ def get_ai_client(ai_provider="ollama", ai_provider_url=None, ai_provider_api_ke
             raise NotImplementedError(_non_ollama_error)
 
 
+def _new_async_ai_client(
+    ai_provider: str, ai_provider_urls: tuple[str | None, ...], ai_provider_api_key: str | None
+) -> AsyncLLMClient | AsyncLLMPool:
+    match ai_provider:
+        case "ollama":
+            if len(ai_provider_urls) > 1:
+                return AsyncLLMPool(list(ai_provider_urls), api_key=ai_provider_api_key)
+            return AsyncLLMClient(base_url=ai_provider_urls[0], api_key=ai_provider_api_key)
+        case "openai":
+            return AsyncLLMClient(api_key=ai_provider_api_key)
+        case _:
+            raise NotImplementedError(_non_ollama_error)
+
+
+def get_ai_client(ai_provider="ollama", ai_provider_url=None, ai_provider_api_key=None) -> LLMClient:
+    """The shared client for this provider, url and key, see ClientRegistry."""
+    key = ("sync", ai_provider, ai_provider_url, ai_provider_api_key)
+    return _client_registry.get(key, partial(_new_ai_client, ai_provider, ai_provider_url, ai_provider_api_key))
+
+
+def get_async_ai_client(
+    ai_provider="ollama", ai_provider_url=None, ai_provider_api_key=None, ai_provider_urls: list[str] | None = None
+) -> AsyncLLMClient | AsyncLLMPool:
+    """The shared client for `ai_provider_url`, or a pool over `ai_provider_urls` when more than one is given.
+
+    Call it from the event loop the client will be used on, see ClientRegistry.
+    """
+    urls = tuple(ai_provider_urls) if ai_provider_urls and len(ai_provider_urls) > 1 else (ai_provider_url,)
+    key = ("async", ai_provider, urls, ai_provider_api_key)
+    return _client_registry.get(
+        key, partial(_new_async_ai_client, ai_provider, urls, ai_provider_api_key), loop=_running_loop()
+    )
+
+
+def keep_warm_hours(spec: str = LLMConfig.ai_keep_warm_hours) -> tuple[int, int] | None:
+    """Parse an `AI_KEEP_WARM_HOURS` range like "8-18", None if empty.
+
+    A malformed range is logged and the default used instead, it must not end the keep warm task.
+    """
+    if not spec.strip():
+        return None
+    try:
+        start, end = (int(hour) for hour in spec.split("-"))
+        if not (0 <= start <= 24 and 0 <= end <= 24):
+            raise ValueError("hours must be between 0 and 24")
+    except ValueError as err:
+        print(f"invalid AI_KEEP_WARM_HOURS {spec!r} ({err}), using {DEFAULT_KEEP_WARM_HOURS!r}")
+        return keep_warm_hours(DEFAULT_KEEP_WARM_HOURS)
+    return start, end
+
+
+def in_hours(hour: int, hours: tuple[int, int] | None) -> bool:
+    if hours is None:
+        return False
+    start, end = hours
+    return start <= hour < end if start <= end else hour >= start or hour < end
+
+
+async def keep_model_warm(model: str | None = None) -> None:
+    """Warm the chat model up at startup, then keep it loaded during `AI_KEEP_WARM_HOURS`, on every endpoint.
+
+    Runs until cancelled, registered as an app lifespan task. Only applies to ollama.
+    """
+    if LLMConfig.ai_provider != "ollama":
+        return
+    model = model or LLMConfig.ai_model
+    hours = keep_warm_hours()
+    startup = True
+    while True:
+        if startup or in_hours(datetime.now().hour, hours):
+            client = get_async_ai_client(
+                ai_provider=LLMConfig.ai_provider,
+                ai_provider_url=LLMConfig.ai_provider_url,
+                ai_provider_api_key=LLMConfig.ai_provider_api_key,
+                ai_provider_urls=LLMConfig.ai_provider_urls,
+            )
+            if isinstance(client, AsyncLLMPool):
+                clients = {endpoint.url: endpoint.client for endpoint in client.endpoints}
+            else:
+                clients = {LLMConfig.ai_provider_url: client}
+            results = await asyncio.gather(*(c.warm_up(model) for c in clients.values()), return_exceptions=True)
+            for url, result in zip(clients, results):
+                if isinstance(result, BaseException):
+                    print(f"warming up {model} on {url} failed: {result}")
+                elif startup:
+                    print(f"warmed up {model} on {url} in {result:.2f}s")
+        startup = False
+        await asyncio.sleep(LLMConfig.ai_keep_warm_interval)
+
+
+async def monitor_endpoints() -> None:
+    """Check the health of every pooled endpoint each `AI_HEALTH_CHECK_INTERVAL` seconds.
+
+    Runs until cancelled, registered as an app lifespan task. Without it an endpoint marked unhealthy is only
+    noticed back when a request tries it again, and one that went down only when a request fails on it. Does
+    nothing with a single endpoint.
+    """
+    if LLMConfig.ai_provider != "ollama" or len(LLMConfig.ai_provider_urls) < 2:
+        return
+    while True:
+        client = get_async_ai_client(
+            ai_provider=LLMConfig.ai_provider,
+            ai_provider_url=LLMConfig.ai_provider_url,
+            ai_provider_api_key=LLMConfig.ai_provider_api_key,
+            ai_provider_urls=LLMConfig.ai_provider_urls,
+        )
+        before = {endpoint.url: endpoint.stats.healthy for endpoint in client.endpoints}
+        for url, healthy in (await client.check_health()).items():
+            if healthy != before[url]:
+                print(f"endpoint {url} is {'back up' if healthy else 'down'}")
+        await asyncio.sleep(LLMConfig.ai_health_check_interval)
+
+
 def get_ai_model(ai_provider: str = "ollama") -> str:
     match ai_provider:
         case "ollama":
@@ -79,12 +772,202 @@ def get_ai_model(ai_provider: str = "ollama") -> str:
     return model_name
 
 
+class Priority(IntEnum):
+    """Scheduling class of a model request, lower is served first."""
+
+    INTERACTIVE = 0  # chat answers a user is waiting for
+    BACKGROUND = 1  # document conversion, history summaries
+
+
+@dataclass(eq=False)
+class _Ticket:
+    user: str
+    priority: Priority
+    enqueued_at: float
+    granted: asyncio.Future
+
+
+@dataclass
+class SchedulerMetrics:
+    """Queue wait and request latency of the last `window` requests, in seconds."""
+
+    window: int = 1000
+    requests: int = 0
+    waits: deque[float] = field(default_factory=deque)
+    latencies: deque[float] = field(default_factory=deque)
+
+    def record(self, samples: deque[float], seconds: float) -> None:
+        samples.append(seconds)
+        if len(samples) > self.window:
+            samples.popleft()
+
+    def as_dict(self) -> dict[str, float]:
+        def quantiles(samples: deque[float]) -> tuple[float, float]:
+            if not samples:
+                return 0.0, 0.0
+            ordered = sorted(samples)
+            return ordered[len(ordered) // 2], ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+        wait_p50, wait_p95 = quantiles(self.waits)
+        latency_p50, latency_p95 = quantiles(self.latencies)
+        return {
+            "requests": self.requests,
+            "wait_p50": wait_p50,
+            "wait_p95": wait_p95,
+            "latency_p50": latency_p50,
+            "latency_p95": latency_p95,
+        }
+
+
+class LLMScheduler:
+    """Process wide admission control for model requests.
+
+    At most `concurrency` requests run at once. Waiting requests are served by priority, and within a priority
+    round robin across users, so one user converting a large document (many chunk requests) or clicking
+    generate repeatedly doesn't starve everyone else.
+
+    Usage:
+        async with get_scheduler().slot(user, Priority.INTERACTIVE, on_wait=show_position):
+            resp = await client.chat_completion(...)
+    """
+
+    def __init__(self, concurrency: int = LLMConfig.ai_concurrency):
+        self.concurrency = concurrency
+        self.metrics = SchedulerMetrics()
+        self._running = 0
+        # per priority, the waiting tickets of each user, users in round robin order
+        self._queues: dict[Priority, OrderedDict[str, deque[_Ticket]]] = {p: OrderedDict() for p in Priority}
+        self._changed = asyncio.Event()
+
+    @property
+    def running(self) -> int:
+        return self._running
+
+    @property
+    def waiting(self) -> int:
+        return sum(len(tickets) for queues in self._queues.values() for tickets in queues.values())
+
+    def _dispatch_order(self) -> Iterator[_Ticket]:
+        for priority in sorted(Priority):
+            queues = [list(tickets) for tickets in self._queues[priority].values()]
+            for rank in range(max(map(len, queues), default=0)):
+                yield from (tickets[rank] for tickets in queues if rank < len(tickets))
+
+    def position(self, ticket: _Ticket) -> int:
+        """1 for the next request to be served, 0 once it is running."""
+        for position, queued in enumerate(self._dispatch_order(), start=1):
+            if queued is ticket:
+                return position
+        return 0
+
+    def _notify(self) -> None:
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def _dequeue(self, ticket: _Ticket) -> None:
+        queues = self._queues[ticket.priority]
+        if tickets := queues.get(ticket.user):
+            if ticket in tickets:
+                tickets.remove(ticket)
+            if not tickets:
+                del queues[ticket.user]
+
+    def _grant(self) -> None:
+        while self._running < self.concurrency:
+            priority = next((p for p in sorted(Priority) if self._queues[p]), None)
+            if priority is None:
+                break
+            queues = self._queues[priority]
+            user, tickets = next(iter(queues.items()))
+            ticket = tickets.popleft()
+            # the user goes to the back of the round, or leaves it
+            if tickets:
+                queues.move_to_end(user)
+            else:
+                del queues[user]
+            if ticket.granted.done():  # cancelled while waiting
+                continue
+            self._running += 1
+            self.metrics.record(self.metrics.waits, time.perf_counter() - ticket.enqueued_at)
+            ticket.granted.set_result(None)
+        self._notify()
+
+    async def _wait(self, ticket: _Ticket, on_wait: Callable[[int], Awaitable[None]] | None) -> None:
+        reported = None
+        while not ticket.granted.done():
+            if on_wait and (position := self.position(ticket)) != reported:
+                reported = position
+                await on_wait(position)
+            changed = asyncio.ensure_future(self._changed.wait())
+            try:
+                await asyncio.wait({ticket.granted, changed}, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                changed.cancel()
+
+    @asynccontextmanager
+    async def slot(
+        self,
+        user: str,
+        priority: Priority = Priority.INTERACTIVE,
+        on_wait: Callable[[int], Awaitable[None]] | None = None,
+    ):
+        """Wait for a free slot, holding it for the duration of the block.
+
+        Args:
+            user: Who the request is for, requests are shared fairly between users
+            priority: Scheduling class of the request
+            on_wait: Called with the queue position (1 is next) whenever it changes while waiting
+        """
+        ticket = _Ticket(user, priority, time.perf_counter(), asyncio.get_running_loop().create_future())
+        self._queues[priority].setdefault(user, deque()).append(ticket)
+        self._grant()
+        try:
+            await self._wait(ticket, on_wait)
+        except BaseException:
+            # cancelled (e.g. the user stopped the answer) while queued, or right as the slot was granted
+            if ticket.granted.done() and not ticket.granted.cancelled():
+                self._release()
+            else:
+                ticket.granted.cancel()
+                self._dequeue(ticket)
+                self._notify()
+            raise
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.metrics.requests += 1
+            self.metrics.record(self.metrics.latencies, time.perf_counter() - start)
+            self._release()
+
+    def _release(self) -> None:
+        self._running -= 1
+        self._grant()
+
+
+_scheduler: LLMScheduler | None = None
+
+
+def get_scheduler() -> LLMScheduler:
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = LLMScheduler()
+    return _scheduler
+
+
 def _create_messages(
     chat_interactions: list[ChatInteraction],
     prompt: str,
     system_prompt: str,
+    summary: str = "",
 ):
+    # ordered from the most to the least stable, so consecutive requests share the longest possible prefix and
+    # the inference server can reuse its cache for it: instructions, history summary, turns, the new prompt
     messages = [{"role": "system", "content": [{"type": "text", "text": system_prompt}]}]
+    if summary:
+        summary_prompt = rag_history_summary_template.format(summary=summary)
+        messages.append({"role": "system", "content": [{"type": "text", "text": summary_prompt}]})
     for chat_interaction in chat_interactions:
         messages.append({"role": "user", "content": [{"type": "text", "text": chat_interaction.prompt}]})
         messages.append({"role": "assistant", "content": [{"type": "text", "text": chat_interaction.answer}]})
@@ -93,25 +976,126 @@ def _create_messages(
     return messages
 
 
+def prompt_token_limit() -> int:
+    """Tokens available to the prompt, the context window minus what is reserved for the answer."""
+    return LLMConfig.ai_context_tokens - LLMConfig.ai_model_chat_completion_kwargs.get("max_tokens", 0)
+
+
+def count_prompt_tokens(messages: list[dict]) -> int:
+    """Estimated prompt tokens of messages, see `utils.estimate_tokens`."""
+    return sum(estimate_tokens(message["content"]) for message in _ollama_messages(messages))
+
+
+def _turn_tokens(chat_interaction: ChatInteraction) -> int:
+    return estimate_tokens(chat_interaction.prompt) + estimate_tokens(chat_interaction.answer)
+
+
+def history_overflow(chat_interactions: list[ChatInteraction], budget_tokens: int) -> int:
+    """The number of oldest turns that don't fit in `budget_tokens` when the newest turns are kept."""
+    used = 0
+    for i in range(len(chat_interactions) - 1, -1, -1):
+        used += _turn_tokens(chat_interactions[i])
+        if used > budget_tokens:
+            return i + 1
+    return 0
+
+
 def create_messages_for_chat_completion(
     chat_interactions: list[ChatInteraction],
     prompt: str,
+    context: str = "",
+    summary: str = "",
+    summarized_turns: int = 0,
+    max_prompt_tokens: int | None = None,
 ) -> list[dict[str, str | list[dict[str, str]]]]:
     """
     Create a list of messages for chat completion based on chat interactions and a new prompt.
 
+    The first prompt of a runbook uses the runbook generation instructions, follow ups are answered as chat.
+    The first `summarized_turns` interactions are sent as their summary, the rest verbatim as long as they fit
+    in the prompt budget, the oldest are dropped otherwise. If the prompt, excerpts and summary alone don't fit,
+    they are cut too: the summary first, then the excerpts, and as a last resort the end of the prompt.
+    Retrieved excerpts only go into the last message, everything before it is the same as in the previous
+    request of the runbook (until the summary is updated).
+
     Args:
         chat_interactions (list[ChatInteraction]): A list of previous chat interactions.
         prompt (str): The new prompt to be added to the messages.
+        context (str): Retrieved documentation excerpts for the prompt, see `rag_tools.retrieve_context`.
+        summary (str): Summary of the first `summarized_turns` chat interactions, see `Runbook.history_summary`.
+        summarized_turns (int): The number of chat interactions covered by the summary.
+        max_prompt_tokens (int | None): Prompt token budget, `prompt_token_limit()` by default.
 
     Returns:
         list[dict[str, str | list[dict[str, str]]]]: A list of messages formatted for chat completion.
     """
+    system_prompt = rag_chat_system_prompt if chat_interactions else rag_runbook_prompt
+
+    # budgeted from the most to the least needed, the instructions are always sent whole
+    available = (max_prompt_tokens or prompt_token_limit()) - estimate_tokens(system_prompt)
+    prompt = truncate_tokens(prompt, available)
+    available -= estimate_tokens(prompt)
+    if context:
+        available -= estimate_tokens(rag_context_template.format(context="", prompt=""))
+        context = truncate_tokens(context, available)
+        available -= estimate_tokens(context)
+    if summary:
+        available -= estimate_tokens(rag_history_summary_template.format(summary=""))
+        summary = truncate_tokens(summary, available)
+        available -= estimate_tokens(summary)
+
+    # only the latest prompt carries excerpts, earlier turns are kept as asked
+    final_prompt = rag_context_template.format(context=context, prompt=prompt) if context else prompt
+    recent = chat_interactions[summarized_turns:]
+    recent = recent[history_overflow(recent, available) :]
 
     messages = _create_messages(
-        chat_interactions=chat_interactions,
-        prompt=prompt,
-        system_prompt="You are a helpful assistant.",
+        chat_interactions=recent,
+        prompt=final_prompt,
+        system_prompt=system_prompt,
+        summary=summary,
+    )
+
+    return messages
+
+
+def history_fold_point(
+    chat_interactions: list[ChatInteraction], summarized_turns: int, budget_tokens: int | None = None
+) -> int:
+    """The number of oldest turns the summary should cover, `summarized_turns` while it is still current.
+
+    The summary is only updated once the verbatim turns outgrow `budget_tokens` (`ai_history_tokens` by
+    default) and then folds them down to half of it, so the summary and the first verbatim turn, i.e. the
+    prompt prefix the inference server can reuse, stay the same for several turns instead of changing on
+    every one.
+    """
+    budget_tokens = budget_tokens or LLMConfig.ai_history_tokens
+    if history_overflow(chat_interactions, budget_tokens) <= summarized_turns:
+        return summarized_turns
+    return max(summarized_turns, history_overflow(chat_interactions, budget_tokens // 2))
+
+
+def batch_turns(chat_interactions: list[ChatInteraction], budget_tokens: int) -> list[list[ChatInteraction]]:
+    """Split turns, oldest first, into consecutive batches that each fit `budget_tokens` (or are a single turn)."""
+    batches: list[list[ChatInteraction]] = []
+    used = 0
+    for chat_interaction in chat_interactions:
+        tokens = _turn_tokens(chat_interaction)
+        if not batches or used + tokens > budget_tokens:
+            batches.append([])
+            used = 0
+        batches[-1].append(chat_interaction)
+        used += tokens
+    return batches
+
+
+def create_history_summary_prompt(summary: str, chat_interactions: list[ChatInteraction]):
+    """Messages asking to fold `chat_interactions` into the running `summary` of a conversation."""
+    turns = "\n\n".join(f"User: {ci.prompt}\n\nAssistant: {ci.answer}" for ci in chat_interactions)
+    messages = _create_messages(
+        chat_interactions=[],
+        prompt=f"Current summary:\n{summary or '(empty)'}\n\nNew turns:\n\n{turns}",
+        system_prompt=rag_history_summary_prompt.format(max_words=LLMConfig.ai_history_summary_words),
     )
 
     return messages
@@ -127,6 +1111,16 @@ def create_html_parse_prompt(html_content: str, instructions: str = prompt.rag_h
     return messages
 
 
+def create_markdown_polish_prompt(markdown_content: str, instructions: str = prompt.rag_markdown_polish_prompt):
+    messages = _create_messages(
+        chat_interactions=[],
+        prompt=markdown_content,
+        system_prompt=instructions,
+    )
+
+    return messages
+
+
 def create_messages_for_runbook_completion(
     chat_interactions: list[ChatInteraction],
     prompt: str,
@@ -140,6 +1134,77 @@ def create_messages_for_runbook_completion(
     return messages
 
 
+async def coalesce_deltas(
+    deltas: AsyncIterator[str],
+    interval: float = STREAM_FLUSH_INTERVAL,
+    max_chars: int = STREAM_FLUSH_CHARS,
+    clock: Callable[[], float] = time.monotonic,
+) -> AsyncIterator[str]:
+    """Batch streamed text deltas, yielding what accumulated once `interval` seconds passed or `max_chars` piled up.
+
+    The window is checked as deltas arrive (models stream a token every few ms), the rest is yielded at the end.
+    Closing this generator closes `deltas` too.
+    """
+    buffer: list[str] = []
+    size = 0
+    last_flush = clock()
+    try:
+        async for delta in deltas:
+            buffer.append(delta)
+            size += len(delta)
+            if size >= max_chars or clock() - last_flush >= interval:
+                yield "".join(buffer)
+                buffer.clear()
+                size = 0
+                last_flush = clock()
+        if buffer:
+            yield "".join(buffer)
+    finally:
+        await deltas.aclose()
+
+
+def append_streamed(settled: str, tail: str, text: str, settle_chars: int = STREAM_SETTLE_CHARS) -> tuple[str, str]:
+    """Append `text` to an answer streamed to the browser as `settled + tail`, returning both parts.
+
+    Reflex sends a changed state var whole, so an answer kept in one var is sent again in full on every flush
+    (quadratic in its length). Flushes only change the short `tail`, which is moved into `settled` once it
+    reaches `settle_chars`: the long part is only sent every `settle_chars` and the browser joins the two.
+    """
+    tail += text
+    if len(tail) >= settle_chars:
+        return settled + tail, ""
+    return settled, tail
+
+
+async def until_stopped(stream: AsyncIterator[T], stop: asyncio.Event) -> AsyncIterator[T]:
+    """Yield from `stream` until `stop` is set, then close it, also while it is still waiting for its next item.
+
+    Closing (or cancelling) an ollama stream closes its HTTP response, which makes the server abort the generation.
+    """
+    stopped = asyncio.ensure_future(stop.wait())
+    try:
+        while True:
+            step = asyncio.ensure_future(anext(stream))
+            await asyncio.wait({step, stopped}, return_when=asyncio.FIRST_COMPLETED)
+            if not step.done():
+                step.cancel()
+                with suppress(asyncio.CancelledError, StopAsyncIteration):
+                    await step
+                return
+            try:
+                item = step.result()
+            except StopAsyncIteration:
+                return
+            yield item
+    finally:
+        stopped.cancel()
+        await stream.aclose()
+
+
+def get_content_ollama_api(resp: ollama.ChatResponse) -> str:
+    return resp.message.content or ""
+
+
 def stream_get_content_openai_api(item):
     if item.choices and item.choices[0] and item.choices[0].delta:
         answer_text = item.choices[0].delta.content
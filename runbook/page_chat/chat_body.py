@@ -6,6 +6,7 @@ import reflex as rx
 from runbook.components.dividers import chat_date_divider
 from runbook.components.typography import msg_header
 from runbook.db_models import ChatInteraction
+from runbook.page_chat.chat_state import ChatState
 from runbook.page_chat.style import LLMResponseStyle, UserMessageStyle
 from runbook.templates.action_bar import action_bar
 from runbook.templates.pop_up import dialog_library
@@ -52,7 +53,7 @@ def bot_response_buttons():
     )
 
 
-def message_wrapper(chat_interaction: ChatInteraction):
+def message_wrapper(chat_interaction: ChatInteraction, index: int):
     user_ava = rx.avatar(src=chat_interaction.chat_participant_user_name, **AvatarStyle)
     rb_ava = rx.avatar(src=chat_interaction.chat_participant_assistant_name, **AvatarStyle)
 
@@ -60,7 +61,16 @@ def message_wrapper(chat_interaction: ChatInteraction):
     rb_header = msg_header(chat_interaction.chat_participant_assistant_name, chat_interaction.timestamp)
 
     user_message = rx.markdown(chat_interaction.prompt, **MessageTextStyle)
-    rb_message = rx.markdown(chat_interaction.answer, **MessageTextStyle)
+    # while an answer streams in it is rendered from `streaming_answer` and `streaming_tail`, joined in the
+    # browser, see ChatState.submit_prompt
+    rb_message = rx.markdown(
+        rx.cond(
+            ChatState.streaming_position == index,
+            ChatState.streaming_answer + ChatState.streaming_tail,
+            chat_interaction.answer,
+        ),
+        **MessageTextStyle,
+    )
 
     return rx.box(
         # this component is related to the user input
@@ -1,6 +1,11 @@
+import asyncio
+import time
+from collections.abc import AsyncIterator, Awaitable, Callable
 from datetime import datetime
+from functools import partial
 from typing import Sequence
 
+import ollama
 import reflex as rx
 from reflex.utils import console
 
@@ -18,19 +23,42 @@ from runbook.db_ops import (
     get_runbook_chat_interactions,
     get_runbooks,
     save_chat_interaction,
+    search_chat_interactions,
+    search_documents,
+    update_runbook_history_summary,
 )
 from runbook.llm_tools import (
+    AsyncLLMClient,
+    AsyncLLMPool,
     LLMClient,
     LLMConfig,
+    Priority,
     ResponseType,
+    append_streamed,
+    batch_turns,
+    coalesce_deltas,
+    count_prompt_tokens,
+    create_history_summary_prompt,
     create_html_parse_prompt,
+    create_markdown_polish_prompt,
     create_messages_for_chat_completion,
     get_ai_client,
     get_ai_model,
+    get_async_ai_client,
+    get_content_ollama_api,
+    get_response_cache,
+    get_scheduler,
+    history_fold_point,
+    prompt_token_limit,
+    until_stopped,
 )
-from runbook.utils import is_dev_mode, proc_ctx
+from runbook.rag_tools.rag_db import save_parsed_content, update_document_meta
+from runbook.utils import is_dev_mode
 from rxconstants import INPUT_BOX_ID, SCROLL_DOWN_ON_LOAD, app_password, tz
 
+# stop signal of the answer each client is generating, set by ChatState.stop_generation
+_stop_events: dict[str, asyncio.Event] = {}
+
 
 class ChatState(rx.State):
     """The app state."""
@@ -40,8 +68,6 @@ class ChatState(rx.State):
     filter_str: str = ""
     document_markdown: str = ""
 
-    _ai_client_instance: LLMClient | None = None
-
     has_checked_database: bool = False
     stream_resp: bool = True
 
@@ -53,10 +79,34 @@ class ChatState(rx.State):
     # documents: dict[int, Document] = {}  # Maps DocumentSource.id to Document if it exists
     processing_document: bool = False
 
+    parsing_document_id: int | None = None
+    parse_chunks_done: int = 0
+    parse_chunks_total: int = 0
+
+    crawl_running: bool = False
+    crawl_progress: dict[str, float] = {}
+
+    response_timings: dict[str, float] = {}  # seconds per stage of the last answer
+    prompt_tokens: int = 0  # prompt size of the last answer
+    queue_position: int = 0  # position of the prompt in the LLM scheduler's queue, 0 once it is being answered
+
+    # the answer being streamed lives outside `chat_interactions` so a flush only sends this string, not the list
+    streaming_answer: str = ""  # answer streamed so far, without `streaming_tail`
+    streaming_tail: str = ""  # latest part of the streamed answer, see llm_tools.append_streamed
+    streaming_index: int = -1  # position of the streamed interaction in `chat_interactions`, -1 if none
+    streaming_runbook_id: int | None = None
+    # reuse answers to semantically similar questions (rag_tools.AnswerCache) and identical requests
+    # (llm_tools.ResponseCache), turn off to always generate a fresh answer
+    use_answer_cache: bool = True
+
+    library_query: str = ""
+    library_results: list[dict[str, str]] = []
+
     username: str = "user"
     prompt: str = ""
     result: str = ""
     ai_loading: bool = False
+    generating: bool = False  # an answer is being generated, it can be stopped
     timestamp: datetime = datetime.now(tz=tz)
 
     ai_provider: str = LLMConfig.ai_provider
@@ -119,16 +169,27 @@ class ChatState(rx.State):
         console.info(f"{self.ai_provider=} | {self.ai_provider_url=} | {self.ai_provider_api_key=} | {self.ai_model=}")
 
     def _get_client_instance(self) -> LLMClient:
-        if self._ai_client_instance is not None:
-            return self._ai_client_instance
-
+        # clients are shared by all sessions, see llm_tools.ClientRegistry
         if ai_client_instance := get_ai_client(
             ai_provider=self.ai_provider,
             ai_provider_url=self.ai_provider_url,
             ai_provider_api_key=self.ai_provider_api_key,
         ):
             self.ai_model = get_ai_model(ai_provider=self.ai_provider)
-            self._ai_client_instance = ai_client_instance
+            return ai_client_instance
+
+        raise ValueError("AI client not found")
+
+    def _get_async_client_instance(self) -> AsyncLLMClient | AsyncLLMPool:
+        # the configured endpoints are pooled unless a different url was entered in the settings
+        pooled = self.ai_provider_url == LLMConfig.ai_provider_url
+        if ai_client_instance := get_async_ai_client(
+            ai_provider=self.ai_provider,
+            ai_provider_url=self.ai_provider_url,
+            ai_provider_api_key=self.ai_provider_api_key,
+            ai_provider_urls=LLMConfig.ai_provider_urls if pooled else None,
+        ):
+            self.ai_model = get_ai_model(ai_provider=self.ai_provider)
             return ai_client_instance
 
         raise ValueError("AI client not found")
@@ -147,9 +208,43 @@ class ChatState(rx.State):
             self.runbook_id = self.runbooks[0].id
             self.chat_interactions = get_runbook_chat_interactions(runbook_id=self.runbook_id, session=session)
 
-    def _save_resulting_chat_interaction(self, chat_interaction: ChatInteraction) -> None:
+    def search_library(self, query: str) -> None:
+        """Search chat history and documents as the user types in the library search bar."""
+        self.library_query = query
+        if not query.strip():
+            self.library_results = []
+            return
+
+        runbook_titles = {runbook.id: runbook.title for runbook in self.runbooks}
         with rx.session() as session:
-            save_chat_interaction(chat_interaction, session=session)
+            chat_hits = search_chat_interactions(query, username=self.username, session=session)
+            document_hits = search_documents(query, session=session)
+
+        self.library_results = [
+            {
+                "kind": "runbook",
+                "title": runbook_titles.get(chat_interaction.interaction_id, chat_interaction.prompt),
+                "snippet": snippet,
+                "runbook_id": str(chat_interaction.interaction_id),
+            }
+            for chat_interaction, snippet in chat_hits
+            if chat_interaction.interaction_id is not None
+        ] + [
+            {"kind": "document", "title": source.title or source.path, "snippet": snippet, "path": source.path}
+            for source, snippet in document_hits
+        ]
+
+    def open_library_result(self, result: dict[str, str]):
+        if result["kind"] == "document":
+            return rx.redirect(result["path"], is_external=True)
+
+        with rx.session() as session:
+            self.runbook_id = int(result["runbook_id"])
+            self.chat_interactions = get_runbook_chat_interactions(runbook_id=self.runbook_id, session=session)
+
+    def _save_resulting_chat_interaction(self, chat_interaction: ChatInteraction) -> int | None:
+        with rx.session() as session:
+            return save_chat_interaction(chat_interaction, session=session).id
 
     def _check_saved_chat_interactions(self, username: str, prompt: str) -> bool:
         with rx.session() as session:
@@ -160,26 +255,104 @@ class ChatState(rx.State):
                 session=session,
             )
 
-    async def _process_response(self, resp, response_type: ResponseType):
-        if response_type == ResponseType.STREAM:
-            try:
-                for item in resp:
-                    answer_text = stream_get_content_openai_api(item)
-                    if answer_text is None:
-                        answer_text = ""
-                    self.chat_interactions[-1].answer += answer_text
+    @staticmethod
+    async def _stream_answer(
+        request: Callable[[], Awaitable],
+        response_type: ResponseType,
+        usage: dict[str, float],
+        user: str,
+        on_wait: Callable[[int], Awaitable[None]] | None = None,
+    ) -> AsyncIterator[str]:
+        """The answer text as it arrives, without touching state so it can be consumed outside the state lock.
+
+        The request waits for a slot of the LLM scheduler (held until the stream ends) and is only sent once the
+        first delta is awaited. Put in `usage`: the seconds spent queued, from sending the request to the first
+        token, the model load time (cold start), the prompt tokens counted by the model and the time it took to
+        evaluate them (these three are sent with the last chunk, not for cached responses). A prompt whose prefix
+        the server still had cached evaluates much faster than its token count suggests.
+        """
+
+        def record(item: ollama.ChatResponse) -> None:
+            if item.prompt_eval_count:
+                usage["prompt_tokens"] = item.prompt_eval_count
+            if item.prompt_eval_duration:
+                usage["prompt_eval"] = item.prompt_eval_duration / 1e9
+            if item.load_duration:
+                usage["load"] = item.load_duration / 1e9
+
+        queued_at = time.perf_counter()
+        async with get_scheduler().slot(user, Priority.INTERACTIVE, on_wait=on_wait):
+            sent_at = time.perf_counter()
+            usage["queue"] = sent_at - queued_at
+            resp = await request()
+            if response_type == ResponseType.STREAM:
+                try:
+                    async for item in resp:
+                        usage.setdefault("first_token", time.perf_counter() - sent_at)
+                        record(item)
+                        yield get_content_ollama_api(item)
+                finally:
+                    # also on cancellation, so the model server stops generating for a closed response
+                    await resp.aclose()
+            else:
+                usage["first_token"] = time.perf_counter() - sent_at
+                record(resp)
+                yield get_content_ollama_api(resp)
 
-                    # Scroll while the response is being generated
-                    yield rx.scroll_to(elem_id=INPUT_BOX_ID)
+    async def _update_history_summary(
+        self, client: AsyncLLMClient | AsyncLLMPool, model: str, runbook_id: int, user: str
+    ) -> None:
+        """Fold the turns that no longer fit the verbatim history budget into the runbook's rolling summary.
+
+        Runs after an answer is saved, so summarizing never delays an answer.
+        """
+        with rx.session() as session:
+            if not (runbook := session.get(Runbook, runbook_id)):
+                return
+            summary, summarized_turns = runbook.history_summary, runbook.summarized_turns
+            chat_interactions = get_runbook_chat_interactions(runbook_id=runbook_id, session=session)
+
+        fold = history_fold_point(chat_interactions, summarized_turns)
+        if fold == summarized_turns:
+            return
 
-            except StopAsyncIteration:
-                raise
+        start = time.perf_counter()
+        summary_tokens = 2 * LLMConfig.ai_history_summary_words
+        # a runbook that grew past the budget before it had a summary may need more than one request
+        for batch in batch_turns(chat_interactions[summarized_turns:fold], prompt_token_limit() - 2 * summary_tokens):
+            try:
+                async with get_scheduler().slot(user, Priority.BACKGROUND):
+                    resp = await client.chat_completion(
+                        model=model,
+                        messages=create_history_summary_prompt(summary, batch),
+                        stream=False,
+                        temperature=0.2,
+                        max_tokens=summary_tokens,
+                    )
+            except Exception as err:
+                console.error(f"summarizing the history of runbook {runbook_id} failed: {err}")
+                return
+            summary, summarized_turns = get_content_ollama_api(resp), summarized_turns + len(batch)
+            update_runbook_history_summary(runbook_id, summary, summarized_turns)
 
-            self.result = self.chat_interactions[-1].answer
+        console.info(
+            f"summarized {summarized_turns} turns of runbook {runbook_id} in {time.perf_counter() - start:.2f}s"
+        )
 
-        else:
-            self.chat_interactions[-1].answer = resp.choices[0].message.content
-            self.result = self.chat_interactions[-1].answer
+    def _start_streamed_answer(self, index: int) -> None:
+        self.streaming_answer = ""
+        self.streaming_tail = ""
+        self.streaming_index = index
+        self.streaming_runbook_id = self.runbook_id
+
+    def _finish_streamed_answer(self, answer: str) -> None:
+        # the lock is released while streaming, the user may have switched runbooks in the meantime
+        if self.runbook_id == self.streaming_runbook_id and self.streaming_index < len(self.chat_interactions):
+            self.chat_interactions[self.streaming_index].answer = answer
+        self.streaming_answer = ""
+        self.streaming_tail = ""
+        self.streaming_index = -1
+        self.streaming_runbook_id = None
 
     # ----
     # ---- rx.Vars
@@ -199,6 +372,34 @@ class ChatState(rx.State):
     def len_documents(self) -> int:
         return len(self.document_sources)
 
+    @rx.var
+    def parse_progress_text(self) -> str:
+        return f"converting {self.parse_chunks_done}/{self.parse_chunks_total} chunks"
+
+    @rx.var
+    def crawl_status_text(self) -> str:
+        if not self.crawl_progress:
+            return ""
+        p = self.crawl_progress
+        return (
+            f"fetched {int(p['fetched'])}/{int(p['discovered'])} | saved {int(p['saved'])} | "
+            f"skipped {int(p['skipped'])} | failed {int(p['failed'])} | {p['pages_per_sec']:.1f} pages/s"
+        )
+
+    @rx.var
+    def streaming_position(self) -> int:
+        """Index of the interaction whose answer is streaming in the runbook on screen, -1 if none."""
+        return self.streaming_index if self.runbook_id == self.streaming_runbook_id else -1
+
+    @rx.var
+    def queue_position_text(self) -> str:
+        return f"waiting for the model, position {self.queue_position} in the queue" if self.queue_position else ""
+
+    @rx.var
+    def response_timings_text(self) -> str:
+        timings = " | ".join(f"{stage} {seconds:.2f}s" for stage, seconds in self.response_timings.items())
+        return f"prompt {self.prompt_tokens} tokens | {timings}" if self.prompt_tokens and timings else timings
+
     # @rx.var
     # d
 
@@ -207,79 +408,114 @@ class ChatState(rx.State):
     # ----
 
     @rx.event(background=True)
-    async def regenerate_parsed_document(self, doc_id: int) -> None:
+    async def regenerate_parsed_document(self, doc_id: int, mode: str = rag_tools.ParseMode.LOCAL):
+        """Convert a document's HTML to Markdown.
+
+        LOCAL only uses the deterministic converter. POLISH and LLM split the document into sections that are
+        converted by the LLM in parallel, checkpointing each finished chunk in `meta` so a retry resumes.
+        """
+        mode = rag_tools.ParseMode(mode)
+
         with rx.session() as session:
             if not (doc := session.get(DocumentSource, ident=doc_id)):
                 yield rx.toast.error("Document not found")
                 return
+            doc_path, doc_meta = doc.path, dict(doc.meta or {})
+            html_content = await asyncio.to_thread(rag_tools.document_body, doc, "content")
 
-            yield rx.toast.info(f"regenerating parsed document: {doc.path}")
-
-        print(f"should still have doc: {doc.path}")
-        async with self:
-            client = get_ai_client(
-                ai_provider=self.ai_provider,
-                ai_provider_url=self.ai_provider_url,
-                ai_provider_api_key=self.ai_provider_api_key,
-            )
-            model = self.ai_model
+        yield rx.toast.info(f"regenerating parsed document: {doc_path}")
 
-            # client_instance: LLMClient = self._get_client_instance()
-        gen_kwargs = LLMConfig.ai_model_chat_completion_kwargs
+        start = time.perf_counter()
+        parsed_content = await asyncio.to_thread(rag_tools.html_to_markdown, html_content)
+        console.info(f"converted {doc_path} to markdown in {time.perf_counter() - start:.3f}s")
 
-        if "max_tokens" in gen_kwargs:
-            _max_tokens = gen_kwargs.pop("max_tokens")
-
-        print(f"chat completion kwargs: {gen_kwargs} | {len(doc.content)}")
+        if mode != rag_tools.ParseMode.LOCAL:
+            if mode == rag_tools.ParseMode.POLISH:
+                chunks = rag_tools.split_markdown_sections(parsed_content, LLMConfig.ai_parse_chunk_tokens)
+                create_prompt = create_markdown_polish_prompt
+            else:
+                chunks = await asyncio.to_thread(
+                    rag_tools.split_html_sections, html_content, LLMConfig.ai_parse_chunk_tokens
+                )
+                create_prompt = create_html_parse_prompt
+
+            key = rag_tools.checkpoint_key(mode, chunks)
+            done = rag_tools.load_checkpoint(doc_meta, key)
+            if done:
+                yield rx.toast.info(f"resuming from checkpoint, {len(done)}/{len(chunks)} chunks already converted")
+
+            async with self:
+                client = self._get_async_client_instance()
+                model = self.ai_model
+                client_token = self.router.session.client_token
+                self.parsing_document_id = doc_id
+                self.parse_chunks_done = len(done)
+                self.parse_chunks_total = len(chunks)
+
+            finished: asyncio.Queue[int] = asyncio.Queue()
+            checkpoint_lock = asyncio.Lock()
+
+            async def convert_chunk(chunk: str) -> str:
+                # queued behind chat answers, which someone is actively waiting for
+                async with get_scheduler().slot(client_token, Priority.BACKGROUND):
+                    resp = await client.chat_completion(
+                        model=model,
+                        messages=create_prompt(chunk),
+                        stream=False,
+                        temperature=0.5,
+                    )
+                return get_content_ollama_api(resp)
+
+            async def on_chunk_done(idx: int, text: str) -> None:
+                # serialize checkpoint writes, meta is rewritten as a whole
+                async with checkpoint_lock:
+                    done[idx] = text
+                    checkpoint = {"key": key, "chunks": {str(i): t for i, t in done.items()}}
+                    await asyncio.to_thread(update_document_meta, doc_id, {rag_tools.CHECKPOINT_META_KEY: checkpoint})
+                finished.put_nowait(idx)
+
+            convert_task = asyncio.create_task(
+                rag_tools.convert_in_chunks(
+                    chunks,
+                    convert_chunk,
+                    done=dict(done),
+                    concurrency=LLMConfig.ai_parse_concurrency,
+                    on_chunk_done=on_chunk_done,
+                )
+            )
 
-        messages = create_html_parse_prompt(html_content=doc.content)
-        resp = client.chat_completion(
-            model=model,
-            messages=messages,
-            stream=False,
-            temperature=0.5,
+            try:
+                while not (convert_task.done() and finished.empty()):
+                    try:
+                        idx = await asyncio.wait_for(finished.get(), timeout=0.5)
+                    except asyncio.TimeoutError:
+                        continue
+                    async with self:
+                        self.parse_chunks_done += 1
+                    yield rx.toast.info(f"converted chunk {idx + 1}/{len(chunks)}")
+
+                parsed_content = "\n\n".join(convert_task.result())
+                console.info(f"llm response cache: {get_response_cache().stats}")
+            except Exception as err:
+                console.error(f"chunked conversion failed for {doc_path}: {err}")
+                yield rx.toast.error(f"Conversion failed, {len(done)}/{len(chunks)} chunks saved, retry to resume.")
+                return
+            finally:
+                async with self:
+                    self.parsing_document_id = None
+
+        await asyncio.to_thread(
+            save_parsed_content,
+            doc_id,
+            parsed_content,
+            meta_updates={rag_tools.CHECKPOINT_META_KEY: None},
         )
-
-        breakpoint()
-        # resp = client_instance.chat_completion(model=self.ai_model, messages=messages, stream=False)
-        # print
-
-        # chat_kwargs = LLMConfig.ai_model_chat_completion_kwargs
-        #     resp = client_instance.chat_completion(
-        #         model=self.ai_model,
-        #         messages=messages,
-        #         stream=self.stream_resp,
-        #         **chat_kwargs,
-        #     )
-        # messages = create_html_parse_prompt(html_content=)
+        # re-chunk from the new markdown
+        await asyncio.to_thread(rag_tools.process_documents, [doc_id])
+        yield rx.toast.success(f"parsed document in {time.perf_counter() - start:.2f}s")
 
     @rx.event(background=True)
     async def submit_prompt(self):
-        async def _fetch_chat_completion_session(
-            prompt: str,
-            response_type: ResponseType,
-        ):
-            messages = create_messages_for_chat_completion(self.chat_interactions, prompt)
-
-    @rx.event(background=True)
-    async def submit_prompt(self):
-        async def _fetch_chat_completion_session(
-            prompt: str,
-        ):
-            messages = create_messages_for_chat_completion(self.chat_interactions, prompt)
-            client_instance: LLMClient = self._get_client_instance()
-            chat_kwargs = LLMConfig.ai_model_chat_completion_kwargs
-            resp = client_instance.chat_completion(
-                model=self.ai_model,
-                messages=messages,
-                stream=self.stream_resp,
-                **chat_kwargs,
-            )
-            if resp is None:
-                raise Exception("Session is None")
-
-            return resp
-
         def set_ui_loading_state() -> None:
             self.ai_loading = True
 
@@ -287,42 +523,218 @@ class ChatState(rx.State):
             self.result = ""
             self.ai_loading = False
 
-        def add_new_chat_interaction() -> None:
-            self.chat_interactions.append(
-                ChatInteraction(
-                    prompt=prompt,
-                    answer="",
-                    chat_participant_user_name=self.username,
-                    interaction_id=self.runbook_id,
-                ),
+        def new_chat_interaction(answer: str = "") -> ChatInteraction:
+            return ChatInteraction(
+                prompt=prompt,
+                answer=answer,
+                chat_participant_user_name=self.username,
+                interaction_id=self.runbook_id,
             )
-            self.prompt = ""
 
-        # Get the question from the form
-        if self.prompt == "":
-            return
+        def add_new_chat_interaction(answer: str = "") -> None:
+            # the prompt was cleared when it was claimed, whatever was typed since stays in the input box
+            self.chat_interactions.append(new_chat_interaction(answer))
 
-        prompt = self.prompt
-        if self.username == "":
-            raise ValueError("Username is required")
+        def release(restore_prompt: bool = False) -> None:
+            nonlocal finalized
+            finalized = True
+            self.generating = False
+            if restore_prompt and not self.prompt:
+                self.prompt = prompt
 
-        if self._check_saved_chat_interactions(prompt=prompt, username=self.username):
-            yield rx.toast.error("Question for this runbook already exists.")
+        # Get the question from the form, checked and claimed in one go so a double submit can't start a second
+        # generation while the first one is still retrieving
+        async with self:
+            prompt, username, busy = self.prompt, self.username, self.generating
+            client_token = self.router.session.client_token
+            if prompt and username and not busy:
+                self.generating = True
+                self.prompt = ""
+                stop = _stop_events[client_token] = asyncio.Event()
+
+        if prompt == "":
+            return
+        if username == "":
+            raise ValueError("Username is required")
+        if busy:
+            yield rx.toast.error("Still generating the previous answer.")
             return
 
-        async with self:
-            set_ui_loading_state()
+        finalized = False
+        try:
+            if self._check_saved_chat_interactions(prompt=prompt, username=username):
+                async with self:
+                    release(restore_prompt=True)
+                yield rx.toast.error("Question for this runbook already exists.")
+                return
+
+            async with self:
+                set_ui_loading_state()
+                history = [(ci.prompt, ci.answer) for ci in self.chat_interactions]
             yield
 
-            resp = await _fetch_chat_completion_session(prompt)
-            clear_ui_loading_state()
-            add_new_chat_interaction()
+            # retrieval runs outside the state lock, keyword and vector search run in parallel threads
+            retrieval = await rag_tools.retrieve_context(prompt)
+            console.info(
+                f"retrieved {len(retrieval.passages)} passages ({retrieval.num_tokens} tokens) | "
+                + " | ".join(f"{stage} {seconds * 1000:.1f}ms" for stage, seconds in retrieval.timings.items())
+            )
+
+            # a near identical question answered from the same documents by the same model, after the same
+            # conversation (none for the first prompt of a runbook), is served from the cache
+            answer_cache = rag_tools.get_answer_cache()
+            cache_scope = answer_cache.scope(self.ai_model, retrieval.embed_model, retrieval.source_ids, history)
+            if self.use_answer_cache and retrieval.query_vector is not None:
+                lookup_start = time.perf_counter()
+                hit = answer_cache.lookup(retrieval.query_vector, cache_scope)
+                stats = answer_cache.stats
+                console.info(
+                    f"answer cache {'hit' if hit else 'miss'} | "
+                    f"hit rate {stats.hit_rate:.0%} of {stats.hits + stats.misses}"
+                )
+                if hit:
+                    async with self:
+                        release()
+                        clear_ui_loading_state()
+                        add_new_chat_interaction(hit.answer)
+                        chat_interaction = new_chat_interaction(hit.answer)
+                        self.result = hit.answer
+                        self.response_timings = {
+                            "retrieval": retrieval.timings["total"],
+                            "cache": time.perf_counter() - lookup_start,
+                        }
+                    yield rx.toast.info(f'Answered from cache ({hit.similarity:.2f} similar to "{hit.prompt}")')
+                    self._save_resulting_chat_interaction(chat_interaction=chat_interaction)
+                    return
+
+            # the state lock is only held to snapshot the request and to apply the answer as it streams in, the
+            # request and the stream itself run unlocked so the user's other events aren't queued behind generation
+            with rx.session() as session:
+                runbook = session.get(Runbook, self.runbook_id)
+                summary, summarized_turns = (runbook.history_summary, runbook.summarized_turns) if runbook else ("", 0)
+
+            lock_held = 0.0
+            async with self:
+                locked_at = time.perf_counter()
+                messages = create_messages_for_chat_completion(
+                    self.chat_interactions,
+                    prompt,
+                    context=retrieval.context,
+                    summary=summary,
+                    summarized_turns=summarized_turns,
+                )
+                client_instance = self._get_async_client_instance()
+                stream, runbook_id, model = self.stream_resp, self.runbook_id, self.ai_model
+                request = partial(
+                    client_instance.chat_completion,
+                    model=model,
+                    messages=messages,
+                    stream=stream,
+                    cache=self.use_answer_cache,
+                    **LLMConfig.ai_model_chat_completion_kwargs,
+                )
+                add_new_chat_interaction()
+                self._start_streamed_answer(len(self.chat_interactions) - 1)
+                lock_held += time.perf_counter() - locked_at
             yield
 
-            async for scroll_event in self._process_response(resp):
-                yield scroll_event
+            # tokens are batched (see llm_tools.coalesce_deltas), each flush is one small state update and one scroll
+            generation_start = time.perf_counter()
+            answer, failed = "", False
+            usage = {"prompt_tokens": count_prompt_tokens(messages), "queue": 0.0}  # estimate, replaced by the model's
+
+            async def show_queue_position(position: int) -> None:
+                async with self:
+                    self.queue_position = position
 
-        self._save_resulting_chat_interaction(chat_interaction=self.chat_interactions[-1])
+            response_type = ResponseType.STREAM if stream else ResponseType.FULL
+            answer_stream = self._stream_answer(request, response_type, usage, client_token, show_queue_position)
+            try:
+                async for text in coalesce_deltas(until_stopped(answer_stream, stop)):
+                    answer += text
+                    async with self:
+                        locked_at = time.perf_counter()
+                        if self.ai_loading:
+                            self.ai_loading = False
+                            self.queue_position = 0
+                        self.streaming_answer, self.streaming_tail = append_streamed(
+                            self.streaming_answer, self.streaming_tail, text
+                        )
+                        lock_held += time.perf_counter() - locked_at
+                    # Scroll while the response is being generated
+                    yield rx.scroll_to(elem_id=INPUT_BOX_ID)
+            except Exception as err:
+                console.error(f"generation failed: {err}")
+                yield rx.toast.error(f"Generation failed: {err}")
+                failed = True
+            finally:
+                _stop_events.pop(client_token, None)
+
+            if stop.is_set():
+                answer += "\n\n*Generation stopped.*"
+            elif failed:
+                answer += "\n\n*Generation failed.*"
+            if retrieval.passages:
+                answer += f"\n\n**Sources**\n\n{retrieval.citations()}"
+            generation_time = time.perf_counter() - generation_start
+            async with self:
+                self._finish_streamed_answer(answer)
+                clear_ui_loading_state()
+                release()
+                self.result = answer
+                self.queue_position = 0
+                self.response_timings = {
+                    "retrieval": retrieval.timings["total"],
+                    "queue": usage["queue"],
+                    "prompt eval": usage.get("prompt_eval", 0.0),
+                    "first token": usage.get("first_token", 0.0),
+                    "generation": generation_time - usage["queue"],
+                }
+                self.prompt_tokens = int(usage["prompt_tokens"])
+            console.info(
+                f"generated {len(answer)} chars in {generation_time:.2f}s ({usage['queue']:.2f}s queued, first token "
+                f"after {usage.get('first_token', 0.0):.2f}s, {usage.get('load', 0.0):.2f}s loading the model) from "
+                f"{usage['prompt_tokens']} prompt tokens evaluated in {usage.get('prompt_eval', 0.0):.2f}s, "
+                f"state locked {lock_held * 1000:.1f}ms | "
+                f"scheduler {get_scheduler().metrics.as_dict()}"
+            )
+            if isinstance(client_instance, AsyncLLMPool):
+                console.info(f"endpoints {client_instance.stats}")
+
+            chat_interaction = ChatInteraction(
+                prompt=prompt,
+                answer=answer,
+                chat_participant_user_name=self.username,
+                interaction_id=runbook_id,
+            )
+            chat_interaction_id = self._save_resulting_chat_interaction(chat_interaction=chat_interaction)
+            # a stopped or failed answer is kept in the runbook but never served to anyone else
+            if retrieval.query_vector is not None and answer and not (stop.is_set() or failed):
+                answer_cache.store(retrieval.query_vector, prompt, answer, cache_scope, chat_interaction_id)
+
+            if runbook_id is not None:
+                await self._update_history_summary(client_instance, model, runbook_id, client_token)
+        finally:
+            if not finalized:
+                # failed before the answer was in place (database, retrieval, client setup), don't leave the
+                # spinner running or the next prompt refused
+                async with self:
+                    if self.streaming_index >= 0:
+                        self._finish_streamed_answer(self.streaming_answer + self.streaming_tail)
+                    clear_ui_loading_state()
+                    self.generating = False
+                    self.queue_position = 0
+            # left in place if it already belongs to a newer prompt
+            if _stop_events.get(client_token) is stop:
+                del _stop_events[client_token]
+
+    @rx.event
+    def stop_generation(self):
+        """Abort the answer being generated, the request to the model is closed and the partial answer saved."""
+        if stop := _stop_events.get(self.router.session.client_token):
+            stop.set()
+        # `generating` is cleared by submit_prompt once the partial answer is in place, which is right after
+        self.ai_loading = False
 
     @rx.event(background=True)
     async def background_scroll_bottom_on_load(self):
@@ -331,33 +743,105 @@ class ChatState(rx.State):
 
     @rx.event(background=True)
     async def add_document(self, form_data: dict = {}):
-        url = form_data.get("url", None)
-        if not url:
+        # accepts one url or a whitespace separated list of urls which are fetched concurrently
+        urls = list(dict.fromkeys((form_data.get("url") or "").split()))
+        if not urls:
             return
 
-        def btn_loading():
-            self.processing_document = not self.processing_document
+        async with self:
+            self.processing_document = True
+
+        try:
+            if invalid := [url for url in urls if not rag_tools.valid_url(url)]:
+                yield rx.toast.error(f"Invalid URL: {', '.join(invalid)}")
+                urls = [url for url in urls if url not in invalid]
 
-        async with proc_ctx(self, hooks=(btn_loading,)) as self:
             with rx.session() as session:
-                if not rag_tools.valid_url(url):
-                    yield rx.toast.error("Invalid URL")
-                    return
+                if existing := [url for url in urls if rag_tools.document_exists(url, session=session)]:
+                    yield rx.toast.error(f"Document already fetched: {', '.join(existing)}")
+                    urls = [url for url in urls if url not in existing]
 
-                if rag_tools.document_exists(url, session=session):
-                    yield rx.toast.error("Document already fetched.")
-                    return
+            if not urls:
+                return
 
-                html_src = rag_tools.get_source(url)
-                session.add(html_src)
-                session.commit()
-                session.refresh(html_src)
+            # network and parsing happen without holding the state lock or blocking the event loop
+            results = await rag_tools.fetch_sources(urls)
 
-                yield rx.toast.success("added document")
+            await asyncio.to_thread(rag_tools.ingest_documents, [result.source for result in results if result.ok])
+
+            for result in results:
+                if not result.ok:
+                    yield rx.toast.error(f"Failed to fetch {result.url}: {result.error}")
+
+            if added := sum(result.ok for result in results):
+                yield rx.toast.success(f"added {added} document{'s' if added > 1 else ''}")
+        finally:
+            async with self:
+                self.processing_document = False
                 self.load_all_documents()
 
-    @rx.event
-    def delete_doc(self, doc_id: int, doc_table: str = "DocumentSource") -> None:
+    @rx.event(background=True)
+    async def crawl_documents(self, form_data: dict = {}):
+        seed = (form_data.get("seed_url") or "").strip()
+        if not rag_tools.valid_url(seed):
+            yield rx.toast.error("Invalid URL")
+            return
+
+        async with self:
+            if self.crawl_running:
+                yield rx.toast.error("A crawl is already running.")
+                return
+            self.crawl_running = True
+            self.crawl_progress = {}
+
+        crawler = rag_tools.DocsCrawler(seed)
+        crawl_task = asyncio.create_task(crawler.run())
+        yield rx.toast.info(f"crawling {crawler.prefix}")
+
+        try:
+            # only sync progress into state periodically so the websocket isn't flooded
+            while not crawl_task.done():
+                await asyncio.wait({crawl_task}, timeout=1.0)
+                async with self:
+                    self.crawl_progress = crawler.progress.as_dict()
+
+            progress = crawl_task.result()
+            yield rx.toast.success(f"crawl finished, added {progress.saved} documents")
+        except Exception as err:
+            console.error(f"crawl failed: {err}")
+            yield rx.toast.error(f"Crawl failed: {err}")
+        finally:
+            async with self:
+                self.crawl_running = False
+                self.crawl_progress = crawler.progress.as_dict()
+                self.load_all_documents()
+
+    @rx.event(background=True)
+    async def refresh_document(self, doc_id: int):
+        outcome = await rag_tools.refresh_source(doc_id)
+
+        match outcome:
+            case rag_tools.RefreshOutcome.UNCHANGED:
+                yield rx.toast.info("Document is up to date.")
+            case rag_tools.RefreshOutcome.UPDATED:
+                yield rx.toast.success("Document refreshed.")
+                async with self:
+                    self.load_all_documents()
+            case _:
+                yield rx.toast.error("Failed to refresh document.")
+
+    @rx.event(background=True)
+    async def refresh_stale_documents(self):
+        outcomes = await rag_tools.refresh_stale_sources()
+        summary = ", ".join(f"{outcome}: {count}" for outcome, count in outcomes.items())
+        yield rx.toast.info(summary or "No stale documents.")
+
+        if outcomes[rag_tools.RefreshOutcome.UPDATED]:
+            async with self:
+                self.load_all_documents()
+
+    @rx.event(background=True)
+    async def delete_doc(self, doc_id: int, doc_table: str = "DocumentSource"):
         entity = DocumentTableLookup[doc_table.lower()]
 
         with rx.session() as session:
@@ -366,6 +850,12 @@ class ChatState(rx.State):
                 doc.is_deleted = True
                 doc.deleted_at = datetime.now(tz=tz)
                 session.commit()
-                self.load_all_documents()
             else:
                 console.info(f"doc not found: {doc_id=} | {doc_table=}")
+                return
+
+        # rewrites the keyword and vector index files (compacting them now and then), off the event loop
+        if entity is DocumentSource:
+            await asyncio.to_thread(rag_tools.unindex_documents, [doc_id])
+        async with self:
+            self.load_all_documents()
@@ -1,16 +1,41 @@
-from urllib.request import urlopen
+import asyncio
 
-from bs4 import BeautifulSoup
-
-from runbook.db_models import ContentType, Document, DocumentSource
+from runbook.db_models import ContentType, DocumentSource
+from runbook.rag_tools.rag_answer_cache import AnswerCache, CacheHit, get_answer_cache
+from runbook.rag_tools.rag_blob import BlobStore, document_body, get_blob_store
+from runbook.rag_tools.rag_bm25 import BM25Index, get_keyword_index, keyword_search
+from runbook.rag_tools.rag_crawl import CrawlProgress, DocsCrawler
 from runbook.rag_tools.rag_db import (
     document_exists_in_db,
     load_documents_from_db,
     load_sources_from_db,
     save_document_to_db,
 )
-from runbook.rag_tools.rag_dto import StorageType, storage_type
+from runbook.rag_tools.rag_dto import IngestResult, ParseMode, StorageType, storage_type
+from runbook.rag_tools.rag_embed import Embedder, HashEmbedder, OllamaEmbedder, get_embedder
+from runbook.rag_tools.rag_fetch import AsyncFetcher, FetchResult, cache_validators, get_fetcher
 from runbook.rag_tools.rag_file import load_documents_from_file, save_document_to_file
+from runbook.rag_tools.rag_mapreduce import (
+    CHECKPOINT_META_KEY,
+    checkpoint_key,
+    convert_in_chunks,
+    load_checkpoint,
+    split_html_sections,
+    split_markdown_sections,
+)
+from runbook.rag_tools.rag_markdown import html_to_markdown, iter_markdown
+from runbook.rag_tools.rag_parse import source_from_html
+from runbook.rag_tools.rag_pipeline import ingest_documents, process_documents, unindex_documents
+from runbook.rag_tools.rag_refresh import RefreshOutcome, refresh_source, refresh_stale_sources
+from runbook.rag_tools.rag_retrieve import (
+    Passage,
+    RetrievalResult,
+    merge_overlapping,
+    pack_context,
+    reciprocal_rank_fusion,
+    retrieve_context,
+)
+from runbook.rag_tools.rag_vector import VectorIndex, get_vector_index, vector_search
 
 
 def _check_storage_type():
@@ -33,46 +58,69 @@ def valid_url(url: str) -> bool:
         return False
 
 
-def get_source(url: str, content_type: ContentType = ContentType.DEFAULT) -> DocumentSource | None:
-    """Fetch and save an HTML document.
+async def fetch_source(
+    url: str,
+    content_type: ContentType = ContentType.DEFAULT,
+    *,
+    fetcher: AsyncFetcher | None = None,
+) -> IngestResult:
+    """Fetch and parse an HTML document without blocking the event loop.
 
     Args:
         url: URL to fetch
+        content_type: Content type stored on the DocumentSource
+        fetcher: Optional fetcher, defaults to the shared pooled fetcher
 
     Returns:
-        DocumentSource if successful, None otherwise
+        IngestResult with `source` set if successful, `error` otherwise
     """
+    fetcher = fetcher or get_fetcher()
+    resp: FetchResult = await fetcher.fetch(url)
+    result = IngestResult(url=url, status_code=resp.status_code, elapsed=resp.elapsed, error=resp.error)
 
-    def text_from_html(s):
-        text = soup.get_text()
-        lines = (line.strip() for line in text.splitlines())
-        chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
-        text = " ".join(chunk for chunk in chunks if chunk)
-        return text
-
-    def clean_title(s):
-        # Clean up title
-        return s.title.string.replace(" ", "_").replace("/", "_").replace("\\", "_").replace("|", "_")
+    if not resp.ok:
+        print(f"Error fetching HTML document: {url} | {resp.error}")
+        return result
 
     try:
-        resp = urlopen(url)
-        data = resp.read().decode("utf-8")
+        result.source = await asyncio.to_thread(source_from_html, url, resp.content, content_type)
+        result.source.meta = {**result.source.meta, **cache_validators(resp)}
+    except Exception as err:
+        print(f"Error processing HTML document: {err}")
+        result.error = str(err)
 
-        soup = BeautifulSoup(data, "html.parser")
+    return result
 
-        # Extract text content
-        for script in soup(["script", "style"]):
-            script.decompose()
 
-        title = soup.title.string
+async def fetch_sources(
+    urls: list[str],
+    content_type: ContentType = ContentType.DEFAULT,
+    *,
+    fetcher: AsyncFetcher | None = None,
+) -> list[IngestResult]:
+    """Fetch and parse many documents concurrently, one IngestResult per URL (same order as `urls`)."""
+    fetcher = fetcher or get_fetcher()
+    return list(await asyncio.gather(*(fetch_source(url, content_type, fetcher=fetcher) for url in urls)))
 
-        return DocumentSource(path=url, title=title, content=data, content_type=content_type)
-    except Exception as err:
-        print(f"Error processing HTML document: {err}")
-        return None
+
+def get_source(url: str, content_type: ContentType = ContentType.DEFAULT) -> DocumentSource | None:
+    """Fetch and parse an HTML document, blocking. Only for scripts, use `fetch_source` from events.
+
+    Args:
+        url: URL to fetch
+
+    Returns:
+        DocumentSource if successful, None otherwise
+    """
+
+    async def _fetch() -> IngestResult:
+        async with AsyncFetcher() as fetcher:
+            return await fetch_source(url, content_type, fetcher=fetcher)
+
+    return asyncio.run(_fetch()).source
 
 
-def load_all_documents(storage_type: StorageType = storage_type, **kwargs) -> list[Document]:
+def load_all_documents(storage_type: StorageType = storage_type, **kwargs) -> list[DocumentSource]:
     """Load all documents from the configured source.
 
     Args:
@@ -121,6 +169,50 @@ def document_exists(url: str, **kwargs) -> bool:
 
 __all__ = [
     "get_source",
+    "fetch_source",
+    "fetch_sources",
+    "source_from_html",
+    "html_to_markdown",
+    "iter_markdown",
+    "ParseMode",
+    "BlobStore",
+    "document_body",
+    "get_blob_store",
+    "ingest_documents",
+    "process_documents",
+    "unindex_documents",
+    "Embedder",
+    "HashEmbedder",
+    "OllamaEmbedder",
+    "get_embedder",
+    "VectorIndex",
+    "get_vector_index",
+    "vector_search",
+    "BM25Index",
+    "get_keyword_index",
+    "keyword_search",
+    "Passage",
+    "RetrievalResult",
+    "merge_overlapping",
+    "pack_context",
+    "reciprocal_rank_fusion",
+    "retrieve_context",
+    "AnswerCache",
+    "CacheHit",
+    "get_answer_cache",
+    "convert_in_chunks",
+    "CHECKPOINT_META_KEY",
+    "checkpoint_key",
+    "load_checkpoint",
+    "split_html_sections",
+    "split_markdown_sections",
+    "AsyncFetcher",
+    "IngestResult",
+    "DocsCrawler",
+    "CrawlProgress",
+    "RefreshOutcome",
+    "refresh_source",
+    "refresh_stale_sources",
     "save_document",
     "document_exists",
     "load_all_documents",
@@ -61,12 +61,23 @@ Please convert the following HTML string to Markdown, following these guidelines
 """
 
 
+rag_markdown_polish_prompt = """You are an expert technical editor. The following Markdown was converted automatically from an HTML documentation page. Clean it up without changing its meaning:
+
+- Remove leftover navigation, cookie banners, "edit this page" links and other page chrome
+- Fix broken heading levels, list nesting and table formatting
+- Keep every code block, command, flag and link exactly as written
+- Do not summarize, add or invent content
+
+Only respond with the cleaned markdown, do not repeat extra unnecessary info.
+"""
+
+
 rag_runbook_prompt = """You are an expert technical documentation specialist tasked with creating a comprehensive runbook based on the provided documents. Your goal is to generate a clear, structured, and actionable runbook that enables users to successfully complete the specified task.
 
 Document Context:
-[Attach relevant technical documents, system architecture diagrams, configuration guides, or any supporting materials]
+Numbered excerpts from the relevant documentation are provided with the task. Base the runbook on them, cite the excerpts you use as [n] and list their links under References. If the excerpts do not cover part of the task, say so instead of guessing.
 
-Runbook Objective: [Clearly state the specific task or process to be documented]
+Runbook Objective: The task given by the user.
 
 Runbook Requirements:
 1. Prerequisites
@@ -143,3 +154,22 @@ Output Format:
 
 Please generate the runbook using the provided documents and this template. Ensure the documentation is comprehensive, clear, and actionable.
 """
+
+
+rag_chat_system_prompt = """You are a helpful assistant for writing and following technical runbooks. When documentation excerpts are provided with a question, base your answer on them and cite the excerpts you use as [n]. If they do not cover the question, say so."""
+
+
+rag_context_template = """Documentation excerpts:
+
+{context}
+
+{prompt}"""
+
+
+rag_history_summary_prompt = """You keep a running summary of a conversation about writing and following a technical runbook. Update the summary with the new conversation turns given by the user.
+
+Keep the task being worked on, decisions made, commands, flags, names, versions, links and open questions. Drop pleasantries and anything repeated. Respond with the updated summary only, in at most {max_words} words."""
+
+
+rag_history_summary_template = """Summary of the earlier conversation:
+{summary}"""
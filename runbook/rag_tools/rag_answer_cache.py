@@ -0,0 +1,170 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Iterable, Sequence
+
+import numpy as np
+
+# cosine similarity of prompt embeddings above which a previous answer is reused, paraphrases of the same
+# question land around 0.9+, related but different questions (other service, other flag) usually well below
+DEFAULT_THRESHOLD: float = 0.92
+DEFAULT_TTL: float = 7 * 24 * 3600.0  # seconds, documentation and models move on
+DEFAULT_MAX_ENTRIES: int = 2048
+
+# (llm model, embedding model, retrieved sources, conversation hash)
+Scope = tuple[str, str, frozenset[int], str]
+
+
+@dataclass
+class _Entry:
+    vector: np.ndarray  # normalized prompt embedding
+    prompt: str
+    answer: str
+    chat_interaction_id: int | None
+    scope: Scope
+    created_at: float
+
+
+@dataclass(frozen=True)
+class CacheHit:
+    prompt: str
+    answer: str
+    chat_interaction_id: int | None
+    similarity: float
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    expirations: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def as_dict(self) -> dict[str, float]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "hit_rate": self.hit_rate,
+        }
+
+
+class AnswerCache:
+    """Semantic cache of chat answers, keyed on the embedding of the prompt.
+
+    A lookup returns the most similar previous answer above `threshold` that was generated by the same LLM,
+    with the same embedding model, from the same set of retrieved documents and after the same conversation, so
+    an answer is never reused for a question that would have been given different documentation, and a follow
+    up like "make that shorter" is never answered with another runbook's answer. Entries expire after `ttl` seconds
+    and the least recently used are evicted beyond `max_entries`.
+
+    The cache lives in process memory, the answers themselves are persisted as ChatInteractions.
+    """
+
+    def __init__(
+        self,
+        threshold: float = DEFAULT_THRESHOLD,
+        ttl: float = DEFAULT_TTL,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.stats = CacheStats()
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[int, _Entry] = OrderedDict()  # least recently used first
+        self._next_key = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def scope(
+        model: str, embed_model: str, source_ids: Iterable[int], history: Sequence[tuple[str, str]] = ()
+    ) -> Scope:
+        """Cache scope of a prompt, `history` are the (prompt, answer) turns before it, empty for a first prompt."""
+        conversation = hashlib.sha256(json.dumps(list(history)).encode()).hexdigest() if history else ""
+        return model, embed_model, frozenset(source_ids), conversation
+
+    def _expire(self, now: float) -> None:
+        expired = [key for key, entry in self._entries.items() if now - entry.created_at > self.ttl]
+        for key in expired:
+            del self._entries[key]
+        self.stats.expirations += len(expired)
+
+    def lookup(self, vector: np.ndarray, scope: Scope) -> CacheHit | None:
+        """The cached answer to the most similar prompt within the same scope, if it is similar enough."""
+        with self._lock:
+            self._expire(self._clock())
+            keys = [key for key, entry in self._entries.items() if entry.scope == scope]
+            if keys:
+                similarities = np.stack([self._entries[key].vector for key in keys]) @ vector
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.threshold:
+                    self._entries.move_to_end(keys[best])
+                    self.stats.hits += 1
+                    entry = self._entries[keys[best]]
+                    return CacheHit(entry.prompt, entry.answer, entry.chat_interaction_id, float(similarities[best]))
+
+            self.stats.misses += 1
+            return None
+
+    def store(
+        self,
+        vector: np.ndarray,
+        prompt: str,
+        answer: str,
+        scope: Scope,
+        chat_interaction_id: int | None = None,
+    ) -> None:
+        with self._lock:
+            self._entries[self._next_key] = _Entry(
+                vector=np.asarray(vector, dtype=np.float32),
+                prompt=prompt,
+                answer=answer,
+                chat_interaction_id=chat_interaction_id,
+                scope=scope,
+                created_at=self._clock(),
+            )
+            self._next_key += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats.evictions += 1
+
+    def invalidate_sources(self, source_ids: Iterable[int]) -> int:
+        """Drop answers generated from any of these sources, e.g. after a document was re-chunked or deleted.
+
+        Returns:
+            The number of answers dropped
+        """
+        source_ids = set(source_ids)
+        with self._lock:
+            stale = [key for key, entry in self._entries.items() if entry.scope[2] & source_ids]
+            for key in stale:
+                del self._entries[key]
+            return len(stale)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+_answer_cache: AnswerCache | None = None
+
+
+def get_answer_cache() -> AnswerCache:
+    global _answer_cache
+    if _answer_cache is None:
+        _answer_cache = AnswerCache()
+    return _answer_cache
@@ -0,0 +1,120 @@
+import gzip
+import os
+import tempfile
+from pathlib import Path
+from typing import BinaryIO, Callable, Literal
+
+from sqlmodel import Session, select
+
+from runbook.db_models import DocumentSource
+from runbook.db_ops import with_session
+from runbook.rag_tools.rag_fetch import content_hash
+from rxconstants import rag_docs_file_dir
+
+BodyKind = Literal["raw", "content", "parsed"]
+
+# blob hash column and the legacy inline column for each kind of document body
+BODY_FIELDS: dict[str, tuple[str, str | None]] = {
+    "raw": ("raw_blob", None),
+    "content": ("content_blob", "content"),
+    "parsed": ("parsed_blob", "parsed_content"),
+}
+
+
+def atomic_write(path: Path, write: Callable[[BinaryIO], object]) -> None:
+    """Write a file via a temp file and rename so concurrent writers/readers never see a partial file."""
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            write(f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+class BlobStore:
+    """Content-addressed, gzip compressed file store for document bodies.
+
+    Blobs are named by the sha256 of their uncompressed bytes (`<root>/ab/abcdef....gz`) so identical
+    bodies are stored once and a stored blob never changes.
+    """
+
+    def __init__(self, root: str | Path, compresslevel: int = 6):
+        self.root = Path(root)
+        self.compresslevel = compresslevel
+
+    def _path(self, key: str) -> Path:
+        return self.root / key[:2] / f"{key}.gz"
+
+    def exists(self, key: str) -> bool:
+        return self._path(key).exists()
+
+    def stored_size(self, key: str) -> int:
+        return self._path(key).stat().st_size
+
+    def put(self, data: str | bytes) -> str:
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+
+        key = content_hash(data)
+        path = self._path(key)
+        if path.exists():
+            return key
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        compressed = gzip.compress(data, compresslevel=self.compresslevel)
+        atomic_write(path, lambda f: f.write(compressed))
+        return key
+
+    def get(self, key: str) -> bytes:
+        return gzip.decompress(self._path(key).read_bytes())
+
+    def get_text(self, key: str) -> str:
+        return self.get(key).decode("utf-8")
+
+
+_blob_store: BlobStore | None = None
+
+
+def get_blob_store() -> BlobStore:
+    global _blob_store
+    if _blob_store is None:
+        _blob_store = BlobStore(Path(rag_docs_file_dir) / "blobs")
+    return _blob_store
+
+
+def document_body(source: DocumentSource, kind: BodyKind = "content") -> str:
+    """Lazily load a document body, only touching the blob store when it is actually needed.
+
+    Rows created before bodies moved to the blob store still have the body inline, that is used as a fallback.
+    """
+    blob_field, inline_field = BODY_FIELDS[kind]
+    if key := getattr(source, blob_field):
+        return get_blob_store().get_text(key)
+    return (getattr(source, inline_field) or "") if inline_field else ""
+
+
+@with_session
+def migrate_inline_bodies(*, session: Session, batch_size: int = 100) -> int:
+    """Move bodies still stored inline in DocumentSource rows into the blob store.
+
+    Returns:
+        The number of rows migrated
+    """
+    store = get_blob_store()
+    has_inline = (DocumentSource.content != "") | (DocumentSource.parsed_content != "")
+    migrated = 0
+    while rows := session.exec(select(DocumentSource).where(has_inline).limit(batch_size)).all():
+        for source in rows:
+            for blob_field, inline_field in (BODY_FIELDS["content"], BODY_FIELDS["parsed"]):
+                if body := getattr(source, inline_field):
+                    setattr(source, blob_field, store.put(body))
+                    setattr(source, inline_field, "")
+        session.commit()
+        migrated += len(rows)
+    return migrated
+
+
+if __name__ == "__main__":
+    print(f"migrated {migrate_inline_bodies()} documents into {get_blob_store().root}")
@@ -0,0 +1,286 @@
+import json
+import re
+import threading
+from collections import Counter
+from dataclasses import dataclass, replace
+from pathlib import Path
+from typing import Iterable
+
+import numpy as np
+
+from runbook.rag_tools.rag_blob import atomic_write
+from rxconstants import rag_docs_file_dir
+
+DEFAULT_TOP_K: int = 10
+BM25_K1: float = 1.2
+BM25_B: float = 0.75
+COMPACT_RATIO: float = 0.3
+
+# identifiers are kept whole (`spark.sql.shuffle.partitions`, `--max-workers`, `ERR_CONN_RESET`, `/api/embed`)
+# and also indexed by their parts so `shuffle` still matches
+TOKEN_RE = re.compile(r"\w[\w.\-/:]*\w|\w")
+PART_SPLIT_RE = re.compile(r"[.\-/:_]+")
+STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from how i if in is it of on or "
+    "that the this to was what when with you".split()
+)
+
+
+def tokenize(text: str) -> list[str]:
+    tokens = []
+    for token in TOKEN_RE.findall(text.lower()):
+        if token not in STOPWORDS:
+            tokens.append(token)
+        parts = PART_SPLIT_RE.split(token)
+        if len(parts) > 1:
+            tokens.extend(part for part in parts if part and part not in STOPWORDS)
+    return tokens
+
+
+@dataclass(frozen=True)
+class _Postings:
+    """Immutable index state, the postings of term `t` are `rows/tfs[offsets[t]:offsets[t + 1]]` (CSR layout)."""
+
+    vocab: dict[str, int]
+    offsets: np.ndarray  # (terms + 1,) int64
+    rows: np.ndarray  # (postings,) int32 document row, ascending within a term
+    tfs: np.ndarray  # (postings,) uint16 term frequency
+    doc_lens: np.ndarray  # (docs,) int32 tokens per document
+    chunk_ids: np.ndarray  # (docs,) int64
+    source_ids: np.ndarray  # (docs,) int64
+    alive: np.ndarray  # (docs,) bool, False for soft deleted rows
+
+    @property
+    def num_terms(self) -> int:
+        return len(self.offsets) - 1
+
+
+def _empty_postings() -> _Postings:
+    return _Postings(
+        vocab={},
+        offsets=np.zeros(1, dtype=np.int64),
+        rows=np.empty(0, dtype=np.int32),
+        tfs=np.empty(0, dtype=np.uint16),
+        doc_lens=np.empty(0, dtype=np.int32),
+        chunk_ids=np.empty(0, dtype=np.int64),
+        source_ids=np.empty(0, dtype=np.int64),
+        alive=np.empty(0, dtype=bool),
+    )
+
+
+ARRAY_FIELDS = ("offsets", "rows", "tfs", "doc_lens", "chunk_ids", "source_ids", "alive")
+
+
+class BM25Index:
+    """In-process BM25 keyword index over document chunks.
+
+    Postings are stored per term as contiguous numpy slices (CSR), so a query touches only the postings of
+    its own terms and scores them with a few vectorized operations. Adding documents merges their postings
+    into place, deleting a source only masks its rows until enough are dead to be worth compacting.
+
+    Readers work on an immutable snapshot, writers (add/remove) are serialized with a lock and persist the
+    index under `root` as .npy arrays plus the vocabulary. Like `VectorIndex`, every save writes its files
+    under a new generation (`rows.<n>.npy`, `vocab.<n>.json`, ...) and then swaps `meta.json`, which lists the
+    files in use, so a crash or a concurrent load never pairs offsets, postings and vocabulary of two saves.
+    """
+
+    def __init__(self, root: str | Path, k1: float = BM25_K1, b: float = BM25_B, compact_ratio: float = COMPACT_RATIO):
+        self.root = Path(root)
+        self.k1, self.b = k1, b
+        self.compact_ratio = compact_ratio
+        self._lock = threading.Lock()
+        self._postings = _empty_postings()
+        self._generation = 0
+        self._files: dict[str, str] = {}
+        self._load()
+
+    def __len__(self) -> int:
+        return int(self._postings.alive.sum())
+
+    @property
+    def num_postings(self) -> int:
+        return len(self._postings.rows)
+
+    def _load(self) -> None:
+        meta_path = self.root / "meta.json"
+        if meta_path.exists():
+            meta = json.loads(meta_path.read_text())
+            self._generation, self._files = meta["generation"], meta["files"]
+        elif (self.root / "vocab.json").exists():
+            # written before generations were introduced, the files are unversioned
+            self._files = {name: f"{name}.npy" for name in ARRAY_FIELDS} | {"vocab": "vocab.json"}
+        else:
+            return
+        terms = json.loads((self.root / self._files["vocab"]).read_text())
+        arrays = {name: np.load(self.root / self._files[name]) for name in ARRAY_FIELDS}
+        self._postings = _Postings(vocab={term: i for i, term in enumerate(terms)}, **arrays)
+        self._remove_unused_files()
+
+    def _save(self, postings: _Postings) -> None:
+        self.root.mkdir(parents=True, exist_ok=True)
+        generation = self._generation + 1
+        files = {}
+        for name in ARRAY_FIELDS:
+            array = getattr(postings, name)
+            files[name] = f"{name}.{generation}.npy"
+            atomic_write(self.root / files[name], lambda f, array=array: np.save(f, array))
+        # dicts keep insertion order, which is term id order
+        vocab = json.dumps(list(postings.vocab)).encode()
+        files["vocab"] = f"vocab.{generation}.json"
+        atomic_write(self.root / files["vocab"], lambda f: f.write(vocab))
+        meta = json.dumps({"generation": generation, "files": files}).encode()
+        atomic_write(self.root / "meta.json", lambda f: f.write(meta))
+
+        self._generation, self._files, self._postings = generation, files, postings
+        self._remove_unused_files()
+
+    def _remove_unused_files(self) -> None:
+        """Delete the files of earlier generations, and of a save interrupted before it swapped `meta.json`."""
+        used = {*self._files.values(), "meta.json"}
+        for path in self.root.iterdir():
+            if path.is_file() and path.name not in used and path.suffix in (".npy", ".json", ".tmp"):
+                path.unlink(missing_ok=True)
+
+    def indexed_sources(self) -> set[int]:
+        postings = self._postings
+        return set(np.unique(postings.source_ids[postings.alive]).tolist())
+
+    def add(self, chunk_ids: list[int], source_ids: list[int], texts: list[str]) -> None:
+        """Index documents, their postings are merged into the existing term lists."""
+        if not texts:
+            return
+
+        with self._lock:
+            old = self._postings
+            vocab = dict(old.vocab)
+            term_ids: list[int] = []
+            rows: list[int] = []
+            tfs: list[int] = []
+            doc_lens = np.empty(len(texts), dtype=np.int32)
+
+            for i, text in enumerate(texts):
+                tokens = tokenize(text)
+                doc_lens[i] = len(tokens)
+                for term, tf in Counter(tokens).items():
+                    term_ids.append(vocab.setdefault(term, len(vocab)))
+                    rows.append(len(old.doc_lens) + i)
+                    tfs.append(min(tf, np.iinfo(np.uint16).max))
+
+            # new postings go at the end of their term's list (their rows are the largest), new terms at the end
+            term_ids_arr = np.asarray(term_ids, dtype=np.int64)
+            order = np.argsort(term_ids_arr, kind="stable")
+            term_ids_arr = term_ids_arr[order]
+            ends = np.concatenate([old.offsets, np.full(len(vocab) - old.num_terms, old.offsets[-1])])
+            insert_at = ends[term_ids_arr + 1]
+
+            counts = np.diff(old.offsets)
+            counts = np.concatenate([counts, np.zeros(len(vocab) - old.num_terms, dtype=np.int64)])
+            counts += np.bincount(term_ids_arr, minlength=len(vocab))
+
+            self._save(
+                _Postings(
+                    vocab=vocab,
+                    offsets=np.concatenate([[0], np.cumsum(counts)]).astype(np.int64),
+                    rows=np.insert(old.rows, insert_at, np.asarray(rows, dtype=np.int32)[order]),
+                    tfs=np.insert(old.tfs, insert_at, np.asarray(tfs, dtype=np.uint16)[order]),
+                    doc_lens=np.concatenate([old.doc_lens, doc_lens]),
+                    chunk_ids=np.concatenate([old.chunk_ids, np.asarray(chunk_ids, dtype=np.int64)]),
+                    source_ids=np.concatenate([old.source_ids, np.asarray(source_ids, dtype=np.int64)]),
+                    alive=np.concatenate([old.alive, np.ones(len(texts), dtype=bool)]),
+                )
+            )
+
+    def remove_sources(self, source_ids: Iterable[int]) -> int:
+        """Soft delete all documents of sources, compacting once enough rows are dead.
+
+        Returns:
+            The number of documents removed
+        """
+        with self._lock:
+            old = self._postings
+            removed = np.isin(old.source_ids, list(source_ids)) & old.alive
+            if not removed.any():
+                return 0
+
+            alive = old.alive & ~removed
+            postings = replace(old, alive=alive)
+            if (~alive).sum() > self.compact_ratio * len(alive):
+                postings = self._compacted(postings)
+            self._save(postings)
+            return int(removed.sum())
+
+    @staticmethod
+    def _compacted(old: _Postings) -> _Postings:
+        keep_posting = old.alive[old.rows]
+        new_row = np.cumsum(old.alive, dtype=np.int64) - 1
+        term_of_posting = np.repeat(np.arange(old.num_terms), np.diff(old.offsets))
+        counts = np.bincount(term_of_posting[keep_posting], minlength=old.num_terms)
+        return _Postings(
+            vocab=old.vocab,
+            offsets=np.concatenate([[0], np.cumsum(counts)]).astype(np.int64),
+            rows=new_row[old.rows[keep_posting]].astype(np.int32),
+            tfs=old.tfs[keep_posting],
+            doc_lens=old.doc_lens[old.alive],
+            chunk_ids=old.chunk_ids[old.alive],
+            source_ids=old.source_ids[old.alive],
+            alive=np.ones(int(old.alive.sum()), dtype=bool),
+        )
+
+    def search(
+        self, query: str, k: int = DEFAULT_TOP_K, source_ids: Iterable[int] | None = None
+    ) -> list[tuple[int, float]]:
+        """Top-k chunks by BM25 score.
+
+        Args:
+            query: Query text, tokenized like the documents
+            k: Number of results
+            source_ids: Only search chunks of these sources
+
+        Returns:
+            (chunk id, score) pairs, best first
+        """
+        postings = self._postings
+        alive = postings.alive
+        num_docs = int(alive.sum())
+        term_ids = {postings.vocab[term] for term in tokenize(query) if term in postings.vocab}
+        if not num_docs or not term_ids:
+            return []
+
+        avg_len = float(postings.doc_lens[alive].mean()) or 1.0
+        scores = np.zeros(len(alive), dtype=np.float32)
+        for term_id in term_ids:
+            start, end = postings.offsets[term_id], postings.offsets[term_id + 1]
+            rows, tfs = postings.rows[start:end], postings.tfs[start:end].astype(np.float32)
+            if not (doc_freq := int(alive[rows].sum())):
+                continue
+            idf = np.log1p((num_docs - doc_freq + 0.5) / (doc_freq + 0.5))
+            norm = self.k1 * (1 - self.b + self.b * postings.doc_lens[rows] / avg_len)
+            scores[rows] += idf * tfs * (self.k1 + 1) / (tfs + norm)
+
+        mask = alive & (scores > 0)
+        if source_ids is not None:
+            mask &= np.isin(postings.source_ids, list(source_ids))
+        candidates = np.flatnonzero(mask)
+        if (k := min(k, len(candidates))) == 0:
+            return []
+
+        top = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+        top = top[np.argsort(-scores[top])]
+        return [(int(postings.chunk_ids[row]), float(scores[row])) for row in top]
+
+
+_keyword_index: BM25Index | None = None
+
+
+def get_keyword_index() -> BM25Index:
+    global _keyword_index
+    if _keyword_index is None:
+        _keyword_index = BM25Index(Path(rag_docs_file_dir) / "bm25")
+    return _keyword_index
+
+
+def keyword_search(
+    query: str, k: int = DEFAULT_TOP_K, source_ids: Iterable[int] | None = None
+) -> list[tuple[int, float]]:
+    """The (chunk id, score) of the k chunks best matching a query by BM25."""
+    return get_keyword_index().search(query, k=k, source_ids=source_ids)
@@ -0,0 +1,124 @@
+import re
+from dataclasses import dataclass
+from typing import Iterator
+
+from runbook.rag_tools.rag_fetch import content_hash
+from runbook.utils import estimate_tokens
+
+DEFAULT_CHUNK_TOKENS: int = 300
+DEFAULT_OVERLAP_TOKENS: int = 50
+
+HEADING_RE = re.compile(r"^(#{1,6}) +(.+?)\s*#*\s*$")
+
+
+@dataclass
+class Chunk:
+    index: int
+    text: str
+    heading: str
+    start: int
+    end: int
+    num_tokens: int
+
+
+def chunk_hash(markdown: str, max_tokens: int, overlap_tokens: int) -> str:
+    return content_hash(f"{max_tokens}:{overlap_tokens}:{markdown}")
+
+
+def _blocks(markdown: str) -> Iterator[tuple[int, int]]:
+    """Yield (start, end) offsets of blank-line separated blocks, code fences are never split."""
+    pos = 0
+    block_start: int | None = None
+    block_end = 0
+    in_fence = False
+
+    for line in markdown.splitlines(keepends=True):
+        stripped = line.strip()
+        if stripped.startswith("```"):
+            in_fence = not in_fence
+
+        if not stripped and not in_fence:
+            if block_start is not None:
+                yield block_start, block_end
+            block_start = None
+        else:
+            if block_start is None:
+                block_start = pos
+            block_end = pos + len(line.rstrip("\r\n"))
+        pos += len(line)
+
+    if block_start is not None:
+        yield block_start, block_end
+
+
+def chunk_markdown(
+    markdown: str,
+    max_tokens: int = DEFAULT_CHUNK_TOKENS,
+    overlap_tokens: int = DEFAULT_OVERLAP_TOKENS,
+) -> list[Chunk]:
+    """Split markdown into heading-aware, token-budgeted chunks with overlap.
+
+    Chunks never span a heading, so each chunk belongs to exactly one section and records its heading path.
+    Within a section, blocks are packed up to `max_tokens` and the trailing blocks (up to `overlap_tokens`)
+    of a chunk are repeated at the start of the next one. Each chunk's text is `markdown[start:end]`.
+    """
+    chunks: list[Chunk] = []
+    headings: list[tuple[int, str]] = []
+    current: list[tuple[int, int]] = []
+
+    def span_tokens(spans: list[tuple[int, int]]) -> int:
+        return estimate_tokens(markdown[spans[0][0] : spans[-1][1]]) if spans else 0
+
+    def emit(start: int, end: int) -> None:
+        text = markdown[start:end]
+        chunks.append(
+            Chunk(
+                index=len(chunks),
+                text=text,
+                heading=" > ".join(title for _, title in headings),
+                start=start,
+                end=end,
+                num_tokens=estimate_tokens(text),
+            )
+        )
+
+    def flush() -> None:
+        nonlocal current
+        if current:
+            emit(current[0][0], current[-1][1])
+        current = []
+
+    for start, end in _blocks(markdown):
+        text = markdown[start:end]
+
+        if match := HEADING_RE.match(text):
+            flush()
+            level = len(match.group(1))
+            while headings and headings[-1][0] >= level:
+                headings.pop()
+            headings.append((level, match.group(2)))
+            current = [(start, end)]
+            continue
+
+        if estimate_tokens(text) > max_tokens:
+            # a single oversized block (e.g. a huge code listing) is cut into fixed size pieces
+            flush()
+            size = max_tokens * 4
+            for piece_start in range(start, end, size):
+                emit(piece_start, min(piece_start + size, end))
+            continue
+
+        if current and span_tokens([*current, (start, end)]) > max_tokens:
+            carry: list[tuple[int, int]] = []
+            for span in reversed(current[1:] if len(current) > 1 else []):
+                if span_tokens([span, *carry]) > overlap_tokens:
+                    break
+                carry.insert(0, span)
+            flush()
+            if carry and span_tokens([*carry, (start, end)]) <= max_tokens:
+                current = carry
+
+        current.append((start, end))
+
+    flush()
+    return chunks
@@ -0,0 +1,207 @@
+import asyncio
+import time
+import xml.etree.ElementTree as ET
+from dataclasses import asdict, dataclass, field
+from typing import Callable
+from urllib.parse import urldefrag, urljoin, urlparse
+
+from bs4 import BeautifulSoup
+
+from runbook.db_models import ContentType, DocumentSource
+from runbook.rag_tools.rag_db import document_exists_in_db
+from runbook.rag_tools.rag_fetch import AsyncFetcher, cache_validators, get_fetcher, host_key
+from runbook.rag_tools.rag_parse import source_from_html
+from runbook.rag_tools.rag_pipeline import ingest_documents
+
+DEFAULT_MAX_PAGES: int = 500
+DEFAULT_MAX_WORKERS: int = 8
+DEFAULT_POLITENESS_DELAY: float = 0.25  # seconds between requests to the same host
+DEFAULT_BATCH_SIZE: int = 25
+
+
+@dataclass
+class CrawlProgress:
+    discovered: int = 0
+    fetched: int = 0
+    saved: int = 0
+    skipped: int = 0
+    failed: int = 0
+    started_at: float = field(default_factory=time.monotonic)
+    finished_at: float | None = None
+
+    @property
+    def elapsed(self) -> float:
+        return (self.finished_at or time.monotonic()) - self.started_at
+
+    @property
+    def pages_per_sec(self) -> float:
+        return self.fetched / self.elapsed if self.elapsed > 0 else 0.0
+
+    def as_dict(self) -> dict[str, int | float]:
+        return {
+            **{k: v for k, v in asdict(self).items() if k not in ("started_at", "finished_at")},
+            "elapsed": round(self.elapsed, 2),
+            "pages_per_sec": round(self.pages_per_sec, 2),
+        }
+
+
+def is_sitemap_url(url: str) -> bool:
+    path = urlparse(url).path.lower()
+    return path.endswith(".xml") or "sitemap" in path.rsplit("/", 1)[-1]
+
+
+def parse_sitemap(data: str) -> tuple[list[str], bool]:
+    """Parse a sitemap or sitemap index.
+
+    Returns:
+        Tuple of (urls, is_index) where `is_index` means the urls are themselves sitemaps
+    """
+    root = ET.fromstring(data.strip())
+    locs = [el.text.strip() for el in root.iter() if el.tag.endswith("loc") and el.text]
+    return locs, root.tag.endswith("sitemapindex")
+
+
+def default_prefix(seed: str) -> str:
+    """Links are only followed if they are under the seed's directory (or host for sitemaps)."""
+    parsed = urlparse(seed)
+    if is_sitemap_url(seed):
+        return f"{parsed.scheme}://{parsed.netloc}/"
+    return f"{parsed.scheme}://{parsed.netloc}{parsed.path.rsplit('/', 1)[0]}/"
+
+
+def extract_links(base_url: str, html: str, prefix: str) -> list[str]:
+    soup = BeautifulSoup(html, "html.parser")
+    links = []
+    for a in soup.find_all("a", href=True):
+        url, _ = urldefrag(urljoin(base_url, a["href"]))
+        if url.startswith(prefix):
+            links.append(url)
+    return list(dict.fromkeys(links))
+
+
+class DocsCrawler:
+    """Breadth-first crawler that bulk-ingests a documentation site.
+
+    Starts from a seed page or sitemap.xml, follows links under `prefix` with a bounded pool of
+    workers, waits `politeness_delay` between requests to the same host, skips pages that already
+    exist, and writes new DocumentSource rows in batches of `batch_size`.
+
+    Example:
+        crawler = DocsCrawler("https://docs.example.com/en/", max_pages=100)
+        progress = await crawler.run()
+    """
+
+    def __init__(
+        self,
+        seed: str,
+        *,
+        prefix: str | None = None,
+        max_pages: int = DEFAULT_MAX_PAGES,
+        max_workers: int = DEFAULT_MAX_WORKERS,
+        politeness_delay: float = DEFAULT_POLITENESS_DELAY,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        content_type: ContentType = ContentType.DEFAULT,
+        fetcher: AsyncFetcher | None = None,
+        exists_fn: Callable[[str], bool] = document_exists_in_db,
+        save_batch_fn: Callable[[list[DocumentSource]], int] = ingest_documents,
+    ):
+        self.seed = seed
+        self.prefix = prefix or default_prefix(seed)
+        self.max_pages = max_pages
+        self.max_workers = max_workers
+        self.politeness_delay = politeness_delay
+        self.batch_size = batch_size
+        self.content_type = content_type
+
+        self.fetcher = fetcher or get_fetcher()
+        self.exists_fn = exists_fn
+        self.save_batch_fn = save_batch_fn
+
+        self.progress = CrawlProgress()
+
+        self._seen: set[str] = set()
+        self._batch: list[DocumentSource] = []
+        self._batch_lock = asyncio.Lock()
+        self._host_locks: dict[str, asyncio.Lock] = {}
+        self._host_next_allowed: dict[str, float] = {}
+
+    def _enqueue(self, queue: asyncio.Queue, url: str, is_sitemap: bool = False) -> None:
+        if url in self._seen or (not is_sitemap and self.progress.discovered >= self.max_pages):
+            return
+        self._seen.add(url)
+        if not is_sitemap:
+            self.progress.discovered += 1
+        queue.put_nowait((url, is_sitemap))
+
+    async def _wait_turn(self, url: str) -> None:
+        host = host_key(url)
+        lock = self._host_locks.setdefault(host, asyncio.Lock())
+        async with lock:
+            if (wait := self._host_next_allowed.get(host, 0.0) - time.monotonic()) > 0:
+                await asyncio.sleep(wait)
+            self._host_next_allowed[host] = time.monotonic() + self.politeness_delay
+
+    async def _flush(self, force: bool = False) -> None:
+        async with self._batch_lock:
+            if not self._batch or (not force and len(self._batch) < self.batch_size):
+                return
+            batch, self._batch = self._batch, []
+            self.progress.saved += await asyncio.to_thread(self.save_batch_fn, batch)
+
+    async def _process(self, queue: asyncio.Queue, url: str, is_sitemap: bool) -> None:
+        # pages already in the library are still fetched so their links are followed, just never re-saved
+        exists = not is_sitemap and await asyncio.to_thread(self.exists_fn, url)
+
+        await self._wait_turn(url)
+        result = await self.fetcher.fetch(url)
+
+        if not result.ok:
+            self.progress.failed += 1
+            return
+
+        if is_sitemap:
+            urls, is_index = parse_sitemap(result.content)
+            for loc in urls:
+                self._enqueue(queue, loc, is_sitemap=is_index)
+            return
+
+        self.progress.fetched += 1
+
+        for link in await asyncio.to_thread(extract_links, url, result.content, self.prefix):
+            self._enqueue(queue, link)
+
+        if exists:
+            self.progress.skipped += 1
+            return
+
+        source = await asyncio.to_thread(source_from_html, url, result.content, self.content_type)
+        source.meta = {**source.meta, **cache_validators(result)}
+        self._batch.append(source)
+        await self._flush()
+
+    async def _worker(self, queue: asyncio.Queue) -> None:
+        while True:
+            url, is_sitemap = await queue.get()
+            try:
+                await self._process(queue, url, is_sitemap)
+            except Exception as err:
+                print(f"Error crawling {url}: {err}")
+                self.progress.failed += 1
+            finally:
+                queue.task_done()
+
+    async def run(self) -> CrawlProgress:
+        queue: asyncio.Queue[tuple[str, bool]] = asyncio.Queue()
+        self._enqueue(queue, self.seed, is_sitemap=is_sitemap_url(self.seed))
+
+        workers = [asyncio.create_task(self._worker(queue)) for _ in range(self.max_workers)]
+        try:
+            await queue.join()
+        finally:
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            await self._flush(force=True)
+            self.progress.finished_at = time.monotonic()
+
+        return self.progress
@@ -1,7 +1,12 @@
-from sqlmodel import Session, select
+from datetime import datetime
 
-from runbook.db_models import DocumentSource
+from sqlalchemy import and_, or_, update
+from sqlmodel import Session, col, delete, select
+
+from runbook.db_models import DocumentChunk, DocumentSource
 from runbook.db_ops import with_session
+from runbook.rag_tools.rag_blob import get_blob_store
+from rxconstants import tz
 
 
 @with_session
@@ -27,7 +32,7 @@ def save_document_to_db(
         SQLAlchemyError: If there's an error saving to the database
     """
     try:
-        page = Document(content=content, title=title, path=url)
+        page = DocumentSource(content_blob=get_blob_store().put(content), title=title, path=url)
         session.add(page)
         session.commit()
         session.refresh(page)
@@ -38,6 +43,27 @@ def save_document_to_db(
         raise err
 
 
+@with_session
+def save_documents_to_db(sources: list[DocumentSource], *, session: Session) -> list[int]:
+    """Save many DocumentSource rows in a single transaction.
+
+    Args:
+        sources: The DocumentSource rows to insert
+        session: Database session
+
+    Returns:
+        The ids of the saved rows
+    """
+    try:
+        session.add_all(sources)
+        session.commit()
+        return [source.id for source in sources]
+    except Exception as err:
+        print(f"Error saving documents to db: {err}")
+        session.rollback()
+        raise err
+
+
 @with_session
 def load_documents_from_db(*, session: Session) -> list[DocumentSource]:
     """Load all documents from the database.
@@ -80,3 +106,183 @@ def document_exists_in_db(url: str, *, session: Session) -> bool:
     except Exception as err:
         print(f"Error checking document existence in db: {err}")
         return False
+
+
+@with_session
+def load_refresh_candidates(
+    *,
+    session: Session,
+    source_ids: list[int] | None = None,
+    checked_before: datetime | None = None,
+    after_id: int = 0,
+    limit: int = 200,
+) -> list[tuple[int, str, dict]]:
+    """Load (id, path, meta) for non-deleted sources, without loading the document bodies.
+
+    Args:
+        session: Database session
+        source_ids: Only these sources
+        checked_before: Only sources last re-fetched before this time, or never re-fetched and last updated
+            before it
+        after_id: Keyset pagination cursor, only ids greater than this are returned
+        limit: Maximum number of rows
+
+    Returns:
+        List of (id, path, meta) tuples ordered by id
+    """
+    query = (
+        select(DocumentSource.id, DocumentSource.path, DocumentSource.meta)
+        .where(DocumentSource.is_deleted == False, col(DocumentSource.id) > after_id)
+        .order_by(DocumentSource.id)
+        .limit(limit)
+    )
+    if source_ids is not None:
+        query = query.where(col(DocumentSource.id).in_(source_ids))
+    if checked_before is not None:
+        query = query.where(
+            or_(
+                DocumentSource.checked_at < checked_before,
+                and_(col(DocumentSource.checked_at).is_(None), DocumentSource.updated_at < checked_before),
+            )
+        )
+
+    return [(row[0], row[1], row[2] or {}) for row in session.exec(query).all()]
+
+
+@with_session
+def mark_sources_checked(source_ids: list[int], *, session: Session) -> int:
+    """Set `checked_at` of sources to now, in one statement.
+
+    Args:
+        source_ids: The re-fetched sources
+        session: Database session
+
+    Returns:
+        The number of rows updated
+    """
+    result = session.execute(
+        update(DocumentSource).where(col(DocumentSource.id).in_(source_ids)).values(checked_at=datetime.now(tz=tz))
+    )
+    session.commit()
+    return result.rowcount
+
+
+@with_session
+def update_document_contents(updates: dict[int, dict], *, session: Session) -> int:
+    """Replace the content of changed sources in one transaction and invalidate derived content.
+
+    Args:
+        updates: Mapping of source id to the fields to set (content_blob, raw_blob, meta)
+        session: Database session
+
+    Returns:
+        The number of rows updated
+    """
+    try:
+        updated = 0
+        for source_id, fields in updates.items():
+            if source := session.get(DocumentSource, source_id):
+                for field_name, value in fields.items():
+                    setattr(source, field_name, value)
+                source.parsed_blob = None
+                source.parsed_content = ""
+                source.updated_at = datetime.now(tz=tz)
+                updated += 1
+        session.commit()
+        return updated
+    except Exception as err:
+        print(f"Error updating documents in db: {err}")
+        session.rollback()
+        raise err
+
+
+@with_session
+def update_document_meta(source_id: int, updates: dict, *, session: Session) -> dict:
+    """Merge `updates` into a source's meta, keys with a None value are removed.
+
+    Args:
+        source_id: The DocumentSource id
+        updates: Keys to set (or remove if None)
+        session: Database session
+
+    Returns:
+        The updated meta
+    """
+    source = session.get(DocumentSource, source_id)
+    meta = {**(source.meta or {}), **updates}
+    source.meta = {key: value for key, value in meta.items() if value is not None}
+    session.commit()
+    return source.meta
+
+
+@with_session
+def save_parsed_content(
+    source_id: int,
+    parsed_content: str,
+    *,
+    session: Session,
+    meta_updates: dict | None = None,
+) -> None:
+    """Store the parsed (markdown) content of a source, optionally updating meta in the same transaction."""
+    source = session.get(DocumentSource, source_id)
+    source.parsed_blob = get_blob_store().put(parsed_content)
+    source.parsed_content = ""
+    if meta_updates:
+        meta = {**(source.meta or {}), **meta_updates}
+        source.meta = {key: value for key, value in meta.items() if value is not None}
+    session.commit()
+
+
+@with_session
+def get_chunk_source_hash(source_id: int, *, session: Session) -> str | None:
+    """The `source_hash` the current chunks of a source were built from, None if it has no chunks."""
+    query = select(DocumentChunk.source_hash).where(DocumentChunk.source_id == source_id).limit(1)
+    return session.exec(query).first()
+
+
+@with_session
+def replace_document_chunks(source_id: int, chunks: list[DocumentChunk], *, session: Session) -> int:
+    """Replace all chunks of a source in one transaction.
+
+    Args:
+        source_id: The DocumentSource id
+        chunks: The new chunks
+        session: Database session
+
+    Returns:
+        The number of chunks saved
+    """
+    try:
+        session.exec(delete(DocumentChunk).where(DocumentChunk.source_id == source_id))
+        session.add_all(chunks)
+        session.commit()
+        return len(chunks)
+    except Exception as err:
+        print(f"Error saving chunks to db: {err}")
+        session.rollback()
+        raise err
+
+
+@with_session
+def load_document_chunks(source_ids: list[int], *, session: Session) -> list[DocumentChunk]:
+    query = (
+        select(DocumentChunk)
+        .where(col(DocumentChunk.source_id).in_(source_ids))
+        .order_by(DocumentChunk.source_id, DocumentChunk.chunk_index)
+    )
+    return list(session.exec(query).all())
+
+
+@with_session
+def load_chunks_with_sources(chunk_ids: list[int], *, session: Session) -> list[tuple[DocumentChunk, str | None, str]]:
+    """Load chunks by id with their source's title and path, skipping chunks of deleted sources.
+
+    Returns:
+        (chunk, title, path) tuples, in no particular order
+    """
+    query = (
+        select(DocumentChunk, DocumentSource.title, DocumentSource.path)
+        .join(DocumentSource, DocumentChunk.source_id == DocumentSource.id)
+        .where(col(DocumentChunk.id).in_(chunk_ids), DocumentSource.is_deleted == False)
+    )
+    return [(row[0], row[1], row[2]) for row in session.exec(query).all()]
@@ -1,5 +1,7 @@
+from dataclasses import dataclass
 from enum import StrEnum, auto
 
+from runbook.db_models import DocumentSource
 from rxconstants import rag_docs_storage_type
 
 
@@ -9,3 +11,24 @@ class StorageType(StrEnum):
 
 
 storage_type: StorageType = StorageType(rag_docs_storage_type)
+
+
+class ParseMode(StrEnum):
+    LOCAL = auto()  # deterministic html -> markdown only
+    POLISH = auto()  # local conversion, then the LLM cleans up the markdown
+    LLM = auto()  # the LLM converts the html directly
+
+
+@dataclass
+class IngestResult:
+    """Per-URL outcome of fetching a document source."""
+
+    url: str
+    source: DocumentSource | None = None
+    error: str | None = None
+    status_code: int | None = None
+    elapsed: float = 0.0
+
+    @property
+    def ok(self) -> bool:
+        return self.source is not None and self.error is None
@@ -0,0 +1,89 @@
+import re
+from typing import Protocol
+
+import numpy as np
+import ollama
+
+from runbook.rag_tools.rag_fetch import content_hash
+
+DEFAULT_BATCH_SIZE: int = 64
+HASH_EMBED_DIM: int = 256
+
+TOKEN_RE = re.compile(r"\w+")
+
+
+class Embedder(Protocol):
+    model: str
+
+    def embed(self, texts: list[str]) -> np.ndarray:
+        """Embed texts into a (len(texts), dim) float32 matrix of L2 normalized rows."""
+        ...
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    """L2 normalize rows in place so cosine similarity is a plain dot product."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    np.divide(vectors, norms, out=vectors, where=norms > 0)
+    return vectors
+
+
+class OllamaEmbedder:
+    """Embeddings from ollama's `/api/embed`, sending `batch_size` texts per request."""
+
+    def __init__(
+        self,
+        model: str | None = None,
+        base_url: str | None = None,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+    ):
+        # llm_tools imports rag_tools (prompts), import it lazily to avoid the cycle
+        from runbook.llm_tools import LLMConfig, ollama_host
+
+        self.model = model or LLMConfig.ai_embed_model
+        self.batch_size = batch_size
+        self.client = ollama.Client(host=ollama_host(base_url or LLMConfig.ai_provider_url))
+
+    def embed(self, texts: list[str]) -> np.ndarray:
+        batches = []
+        for i in range(0, len(texts), self.batch_size):
+            resp = self.client.embed(model=self.model, input=texts[i : i + self.batch_size])
+            batches.append(np.asarray(resp.embeddings, dtype=np.float32))
+        if not batches:
+            return np.empty((0, 0), dtype=np.float32)
+        return normalize(np.concatenate(batches))
+
+
+class HashEmbedder:
+    """Deterministic bag-of-words embedder (signed feature hashing), for tests and running without a model server.
+
+    Only captures lexical overlap, texts sharing words end up close together.
+    """
+
+    def __init__(self, dim: int = HASH_EMBED_DIM):
+        self.dim = dim
+        self.model = f"hash-{dim}"
+
+    def _bucket(self, token: str) -> tuple[int, float]:
+        digest = int(content_hash(token)[:16], 16)
+        return digest % self.dim, 1.0 if (digest >> 63) & 1 else -1.0
+
+    def embed(self, texts: list[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for token in TOKEN_RE.findall(text.lower()):
+                col, sign = self._bucket(token)
+                vectors[row, col] += sign
+        return normalize(vectors)
+
+
+_embedder: Embedder | None = None
+
+
+def get_embedder() -> Embedder:
+    global _embedder
+    if _embedder is None:
+        from runbook.llm_tools import LLMConfig
+
+        _embedder = HashEmbedder() if LLMConfig.ai_embed_provider == "hash" else OllamaEmbedder()
+    return _embedder
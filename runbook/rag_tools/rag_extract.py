@@ -0,0 +1,96 @@
+import re
+
+from bs4 import BeautifulSoup, Comment, Tag
+
+from runbook.rag_tools.rag_markdown import LANGUAGE_CLASS_RE, SKIP_TAGS
+
+BOILERPLATE_TAGS = ["nav", "aside", "form", "dialog"]
+PAGE_CHROME_TAGS = ["header", "footer"]  # only removed when they are not part of the main content
+BOILERPLATE_ROLES = {"navigation", "banner", "contentinfo", "complementary", "search", "dialog"}
+BOILERPLATE_RE = re.compile(
+    r"(^|[-_\s])(nav|navbar|menu|sidebar|side-bar|breadcrumbs?|footer|cookie|consent|banner|toc|"
+    r"table-of-contents|share|social|advert|ads|promo|related|feedback|edit-?page|skip-?link|pagination)($|[-_\s])",
+    re.IGNORECASE,
+)
+MAIN_SELECTORS = ["main", "[role=main]", "article", "#content", "#main-content", ".main-content"]
+CONTENT_TAGS = ["p", "pre", "li", "table", "dd", "blockquote"]
+KEEP_ATTRS = {"href", "src", "alt", "colspan", "rowspan", "start"}
+MIN_TEXT_LEN = 25
+
+
+def _text_len(tag: Tag) -> int:
+    return len(tag.get_text(" ", strip=True))
+
+
+def _is_boilerplate(tag: Tag) -> bool:
+    if tag.get("role") in BOILERPLATE_ROLES:
+        return True
+    names = " ".join([*(tag.get("class") or []), tag.get("id") or ""])
+    return bool(names.strip()) and bool(BOILERPLATE_RE.search(names))
+
+
+def _best_by_density(root: Tag) -> Tag:
+    """Pick the element holding the most non-link text (readability style parent scoring)."""
+    scores: dict[int, float] = {}
+    nodes: dict[int, Tag] = {}
+
+    for node in root.find_all(CONTENT_TAGS):
+        if (text_len := _text_len(node)) < MIN_TEXT_LEN:
+            continue
+        link_len = sum(len(a.get_text(" ", strip=True)) for a in node.find_all("a"))
+        score = text_len * (1 - link_len / text_len)
+
+        for ancestor, weight in ((node.parent, 1.0), (node.parent.parent if node.parent else None, 0.5)):
+            if isinstance(ancestor, Tag):
+                scores[id(ancestor)] = scores.get(id(ancestor), 0.0) + score * weight
+                nodes[id(ancestor)] = ancestor
+
+    if not scores:
+        return root
+    return nodes[max(scores, key=scores.get)]
+
+
+def _main_candidate(root: Tag) -> Tag:
+    for selector in MAIN_SELECTORS:
+        candidates = root.select(selector)
+        if candidates := [c for c in candidates if _text_len(c) >= MIN_TEXT_LEN]:
+            return max(candidates, key=_text_len)
+    return _best_by_density(root)
+
+
+def _strip_attrs(root: Tag) -> None:
+    for tag in [root, *root.find_all(True)]:
+        attrs = {k: v for k, v in tag.attrs.items() if k in KEEP_ATTRS}
+        # keep the language class on code blocks so markdown conversion can label fences
+        if tag.name in ("pre", "code"):
+            if langs := [cls for cls in tag.get("class") or [] if LANGUAGE_CLASS_RE.match(cls)]:
+                attrs["class"] = langs
+        tag.attrs = attrs
+
+
+def extract_main_content(soup: BeautifulSoup) -> Tag:
+    """Strip boilerplate from a parsed page and return the element holding the main content.
+
+    Scripts/styles/svg, navigation, sidebars, footers, cookie banners and similar chrome are removed,
+    the main content is found via <main>/<article>/role=main or by text density, and presentation
+    attributes are dropped. The soup is modified in place.
+    """
+    for tag in soup(list(SKIP_TAGS)):
+        tag.decompose()
+    for comment in soup.find_all(string=lambda s: isinstance(s, Comment)):
+        comment.extract()
+
+    main = _main_candidate(soup.body or soup)
+
+    main_text_len = _text_len(main)
+    for tag in main.find_all(True):
+        if tag.decomposed:
+            continue
+        is_chrome = tag.name in PAGE_CHROME_TAGS and tag.find_parent(["main", "article"]) is None
+        if is_chrome or tag.name in BOILERPLATE_TAGS or _is_boilerplate(tag):
+            # guard against a wrapper div whose class happens to look like boilerplate
+            if _text_len(tag) < main_text_len * 0.5:
+                tag.decompose()
+
+    _strip_attrs(main)
+    return main
@@ -0,0 +1,194 @@
+import asyncio
+import hashlib
+import time
+from dataclasses import dataclass, field
+from urllib.parse import urlparse
+
+import httpx
+
+DEFAULT_TIMEOUT: float = 15.0
+DEFAULT_MAX_BYTES: int = 10 * 1024 * 1024  # 10MB, docs pages larger than this are almost certainly not docs
+DEFAULT_PER_HOST_LIMIT: int = 4
+DEFAULT_MAX_CONNECTIONS: int = 32
+
+DEFAULT_HEADERS = {
+    "User-Agent": "runbook-app/0.1 (+document-library)",
+    "Accept": "text/html,application/xhtml+xml;q=0.9,*/*;q=0.8",
+}
+
+
+class FetchError(Exception):
+    """Raised when a fetched body cannot be used (too large, bad status, etc)."""
+
+
+@dataclass
+class FetchResult:
+    url: str
+    status_code: int | None = None
+    content: str | None = None
+    headers: dict[str, str] = field(default_factory=dict)
+    error: str | None = None
+    elapsed: float = 0.0
+    num_bytes: int = 0
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None and self.status_code is not None and 200 <= self.status_code < 300
+
+    @property
+    def not_modified(self) -> bool:
+        return self.error is None and self.status_code == 304
+
+
+def content_hash(content: str | bytes) -> str:
+    if isinstance(content, str):
+        content = content.encode("utf-8")
+    return hashlib.sha256(content).hexdigest()
+
+
+def cache_validators(result: FetchResult) -> dict[str, str | None]:
+    """Validators stored in `DocumentSource.meta` so later refreshes can use conditional GETs."""
+    return {
+        "etag": result.headers.get("etag"),
+        "last_modified": result.headers.get("last-modified"),
+        "content_hash": content_hash(result.content) if result.content is not None else None,
+    }
+
+
+def conditional_headers(meta: dict) -> dict[str, str]:
+    headers = {}
+    if etag := meta.get("etag"):
+        headers["If-None-Match"] = etag
+    if last_modified := meta.get("last_modified"):
+        headers["If-Modified-Since"] = last_modified
+    return headers
+
+
+def decode_body(body: bytes, charset: str | None) -> str:
+    """Decode a response body with its declared charset, utf-8 if it has none or one Python doesn't know."""
+    try:
+        return body.decode(charset or "utf-8", errors="replace")
+    except LookupError:
+        return body.decode("utf-8", errors="replace")
+
+
+def host_key(url: str) -> str:
+    return urlparse(url).netloc.lower()
+
+
+class AsyncFetcher:
+    """Pooled async HTTP fetcher with per-host concurrency caps and a body size ceiling.
+
+    A single `httpx.AsyncClient` is shared for all requests so connections are reused, and each
+    host gets its own semaphore so one docs site cannot take every connection in the pool.
+
+    Example:
+        async with AsyncFetcher() as fetcher:
+            results = await fetcher.fetch_many(["https://example.com/a", "https://example.com/b"])
+    """
+
+    def __init__(
+        self,
+        timeout: float = DEFAULT_TIMEOUT,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        per_host_limit: int = DEFAULT_PER_HOST_LIMIT,
+        max_connections: int = DEFAULT_MAX_CONNECTIONS,
+        headers: dict[str, str] | None = None,
+        client: httpx.AsyncClient | None = None,
+    ):
+        self.timeout = timeout
+        self.max_bytes = max_bytes
+        self.per_host_limit = per_host_limit
+
+        self._owns_client = client is None
+        self._client = client or httpx.AsyncClient(
+            timeout=httpx.Timeout(timeout),
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            headers={**DEFAULT_HEADERS, **(headers or {})},
+            follow_redirects=True,
+        )
+        self._host_semaphores: dict[str, asyncio.Semaphore] = {}
+
+    async def __aenter__(self) -> "AsyncFetcher":
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self.aclose()
+
+    @property
+    def is_closed(self) -> bool:
+        return self._client.is_closed
+
+    async def aclose(self) -> None:
+        if self._owns_client and not self._client.is_closed:
+            await self._client.aclose()
+
+    def _host_semaphore(self, url: str) -> asyncio.Semaphore:
+        host = host_key(url)
+        if host not in self._host_semaphores:
+            self._host_semaphores[host] = asyncio.Semaphore(self.per_host_limit)
+        return self._host_semaphores[host]
+
+    async def _read_body(self, resp: httpx.Response) -> bytes:
+        # a malformed Content-Length is ignored, the size is still capped while reading
+        content_length = resp.headers.get("content-length", "").strip()
+        if content_length.isdigit() and int(content_length) > self.max_bytes:
+            raise FetchError(f"body too large: {content_length} > {self.max_bytes} bytes")
+
+        body = bytearray()
+        async for chunk in resp.aiter_bytes():
+            body.extend(chunk)
+            if len(body) > self.max_bytes:
+                raise FetchError(f"body too large: exceeded {self.max_bytes} bytes")
+        return bytes(body)
+
+    async def fetch(self, url: str, headers: dict[str, str] | None = None) -> FetchResult:
+        """Fetch a single URL, never raising for network/HTTP errors.
+
+        Args:
+            url: URL to fetch
+            headers: Optional extra request headers
+
+        Returns:
+            FetchResult with `error` set if the fetch failed
+        """
+        result = FetchResult(url=url)
+        start = time.perf_counter()
+
+        try:
+            async with self._host_semaphore(url):
+                async with self._client.stream("GET", url, headers=headers) as resp:
+                    result.status_code = resp.status_code
+                    result.headers = dict(resp.headers)
+
+                    if resp.status_code >= 400:
+                        raise FetchError(f"HTTP {resp.status_code}")
+
+                    body = await self._read_body(resp)
+                    result.num_bytes = len(body)
+                    result.content = decode_body(body, resp.charset_encoding)
+        except httpx.TimeoutException:
+            result.error = f"timed out after {self.timeout}s"
+        except Exception as err:
+            # anything going wrong with one url (network, HTTP, a malformed stored path) is that url's result, it
+            # must not abort the other fetches gathered with it
+            result.error = str(err) or err.__class__.__name__
+        finally:
+            result.elapsed = time.perf_counter() - start
+
+        return result
+
+    async def fetch_many(self, urls: list[str], headers: dict[str, str] | None = None) -> list[FetchResult]:
+        """Fetch many URLs concurrently, results are returned in the same order as `urls`."""
+        return list(await asyncio.gather(*(self.fetch(url, headers=headers) for url in urls)))
+
+
+_shared_fetcher: AsyncFetcher | None = None
+
+
+def get_fetcher() -> AsyncFetcher:
+    """Process wide fetcher so connections are pooled across events/users."""
+    global _shared_fetcher
+    if _shared_fetcher is None or _shared_fetcher.is_closed:
+        _shared_fetcher = AsyncFetcher()
+    return _shared_fetcher
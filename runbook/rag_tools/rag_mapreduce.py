@@ -0,0 +1,144 @@
+import asyncio
+import re
+from typing import Awaitable, Callable, Iterable, Iterator
+
+from bs4 import BeautifulSoup, Comment, NavigableString, Tag
+
+from runbook.rag_tools.rag_fetch import content_hash
+from runbook.rag_tools.rag_markdown import HEADING_TAGS, SKIP_TAGS
+from runbook.utils import estimate_tokens
+
+DEFAULT_CHUNK_TOKENS: int = 2000
+DEFAULT_CONCURRENCY: int = 4
+
+CHECKPOINT_META_KEY = "parse_checkpoint"
+
+MARKDOWN_HEADING_RE = re.compile(r"^#{1,6} ")
+
+
+def _hard_split(text: str, max_tokens: int) -> list[str]:
+    size = max_tokens * 4
+    return [text[i : i + size] for i in range(0, len(text), size)]
+
+
+def _pack(units: Iterable[tuple[str, bool]], max_tokens: int, joiner: str) -> list[str]:
+    """Greedily pack (text, starts_section) units into chunks of at most `max_tokens`.
+
+    A new chunk is preferably started at a section start once the current chunk is half full, so
+    chunks line up with the document's own sections.
+    """
+    chunks: list[str] = []
+    current: list[str] = []
+    current_tokens = 0
+
+    def flush():
+        nonlocal current, current_tokens
+        if current:
+            chunks.append(joiner.join(current))
+        current, current_tokens = [], 0
+
+    for text, starts_section in units:
+        tokens = estimate_tokens(text)
+        if current_tokens + tokens > max_tokens or (starts_section and current_tokens >= max_tokens // 2):
+            flush()
+        if tokens > max_tokens:
+            chunks.extend(_hard_split(text, max_tokens))
+            continue
+        current.append(text)
+        current_tokens += tokens
+
+    flush()
+    return chunks
+
+
+def _html_units(node: Tag, max_tokens: int) -> Iterator[tuple[str, bool]]:
+    for child in node.children:
+        if isinstance(child, Comment):
+            continue
+        if isinstance(child, NavigableString):
+            if text := str(child).strip():
+                yield text, False
+            continue
+        if not isinstance(child, Tag):
+            continue
+
+        html = str(child)
+        if estimate_tokens(html) > max_tokens and child.find(True):
+            # too big to send as one piece, descend into its children
+            yield from _html_units(child, max_tokens)
+        else:
+            yield html, child.name in HEADING_TAGS
+
+
+def split_html_sections(html: str, max_tokens: int = DEFAULT_CHUNK_TOKENS) -> list[str]:
+    """Split HTML into token-budgeted chunks along DOM element boundaries, starting chunks at headings."""
+    soup = BeautifulSoup(html, "html.parser")
+    for tag in soup(list(SKIP_TAGS)):
+        tag.decompose()
+    return _pack(_html_units(soup.body or soup, max_tokens), max_tokens, joiner="\n")
+
+
+def split_markdown_sections(markdown: str, max_tokens: int = DEFAULT_CHUNK_TOKENS) -> list[str]:
+    """Split Markdown into token-budgeted chunks on blank lines (never inside code fences), starting at headings."""
+
+    def blocks() -> Iterator[tuple[str, bool]]:
+        block: list[str] = []
+        in_fence = False
+        for line in markdown.split("\n"):
+            if line.lstrip().startswith("```"):
+                in_fence = not in_fence
+            if not line.strip() and not in_fence:
+                if block:
+                    yield "\n".join(block), bool(MARKDOWN_HEADING_RE.match(block[0]))
+                block = []
+                continue
+            block.append(line)
+        if block:
+            yield "\n".join(block), bool(MARKDOWN_HEADING_RE.match(block[0]))
+
+    return _pack(blocks(), max_tokens, joiner="\n\n")
+
+
+def checkpoint_key(mode: str, chunks: list[str]) -> str:
+    """Identifies a chunking of a document, partial results are only reused if this matches."""
+    return content_hash(mode + "\0" + "\0".join(chunks))
+
+
+def load_checkpoint(meta: dict, key: str) -> dict[int, str]:
+    checkpoint = (meta or {}).get(CHECKPOINT_META_KEY) or {}
+    if checkpoint.get("key") != key:
+        return {}
+    return {int(idx): text for idx, text in checkpoint.get("chunks", {}).items()}
+
+
+async def convert_in_chunks(
+    chunks: list[str],
+    convert_chunk: Callable[[str], Awaitable[str]],
+    *,
+    done: dict[int, str] | None = None,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    on_chunk_done: Callable[[int, str], Awaitable[None]] | None = None,
+) -> list[str]:
+    """Map `convert_chunk` over chunks with bounded concurrency and return the results in order.
+
+    Args:
+        chunks: Pieces of the document, in order
+        convert_chunk: Async conversion of one chunk (e.g. an LLM call)
+        done: Already converted chunks by index (from a checkpoint), these are skipped
+        concurrency: Maximum number of chunks converted at once
+        on_chunk_done: Awaited after each chunk finishes, used to persist progress and update the UI
+
+    Returns:
+        Converted chunks in the same order as `chunks`
+    """
+    results = dict(done or {})
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def _convert(idx: int, chunk: str) -> None:
+        async with semaphore:
+            results[idx] = await convert_chunk(chunk)
+        if on_chunk_done:
+            await on_chunk_done(idx, results[idx])
+
+    await asyncio.gather(*(_convert(idx, chunk) for idx, chunk in enumerate(chunks) if idx not in results))
+    return [results[idx] for idx in range(len(chunks))]
@@ -0,0 +1,257 @@
+import re
+from typing import Iterator
+
+from bs4 import BeautifulSoup, Comment, NavigableString, Tag
+
+SKIP_TAGS = {
+    "script",
+    "style",
+    "noscript",
+    "template",
+    "svg",
+    "canvas",
+    "iframe",
+    "head",
+    "button",
+    "input",
+    "select",
+    "textarea",
+}
+HEADING_TAGS = {"h1": 1, "h2": 2, "h3": 3, "h4": 4, "h5": 5, "h6": 6}
+BLOCK_TAGS = {
+    *HEADING_TAGS,
+    "address",
+    "article",
+    "aside",
+    "blockquote",
+    "body",
+    "dd",
+    "details",
+    "div",
+    "dl",
+    "dt",
+    "fieldset",
+    "figcaption",
+    "figure",
+    "footer",
+    "form",
+    "header",
+    "hr",
+    "html",
+    "li",
+    "main",
+    "nav",
+    "ol",
+    "p",
+    "pre",
+    "section",
+    "summary",
+    "table",
+    "ul",
+}
+LANGUAGE_CLASS_RE = re.compile(r"^(?:language|lang|highlight|sourceCode)-(?P<lang>[\w+#.-]+)$")
+WHITESPACE_RE = re.compile(r"[ \t\r\n\f\v]+")
+
+
+def _is_block(node) -> bool:
+    return isinstance(node, Tag) and node.name in BLOCK_TAGS
+
+
+def _code_language(tag: Tag) -> str:
+    for node in (tag, tag.find("code")):
+        if not isinstance(node, Tag):
+            continue
+        for cls in node.get("class") or []:
+            if match := LANGUAGE_CLASS_RE.match(cls):
+                return match.group("lang")
+        if lang := node.get("data-lang"):
+            return lang
+    return ""
+
+
+def _fence(code: str) -> str:
+    fence = "```"
+    while fence in code:
+        fence += "`"
+    return fence
+
+
+def _wrap(marker: str, text: str) -> str:
+    """Wrap inline text with a marker while keeping surrounding whitespace outside of it."""
+    if not (stripped := text.strip()):
+        return text
+    lead = text[: len(text) - len(text.lstrip())]
+    trail = text[len(text.rstrip()) :]
+    return f"{lead}{marker}{stripped}{marker}{trail}"
+
+
+def _clean_inline(text: str) -> str:
+    return "\n".join(line.strip() for line in text.split("\n")).strip()
+
+
+class MarkdownConverter:
+    """Deterministic HTML to Markdown converter built on BeautifulSoup.
+
+    Blocks are produced one at a time by `iter_blocks` so callers can stream the output instead of
+    building the whole document first.
+    """
+
+    def iter_blocks(self, node: Tag) -> Iterator[str]:
+        inline: list[str] = []
+        for child in node.children:
+            if _is_block(child):
+                if text := _clean_inline("".join(inline)):
+                    yield text
+                inline = []
+                yield from self.block(child)
+            else:
+                inline.append(self.inline(child))
+
+        if text := _clean_inline("".join(inline)):
+            yield text
+
+    def block(self, tag: Tag) -> Iterator[str]:
+        name = tag.name
+        if name in SKIP_TAGS:
+            return
+
+        if name in HEADING_TAGS:
+            if text := _clean_inline(self.inline_children(tag)).replace("\n", " "):
+                yield f"{'#' * HEADING_TAGS[name]} {text}"
+        elif name == "pre":
+            code = tag.get_text().strip("\n")
+            fence = _fence(code)
+            yield f"{fence}{_code_language(tag)}\n{code}\n{fence}"
+        elif name in ("ul", "ol"):
+            if text := self.list_block(tag):
+                yield text
+        elif name == "table":
+            if text := self.table(tag):
+                yield text
+        elif name == "blockquote":
+            inner = "\n\n".join(self.iter_blocks(tag))
+            if inner:
+                yield "\n".join(f"> {line}".rstrip() for line in inner.split("\n"))
+        elif name == "hr":
+            yield "---"
+        elif name == "dt":
+            if text := _clean_inline(self.inline_children(tag)):
+                yield f"**{text}**"
+        else:
+            yield from self.iter_blocks(tag)
+
+    def inline_children(self, tag: Tag) -> str:
+        return "".join(self.inline(child) for child in tag.children)
+
+    def inline(self, node) -> str:
+        if isinstance(node, Comment):
+            return ""
+        if isinstance(node, NavigableString):
+            return WHITESPACE_RE.sub(" ", str(node))
+        if not isinstance(node, Tag) or node.name in SKIP_TAGS:
+            return ""
+
+        match node.name:
+            case "br":
+                return "\n"
+            case "code" | "kbd" | "samp" | "tt":
+                code = node.get_text()
+                ticks = "``" if "`" in code else "`"
+                return f"{ticks}{code}{ticks}" if code.strip() else ""
+            case "strong" | "b":
+                return _wrap("**", self.inline_children(node))
+            case "em" | "i":
+                return _wrap("*", self.inline_children(node))
+            case "del" | "s" | "strike":
+                return _wrap("~~", self.inline_children(node))
+            case "a":
+                text = self.inline_children(node).strip()
+                href = node.get("href", "")
+                if not href or href.startswith(("javascript:", "#")) or not text:
+                    return text
+                return f"[{text}]({href})"
+            case "img":
+                if not (src := node.get("src")):
+                    return ""
+                return f"![{node.get('alt', '').strip()}]({src})"
+            case _:
+                # nested block content inside inline context (e.g. <p> in <td>) is flattened
+                if _is_block(node):
+                    return " " + " ".join(self.iter_blocks(node)) + " "
+                return self.inline_children(node)
+
+    def list_block(self, tag: Tag, indent: str = "") -> str:
+        ordered = tag.name == "ol"
+        try:
+            number = int(tag.get("start", 1))
+        except ValueError:
+            number = 1
+
+        lines: list[str] = []
+        for li in tag.find_all("li", recursive=False):
+            marker = f"{number}." if ordered else "-"
+            number += 1
+            child_indent = indent + " " * (len(marker) + 1)
+
+            parts: list[str] = []
+            inline: list[str] = []
+            for child in li.children:
+                if isinstance(child, Tag) and child.name in ("ul", "ol"):
+                    if text := _clean_inline("".join(inline)):
+                        parts.append(text)
+                    inline = []
+                    if nested := self.list_block(child, child_indent):
+                        parts.append(nested)
+                elif _is_block(child):
+                    if text := _clean_inline("".join(inline)):
+                        parts.append(text)
+                    inline = []
+                    parts.extend(self.block(child))
+                else:
+                    inline.append(self.inline(child))
+            if text := _clean_inline("".join(inline)):
+                parts.append(text)
+
+            first, *rest = "\n".join(parts).split("\n") if parts else [""]
+            lines.append(f"{indent}{marker} {first}".rstrip())
+            for line in rest:
+                # nested lists already carry their own indentation
+                lines.append(line if line.startswith(child_indent) or not line else f"{child_indent}{line}")
+
+        return "\n".join(lines)
+
+    def table(self, tag: Tag) -> str:
+        rows = []
+        for tr in tag.find_all("tr"):
+            if tr.find_parent("table") is not tag:
+                continue
+            cells = [
+                _clean_inline(self.inline_children(cell)).replace("\n", " ").replace("|", "\\|")
+                for cell in tr.find_all(["th", "td"], recursive=False)
+            ]
+            if cells:
+                rows.append(cells)
+
+        if not rows:
+            return ""
+
+        width = max(len(row) for row in rows)
+        rows = [row + [""] * (width - len(row)) for row in rows]
+        header, *body = rows
+        lines = [
+            "| " + " | ".join(header) + " |",
+            "| " + " | ".join("---" for _ in header) + " |",
+            *("| " + " | ".join(row) + " |" for row in body),
+        ]
+        return "\n".join(lines)
+
+
+def iter_markdown(html: str) -> Iterator[str]:
+    """Yield Markdown blocks (headings, paragraphs, lists, code, tables) in document order."""
+    soup = BeautifulSoup(html, "html.parser")
+    yield from MarkdownConverter().iter_blocks(soup.body or soup)
+
+
+def html_to_markdown(html: str) -> str:
+    """Convert an HTML document to Markdown without a model round trip."""
+    return "\n\n".join(iter_markdown(html)).strip() + "\n"
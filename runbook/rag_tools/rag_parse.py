@@ -0,0 +1,48 @@
+from dataclasses import dataclass
+
+from bs4 import BeautifulSoup
+
+from runbook.db_models import ContentType, DocumentSource
+from runbook.rag_tools.rag_blob import get_blob_store
+from runbook.rag_tools.rag_extract import extract_main_content
+
+
+@dataclass
+class ParsedHtml:
+    title: str
+    content: str  # cleaned main content html
+    stats: dict[str, int]
+
+
+def parse_html_document(url: str, data: str) -> ParsedHtml:
+    """Extract the title and main content of a page."""
+    soup = BeautifulSoup(data, "html.parser")
+    title = soup.title.string.strip() if (soup.title and soup.title.string) else url
+
+    content = str(extract_main_content(soup))
+
+    stats = {
+        "raw_bytes": len(data.encode("utf-8")),
+        "content_bytes": len(content.encode("utf-8")),
+    }
+    return ParsedHtml(title=title, content=content, stats=stats)
+
+
+def document_fields(url: str, data: str) -> dict:
+    """Parse a page and store its raw and cleaned bodies, returning the DocumentSource fields to set."""
+    parsed = parse_html_document(url, data)
+
+    store = get_blob_store()
+    raw_blob, content_blob = store.put(data), store.put(parsed.content)
+
+    return {
+        "title": parsed.title,
+        "raw_blob": raw_blob,
+        "content_blob": content_blob,
+        "meta": {**parsed.stats, "raw_compressed_bytes": store.stored_size(raw_blob)},
+    }
+
+
+def source_from_html(url: str, data: str, content_type: ContentType = ContentType.DEFAULT) -> DocumentSource:
+    """Parse fetched HTML into a DocumentSource (CPU bound, run off the event loop)."""
+    return DocumentSource(path=url, content_type=content_type, **document_fields(url, data))
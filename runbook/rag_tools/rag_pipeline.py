@@ -0,0 +1,159 @@
+from sqlmodel import Session
+
+from runbook.db_models import DocumentChunk, DocumentSource
+from runbook.db_ops import with_session
+from runbook.rag_tools.rag_answer_cache import get_answer_cache
+from runbook.rag_tools.rag_blob import document_body, get_blob_store
+from runbook.rag_tools.rag_bm25 import get_keyword_index
+from runbook.rag_tools.rag_chunk import DEFAULT_CHUNK_TOKENS, DEFAULT_OVERLAP_TOKENS, chunk_hash, chunk_markdown
+from runbook.rag_tools.rag_db import (
+    get_chunk_source_hash,
+    load_document_chunks,
+    load_refresh_candidates,
+    replace_document_chunks,
+    save_documents_to_db,
+    update_document_contents,
+)
+from runbook.rag_tools.rag_embed import get_embedder
+from runbook.rag_tools.rag_markdown import html_to_markdown
+from runbook.rag_tools.rag_vector import get_vector_index
+
+
+def ensure_parsed(source: DocumentSource, *, session: Session) -> str:
+    """Return the source's markdown, converting and storing it locally if it was never parsed."""
+    if markdown := document_body(source, "parsed"):
+        return markdown
+
+    markdown = html_to_markdown(document_body(source, "content"))
+    source.parsed_blob = get_blob_store().put(markdown)
+    session.commit()
+    return markdown
+
+
+def chunk_document(
+    source: DocumentSource,
+    markdown: str,
+    *,
+    session: Session,
+    max_tokens: int = DEFAULT_CHUNK_TOKENS,
+    overlap_tokens: int = DEFAULT_OVERLAP_TOKENS,
+) -> bool:
+    """(Re)build the chunks of a source, a no-op if its markdown and the chunking params are unchanged.
+
+    Returns:
+        True if the chunks were rebuilt
+    """
+    source_hash = chunk_hash(markdown, max_tokens, overlap_tokens)
+    if get_chunk_source_hash(source.id, session=session) == source_hash:
+        return False
+
+    chunks = [
+        DocumentChunk(
+            source_id=source.id,
+            chunk_index=chunk.index,
+            text=chunk.text,
+            heading=chunk.heading,
+            start_offset=chunk.start,
+            end_offset=chunk.end,
+            num_tokens=chunk.num_tokens,
+            source_hash=source_hash,
+        )
+        for chunk in chunk_markdown(markdown, max_tokens=max_tokens, overlap_tokens=overlap_tokens)
+    ]
+    replace_document_chunks(source.id, chunks, session=session)
+    return True
+
+
+def chunk_search_text(chunk: DocumentChunk) -> str:
+    # the heading path gives short chunks (e.g. a lone code block) the context of their section
+    return f"{chunk.heading}\n\n{chunk.text}" if chunk.heading else chunk.text
+
+
+def embed_chunks(source_id: int, chunks: list[DocumentChunk]) -> None:
+    """Replace the vectors of a source with embeddings of its current chunks."""
+    index, embedder = get_vector_index(), get_embedder()
+    vectors = embedder.embed([chunk_search_text(chunk) for chunk in chunks])
+
+    index.remove_sources([source_id])
+    index.add([chunk.id for chunk in chunks], [source_id] * len(chunks), vectors, model=embedder.model)
+
+
+def keyword_index_chunks(source_id: int, chunks: list[DocumentChunk]) -> None:
+    """Replace the keyword index entries of a source with its current chunks."""
+    index = get_keyword_index()
+    index.remove_sources([source_id])
+    index.add([chunk.id for chunk in chunks], [source_id] * len(chunks), [chunk_search_text(c) for c in chunks])
+
+
+def unindex_documents(source_ids: list[int]) -> None:
+    """Drop (soft) deleted sources from the retrieval indexes and the answers generated from them."""
+    get_vector_index().remove_sources(source_ids)
+    get_keyword_index().remove_sources(source_ids)
+    get_answer_cache().invalidate_sources(source_ids)
+
+
+@with_session
+def process_documents(source_ids: list[int], *, session: Session) -> dict[int, bool]:
+    """Run the post-ingest steps (markdown conversion, chunking, keyword indexing, embedding) for sources.
+
+    Safe to re-run. Sources whose chunks are unchanged are only indexed if they are missing from an index,
+    e.g. because the embedding model changed or the embedding server was down when they were ingested.
+
+    Returns:
+        Mapping of source id to whether anything was rebuilt
+    """
+    vector_index = get_vector_index()
+    vector_index.ensure_model(get_embedder().model)
+    embedded = vector_index.indexed_sources()
+    keyword_indexed = get_keyword_index().indexed_sources()
+
+    results = {}
+    for source_id in source_ids:
+        source = session.get(DocumentSource, source_id)
+        if source is None or source.is_deleted:
+            continue
+
+        try:
+            markdown = ensure_parsed(source, session=session)
+            rebuilt = chunk_document(source, markdown, session=session)
+            if rebuilt or source_id not in embedded or source_id not in keyword_indexed:
+                chunks = load_document_chunks([source_id], session=session)
+                # keyword index first, it does not depend on the embedding server being up
+                if rebuilt or source_id not in keyword_indexed:
+                    keyword_index_chunks(source_id, chunks)
+                if rebuilt or source_id not in embedded:
+                    embed_chunks(source_id, chunks)
+                if rebuilt:
+                    get_answer_cache().invalidate_sources([source_id])
+            results[source_id] = rebuilt
+        except Exception as err:
+            print(f"Error processing document {source_id}: {err}")
+            session.rollback()
+    return results
+
+
+def ingest_documents(sources: list[DocumentSource]) -> int:
+    """Save new sources in one transaction and run the post-ingest steps on them.
+
+    Returns:
+        The number of sources saved
+    """
+    source_ids = save_documents_to_db(sources)
+    process_documents(source_ids)
+    return len(source_ids)
+
+
+def apply_document_updates(updates: dict[int, dict]) -> int:
+    """Write refreshed sources and re-run the post-ingest steps for just those sources."""
+    updated = update_document_contents(updates)
+    process_documents(list(updates))
+    return updated
+
+
+if __name__ == "__main__":
+    # (re)build chunks and vectors for every document, e.g. after switching the embedding model
+    after_id, processed = 0, 0
+    while candidates := load_refresh_candidates(after_id=after_id):
+        after_id = candidates[-1][0]
+        processed += len(process_documents([source_id for source_id, _, _ in candidates]))
+    print(f"processed {processed} documents, {len(get_vector_index())} chunks embedded")
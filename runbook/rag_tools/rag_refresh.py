@@ -0,0 +1,120 @@
+import asyncio
+from collections import Counter
+from datetime import datetime, timedelta
+from enum import StrEnum, auto
+from typing import Callable
+
+from runbook.rag_tools.rag_db import load_refresh_candidates, mark_sources_checked
+from runbook.rag_tools.rag_fetch import (
+    AsyncFetcher,
+    FetchResult,
+    cache_validators,
+    conditional_headers,
+    content_hash,
+    get_fetcher,
+)
+from runbook.rag_tools.rag_parse import document_fields
+from runbook.rag_tools.rag_pipeline import apply_document_updates
+from rxconstants import tz
+
+DEFAULT_MAX_AGE = timedelta(days=1)
+DEFAULT_SWEEP_PAGE_SIZE: int = 200
+
+
+class RefreshOutcome(StrEnum):
+    UNCHANGED = auto()
+    UPDATED = auto()
+    FAILED = auto()
+
+
+def classify_refresh(meta: dict, result: FetchResult) -> RefreshOutcome:
+    """Decide what a conditional GET means for a stored source."""
+    if result.not_modified:
+        return RefreshOutcome.UNCHANGED
+    if not result.ok:
+        return RefreshOutcome.FAILED
+    if meta.get("content_hash") and meta["content_hash"] == content_hash(result.content):
+        # server ignored the validators but the body is byte-identical
+        return RefreshOutcome.UNCHANGED
+    return RefreshOutcome.UPDATED
+
+
+async def _refresh_candidates(
+    candidates: list[tuple[int, str, dict]],
+    fetcher: AsyncFetcher,
+    save_fn: Callable[[dict[int, dict]], int],
+    checked_fn: Callable[[list[int]], int],
+) -> Counter:
+    results = await asyncio.gather(
+        *(fetcher.fetch(path, headers=conditional_headers(meta)) for _, path, meta in candidates),
+    )
+
+    outcomes: Counter = Counter()
+    updates: dict[int, dict] = {}
+    for (source_id, path, meta), result in zip(candidates, results):
+        outcome = classify_refresh(meta, result)
+        outcomes[outcome] += 1
+        if outcome == RefreshOutcome.UPDATED:
+            fields = await asyncio.to_thread(document_fields, path, result.content)
+            updates[source_id] = {**fields, "meta": {**meta, **fields["meta"], **cache_validators(result)}}
+
+    # unchanged and failed sources are never written so their parsed content and index entries stay valid
+    if updates:
+        await asyncio.to_thread(save_fn, updates)
+    # every outcome counts as checked, an unchanged (or unreachable) source isn't fetched again until it is stale
+    await asyncio.to_thread(checked_fn, [source_id for source_id, _, _ in candidates])
+
+    return outcomes
+
+
+async def refresh_source(
+    source_id: int,
+    *,
+    fetcher: AsyncFetcher | None = None,
+    save_fn: Callable[[dict[int, dict]], int] = apply_document_updates,
+    checked_fn: Callable[[list[int]], int] = mark_sources_checked,
+) -> RefreshOutcome:
+    """Re-fetch a single source with a conditional GET, only rewriting it if it changed."""
+    if not (candidates := await asyncio.to_thread(load_refresh_candidates, source_ids=[source_id])):
+        return RefreshOutcome.FAILED
+
+    outcomes = await _refresh_candidates(candidates, fetcher or get_fetcher(), save_fn, checked_fn)
+    return next(iter(outcomes))
+
+
+async def refresh_stale_sources(
+    max_age: timedelta = DEFAULT_MAX_AGE,
+    *,
+    page_size: int = DEFAULT_SWEEP_PAGE_SIZE,
+    fetcher: AsyncFetcher | None = None,
+    save_fn: Callable[[dict[int, dict]], int] = apply_document_updates,
+    checked_fn: Callable[[list[int]], int] = mark_sources_checked,
+) -> Counter:
+    """Sweep every source that wasn't re-fetched in the last `max_age`.
+
+    Sources are paged by id (only id/path/meta are loaded), each page is fetched concurrently using
+    the fetcher's per-host limits, and all changed sources in a page are written in one transaction.
+
+    Returns:
+        Counter of RefreshOutcome
+    """
+    fetcher = fetcher or get_fetcher()
+    checked_before = datetime.now(tz=tz) - max_age
+    totals: Counter = Counter()
+
+    after_id = 0
+    while candidates := await asyncio.to_thread(
+        load_refresh_candidates,
+        checked_before=checked_before,
+        after_id=after_id,
+        limit=page_size,
+    ):
+        totals.update(await _refresh_candidates(candidates, fetcher, save_fn, checked_fn))
+        after_id = candidates[-1][0]
+
+    return totals
+
+
+if __name__ == "__main__":
+    # e.g. from cron: `python -m runbook.rag_tools.rag_refresh`
+    print(dict(asyncio.run(refresh_stale_sources())))
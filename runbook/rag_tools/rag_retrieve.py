@@ -0,0 +1,202 @@
+import asyncio
+import time
+from dataclasses import dataclass, field
+
+import numpy as np
+from sqlmodel import Session
+
+from runbook.rag_tools.rag_bm25 import keyword_search
+from runbook.rag_tools.rag_db import load_chunks_with_sources
+from runbook.rag_tools.rag_embed import get_embedder
+from runbook.rag_tools.rag_vector import get_vector_index
+from runbook.utils import estimate_tokens
+
+DEFAULT_CANDIDATES: int = 30  # per retriever, before fusion
+DEFAULT_CONTEXT_TOKENS: int = 3000
+RRF_K: int = 60
+
+
+@dataclass
+class Passage:
+    source_id: int
+    title: str
+    path: str
+    heading: str
+    text: str
+    start: int
+    end: int
+    score: float
+
+    @property
+    def num_tokens(self) -> int:
+        return estimate_tokens(self.text)
+
+
+@dataclass
+class RetrievalResult:
+    passages: list[Passage] = field(default_factory=list)  # packed into the context, in citation order
+    context: str = ""
+    timings: dict[str, float] = field(default_factory=dict)  # seconds per stage
+    query_vector: np.ndarray | None = None  # None if the embedding server was unavailable
+    embed_model: str = ""
+
+    @property
+    def source_ids(self) -> set[int]:
+        return {passage.source_id for passage in self.passages}
+
+    @property
+    def num_tokens(self) -> int:
+        return estimate_tokens(self.context)
+
+    def citations(self) -> str:
+        """Markdown list mapping the `[n]` markers in the context to their documents, one item per document."""
+        markers: dict[tuple[str, str], list[str]] = {}
+        for n, passage in enumerate(self.passages, start=1):
+            markers.setdefault((passage.title, passage.path), []).append(f"[{n}]")
+        return "\n".join(f"- {', '.join(refs)} [{title}]({path})" for (title, path), refs in markers.items())
+
+
+def reciprocal_rank_fusion(rankings: list[list[tuple[int, float]]], k: int = RRF_K) -> list[tuple[int, float]]:
+    """Fuse ranked (id, score) lists by summing 1 / (k + rank), only ranks matter so scores need not be comparable."""
+    fused: dict[int, float] = {}
+    for ranking in rankings:
+        for rank, (item_id, _) in enumerate(ranking, start=1):
+            fused[item_id] = fused.get(item_id, 0.0) + 1.0 / (k + rank)
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)
+
+
+def merge_overlapping(passages: list[Passage]) -> list[Passage]:
+    """Merge passages of the same source whose text overlaps or touches (neighbouring chunks share an overlap).
+
+    The merged passage keeps the best score, so it ranks where its best part ranked.
+    """
+    by_source: dict[int, list[Passage]] = {}
+    for passage in passages:
+        by_source.setdefault(passage.source_id, []).append(passage)
+
+    merged: list[Passage] = []
+    for group in by_source.values():
+        group.sort(key=lambda p: p.start)
+        current = group[0]
+        for passage in group[1:]:
+            if passage.start <= current.end:
+                if passage.end > current.end:
+                    # chunk text is an exact slice of the source markdown, so offsets splice cleanly
+                    current.text += passage.text[current.end - passage.start :]
+                    current.end = passage.end
+                current.score = max(current.score, passage.score)
+            else:
+                merged.append(current)
+                current = passage
+        merged.append(current)
+
+    return sorted(merged, key=lambda p: p.score, reverse=True)
+
+
+def _format_passage(n: int, passage: Passage) -> str:
+    heading = f" > {passage.heading}" if passage.heading else ""
+    return f"[{n}] {passage.title}{heading} ({passage.path})\n{passage.text}"
+
+
+def pack_context(passages: list[Passage], max_tokens: int = DEFAULT_CONTEXT_TOKENS) -> tuple[list[Passage], str]:
+    """Greedily pack the best passages under a token budget, formatted with `[n]` citation markers.
+
+    The packed passages are listed by document and position rather than by score, so the same excerpts always
+    make the same context (and prompt) whatever order they were ranked in.
+    """
+    packed: list[Passage] = []
+    used = 0
+    for passage in passages:
+        if used + (tokens := estimate_tokens(_format_passage(len(packed) + 1, passage))) > max_tokens:
+            continue  # a smaller passage further down may still fit
+        packed.append(passage)
+        used += tokens
+    packed.sort(key=lambda p: (p.source_id, p.start))
+    return packed, "\n\n".join(_format_passage(n, passage) for n, passage in enumerate(packed, start=1))
+
+
+def _load_passages(fused: list[tuple[int, float]], session: Session | None = None) -> list[Passage]:
+    scores = dict(fused)
+    return [
+        Passage(
+            source_id=chunk.source_id,
+            title=title or path,
+            path=path,
+            heading=chunk.heading,
+            text=chunk.text,
+            start=chunk.start_offset,
+            end=chunk.end_offset,
+            score=scores[chunk.id],
+        )
+        for chunk, title, path in load_chunks_with_sources(list(scores), session=session)
+    ]
+
+
+def _embed_and_search(query: str, k: int) -> tuple[np.ndarray, list[tuple[int, float]]]:
+    # keep the query embedding, callers reuse it (e.g. the answer cache) instead of embedding the prompt again
+    query_vector = get_embedder().embed([query])[0]
+    return query_vector, get_vector_index().search(query_vector, k=k)
+
+
+async def _timed(timings: dict[str, float], name: str, fn, *args, **kwargs):
+    start = time.perf_counter()
+    try:
+        return await asyncio.to_thread(fn, *args, **kwargs)
+    finally:
+        timings[name] = time.perf_counter() - start
+
+
+async def retrieve_context(
+    query: str,
+    *,
+    max_tokens: int = DEFAULT_CONTEXT_TOKENS,
+    candidates: int = DEFAULT_CANDIDATES,
+    session: Session | None = None,
+) -> RetrievalResult:
+    """Hybrid retrieval for a prompt: keyword and vector search in parallel, fused, merged and packed.
+
+    A failing retriever (e.g. the embedding server is down) is logged and the other one's results are used.
+
+    Args:
+        query: The user's prompt
+        max_tokens: Token budget for the packed context
+        candidates: Results taken from each retriever before fusion
+        session: Database session for loading the passages, a new one by default
+
+    Returns:
+        The packed passages, the formatted context, the query embedding and per-stage timings
+    """
+    start = time.perf_counter()
+    timings: dict[str, float] = {}
+
+    keyword_result, vector_result = await asyncio.gather(
+        _timed(timings, "keyword", keyword_search, query, k=candidates),
+        _timed(timings, "vector", _embed_and_search, query, candidates),
+        return_exceptions=True,
+    )
+    rankings = []
+    query_vector = None
+    if isinstance(keyword_result, BaseException):
+        print(f"keyword retrieval failed: {keyword_result}")
+    else:
+        rankings.append(keyword_result)
+    if isinstance(vector_result, BaseException):
+        print(f"vector retrieval failed: {vector_result}")
+    else:
+        query_vector, vector_ranking = vector_result
+        rankings.append(vector_ranking)
+
+    if fused := reciprocal_rank_fusion(rankings):
+        passages = merge_overlapping(await _timed(timings, "load", _load_passages, fused, session))
+    else:
+        passages = []
+    packed, context = pack_context(passages, max_tokens=max_tokens)
+
+    timings["total"] = time.perf_counter() - start
+    return RetrievalResult(
+        passages=packed,
+        context=context,
+        timings=timings,
+        query_vector=query_vector,
+        embed_model=get_embedder().model,
+    )
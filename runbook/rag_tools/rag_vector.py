@@ -0,0 +1,408 @@
+import json
+import os
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterable
+
+import numpy as np
+
+from runbook.rag_tools.rag_blob import atomic_write
+from runbook.rag_tools.rag_embed import get_embedder, normalize
+from rxconstants import rag_docs_file_dir, rag_vector_index_type
+
+DEFAULT_TOP_K: int = 10
+# compact the vectors file once this fraction of its rows belong to deleted/replaced sources
+COMPACT_RATIO: float = 0.3
+
+# IVF knobs, more lists/fewer probes is faster, more probes is closer to exact search
+DEFAULT_NPROBE: int = 16
+IVF_TRAIN_MIN_ROWS: int = 20_000  # below this brute force is fast enough
+IVF_RETRAIN_FACTOR: float = 4.0  # retrain once the index has grown this much since training
+IVF_SAMPLE_PER_LIST: int = 40
+IVF_KMEANS_ITERS: int = 10
+ASSIGN_BATCH_ROWS: int = 16_384
+
+# file names of an index written before its files were versioned per generation
+_LEGACY_FILES: dict[str, str] = {
+    "vectors": "vectors.f32",
+    "ids": "ids.npy",
+    "sources": "sources.npy",
+    "alive": "alive.npy",
+    "ivf_centroids": "ivf_centroids.npy",
+    "ivf_lists": "ivf_lists.npy",
+}
+
+
+def _nearest_centroid(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    lists = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), ASSIGN_BATCH_ROWS):
+        batch = np.asarray(vectors[start : start + ASSIGN_BATCH_ROWS], dtype=np.float32)
+        lists[start : start + len(batch)] = np.argmax(batch @ centroids.T, axis=1)
+    return lists
+
+
+def spherical_kmeans(sample: np.ndarray, nlist: int, iters: int = IVF_KMEANS_ITERS, seed: int = 0) -> np.ndarray:
+    """Cluster normalized vectors by cosine similarity, returning (nlist, dim) normalized centroids."""
+    rng = np.random.default_rng(seed)
+    centroids = sample[rng.choice(len(sample), size=nlist, replace=False)].copy()
+    for _ in range(iters):
+        lists = _nearest_centroid(sample, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, lists, sample)
+        # empty clusters are re-seeded with random sample points
+        empty = ~np.bincount(lists, minlength=nlist).astype(bool)
+        sums[empty] = sample[rng.choice(len(sample), size=int(empty.sum()))]
+        centroids = normalize(sums)
+    return centroids
+
+
+@dataclass(frozen=True)
+class _InvertedLists:
+    """IVF coarse quantizer, every row belongs to the list of its nearest centroid."""
+
+    centroids: np.ndarray  # (nlist, dim) float32
+    lists: np.ndarray  # (n,) int32 list of each row
+    order: np.ndarray  # row numbers grouped by list
+    offsets: np.ndarray  # (nlist + 1,) boundaries of each list in `order`
+    trained_rows: int
+
+    @classmethod
+    def build(cls, centroids: np.ndarray, lists: np.ndarray, trained_rows: int) -> "_InvertedLists":
+        order = np.argsort(lists, kind="stable")
+        offsets = np.searchsorted(lists[order], np.arange(len(centroids) + 1))
+        return cls(centroids, lists, order, offsets, trained_rows)
+
+    def extend(self, vectors: np.ndarray) -> "_InvertedLists":
+        lists = np.concatenate([self.lists, _nearest_centroid(vectors, self.centroids)])
+        return self.build(self.centroids, lists, self.trained_rows)
+
+    def select(self, keep: np.ndarray) -> "_InvertedLists":
+        return self.build(self.centroids, self.lists[keep], self.trained_rows)
+
+    def probe(self, query: np.ndarray, nprobe: int) -> np.ndarray:
+        """Row numbers in the `nprobe` lists whose centroids are closest to the query, in file order."""
+        nprobe = min(nprobe, len(self.centroids))
+        probed = np.argpartition(-(self.centroids @ query), nprobe - 1)[:nprobe]
+        rows = np.concatenate([self.order[self.offsets[c] : self.offsets[c + 1]] for c in probed])
+        rows.sort()  # sequential reads through the memory map
+        return rows
+
+
+@dataclass(frozen=True)
+class _Snapshot:
+    vectors: np.ndarray  # (n, dim) float32, memory-mapped
+    chunk_ids: np.ndarray  # (n,) int64
+    source_ids: np.ndarray  # (n,) int64
+    alive: np.ndarray  # (n,) bool, False for soft deleted rows
+    ivf: _InvertedLists | None = None
+
+
+def _empty_snapshot(dim: int) -> _Snapshot:
+    return _Snapshot(
+        vectors=np.empty((0, dim), dtype=np.float32),
+        chunk_ids=np.empty(0, dtype=np.int64),
+        source_ids=np.empty(0, dtype=np.int64),
+        alive=np.empty(0, dtype=bool),
+    )
+
+
+class VectorIndex:
+    """Brute-force cosine similarity index over chunk embeddings, persisted as a memory-mapped float32 matrix.
+
+    Layout of `root`, `<n>` is the generation a file was written in:
+        vectors.<n>.f32  raw row-major float32 rows, appended to as chunks are added
+        ids.<n>.npy      chunk id of each row
+        sources.<n>.npy  source id of each row
+        alive.<n>.npy    soft delete mask, rows of removed sources stay in the file until compaction
+        ivf_*.<n>.npy    IVF centroids and row lists, only for `IVFVectorIndex`
+        meta.json        embedding model, dimension and the files of the current generation
+
+    Every save writes its arrays under a new generation and then swaps `meta.json`, so a crash leaves either
+    the old or the new set of files in use, never a mix (e.g. compacted vectors with the old ids).
+
+    Vectors are stored L2 normalized so a search is one matrix-vector product plus an argpartition.
+    Readers work on an immutable snapshot, writers (add/remove) are serialized with a lock.
+    """
+
+    def __init__(self, root: str | Path, compact_ratio: float = COMPACT_RATIO):
+        self.root = Path(root)
+        self.compact_ratio = compact_ratio
+        self.model: str | None = None
+        self.dim: int = 0
+        self._lock = threading.RLock()
+        self._snapshot = _empty_snapshot(0)
+        self._generation = 0
+        self._files = dict(_LEGACY_FILES)
+        self._load()
+
+    @property
+    def _vectors_path(self) -> Path:
+        return self.root / self._files["vectors"]
+
+    def __len__(self) -> int:
+        return int(self._snapshot.alive.sum())
+
+    def _map_vectors(self, count: int, path: Path | None = None) -> np.ndarray:
+        if count == 0:
+            return np.empty((0, self.dim), dtype=np.float32)
+        return np.memmap(path or self._vectors_path, dtype=np.float32, mode="r", shape=(count, self.dim))
+
+    def _load(self) -> None:
+        meta_path = self.root / "meta.json"
+        if not meta_path.exists():
+            return
+
+        meta = json.loads(meta_path.read_text())
+        self.model, self.dim = meta["model"], meta["dim"]
+        # indexes written before generations were introduced have no file list, their files are unversioned
+        self._generation = meta.get("generation", 0)
+        self._files = meta.get("files") or {
+            name: file for name, file in _LEGACY_FILES.items() if name == "vectors" or (self.root / file).exists()
+        }
+        files = {name: self.root / file for name, file in self._files.items()}
+        chunk_ids = np.load(files["ids"])
+        ivf = None
+        if "ivf_centroids" in files:
+            ivf = _InvertedLists.build(
+                np.load(files["ivf_centroids"]), np.load(files["ivf_lists"]), meta["ivf_trained_rows"]
+            )
+        self._snapshot = _Snapshot(
+            # rows are written before the id arrays, anything past len(ids) is an interrupted append
+            vectors=self._map_vectors(len(chunk_ids)),
+            chunk_ids=chunk_ids,
+            source_ids=np.load(files["sources"]),
+            alive=np.load(files["alive"]),
+            ivf=ivf,
+        )
+        self._remove_unused_files()
+
+    def _save(self, snapshot: _Snapshot, vectors_file: str | None = None) -> None:
+        """Write `snapshot` as the next generation, switching to `vectors_file` if given."""
+        generation = self._generation + 1
+        arrays = {"ids": snapshot.chunk_ids, "sources": snapshot.source_ids, "alive": snapshot.alive}
+        meta = {"model": self.model, "dim": self.dim, "generation": generation}
+        if snapshot.ivf is not None:
+            arrays.update(ivf_centroids=snapshot.ivf.centroids, ivf_lists=snapshot.ivf.lists)
+            meta["ivf_trained_rows"] = snapshot.ivf.trained_rows
+
+        files = {"vectors": vectors_file or self._files["vectors"]}
+        for name, array in arrays.items():
+            files[name] = f"{name}.{generation}.npy"
+            atomic_write(self.root / files[name], lambda f, array=array: np.save(f, array))
+        meta["files"] = files
+        meta = json.dumps(meta).encode()
+        atomic_write(self.root / "meta.json", lambda f: f.write(meta))
+
+        self._generation, self._files, self._snapshot = generation, files, snapshot
+        self._remove_unused_files()
+
+    def _remove_unused_files(self) -> None:
+        """Delete the files of earlier generations, and of a save interrupted before it swapped `meta.json`."""
+        used = {*self._files.values(), "meta.json"}
+        for path in self.root.iterdir():
+            if path.is_file() and path.name not in used and path.suffix in (".npy", ".f32", ".tmp"):
+                path.unlink(missing_ok=True)
+
+    def clear(self, model: str | None = None) -> None:
+        with self._lock:
+            self.root.mkdir(parents=True, exist_ok=True)
+            self.model, self.dim = model, 0
+            self._save(_empty_snapshot(0), vectors_file=f"vectors.{self._generation + 1}.f32")
+
+    def ensure_model(self, model: str) -> None:
+        """Drop the index if it was built with a different embedding model, vectors are not comparable."""
+        if self.model is not None and self.model != model:
+            print(f"Embedding model changed ({self.model} -> {model}), clearing vector index")
+            self.clear(model)
+
+    def indexed_sources(self) -> set[int]:
+        snapshot = self._snapshot
+        return set(np.unique(snapshot.source_ids[snapshot.alive]).tolist())
+
+    def add(self, chunk_ids: list[int], source_ids: list[int], vectors: np.ndarray, model: str) -> None:
+        """Append normalized vectors for chunks."""
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if not len(vectors):
+            return
+
+        with self._lock:
+            if self.dim and vectors.shape[1] != self.dim:
+                raise ValueError(f"Vector dimension {vectors.shape[1]} does not match index dimension {self.dim}")
+            self.root.mkdir(parents=True, exist_ok=True)
+            self.model, self.dim = model, vectors.shape[1]
+
+            old = self._snapshot
+            if self._vectors_path.exists():
+                # drop rows left behind by an interrupted append so new rows line up with the id arrays
+                os.truncate(self._vectors_path, len(old.chunk_ids) * self.dim * 4)
+            with open(self._vectors_path, "ab") as f:
+                f.write(vectors.tobytes())
+
+            count = len(old.chunk_ids) + len(vectors)
+            self._save(
+                _Snapshot(
+                    vectors=self._map_vectors(count),
+                    chunk_ids=np.concatenate([old.chunk_ids, np.asarray(chunk_ids, dtype=np.int64)]),
+                    source_ids=np.concatenate([old.source_ids, np.asarray(source_ids, dtype=np.int64)]),
+                    alive=np.concatenate([old.alive, np.ones(len(vectors), dtype=bool)]),
+                    ivf=old.ivf.extend(vectors) if old.ivf else None,
+                )
+            )
+
+    def remove_sources(self, source_ids: Iterable[int]) -> int:
+        """Soft delete all rows of sources, compacting the file once enough rows are dead.
+
+        Returns:
+            The number of rows removed
+        """
+        with self._lock:
+            old = self._snapshot
+            removed = np.isin(old.source_ids, list(source_ids)) & old.alive
+            if not removed.any():
+                return 0
+
+            alive = old.alive & ~removed
+            self._save(_Snapshot(old.vectors, old.chunk_ids, old.source_ids, alive, old.ivf))
+            if (~alive).sum() > self.compact_ratio * len(alive):
+                self._compact()
+            return int(removed.sum())
+
+    def _compact(self) -> None:
+        old = self._snapshot
+        keep = old.alive
+        # compacted rows go to a new file, the current one stays in use until the ids matching the new one are saved
+        vectors_file = f"vectors.{self._generation + 1}.f32"
+        atomic_write(self.root / vectors_file, lambda f: f.write(np.ascontiguousarray(old.vectors[keep]).tobytes()))
+        self._save(
+            _Snapshot(
+                vectors=self._map_vectors(int(keep.sum()), self.root / vectors_file),
+                chunk_ids=old.chunk_ids[keep],
+                source_ids=old.source_ids[keep],
+                alive=np.ones(int(keep.sum()), dtype=bool),
+                ivf=old.ivf.select(keep) if old.ivf else None,
+            ),
+            vectors_file=vectors_file,
+        )
+
+    def search(
+        self,
+        query: np.ndarray,
+        k: int = DEFAULT_TOP_K,
+        source_ids: Iterable[int] | None = None,
+    ) -> list[tuple[int, float]]:
+        """Top-k chunks by cosine similarity to a normalized query vector.
+
+        Args:
+            query: (dim,) normalized query embedding
+            k: Number of results
+            source_ids: Only search chunks of these sources
+
+        Returns:
+            (chunk id, score) pairs, best first
+        """
+        snapshot = self._snapshot
+        if not len(snapshot.chunk_ids):
+            return []
+        query = np.asarray(query, dtype=np.float32)
+
+        mask = snapshot.alive
+        if source_ids is not None:
+            # a filter usually selects few rows, score exactly those
+            mask = mask & np.isin(snapshot.source_ids, list(source_ids))
+            rows = np.flatnonzero(mask)
+        else:
+            rows = self._candidate_rows(snapshot, query)
+
+        if rows is None:
+            scores = snapshot.vectors @ query
+            scores[~mask] = -np.inf
+            k = min(k, int(mask.sum()))
+        else:
+            rows = rows[mask[rows]]
+            scores = snapshot.vectors[rows] @ query
+            k = min(k, len(rows))
+        if k == 0:
+            return []
+
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        top_rows = top if rows is None else rows[top]
+        return [(int(snapshot.chunk_ids[row]), float(score)) for row, score in zip(top_rows, scores[top])]
+
+    def _candidate_rows(self, snapshot: _Snapshot, query: np.ndarray) -> np.ndarray | None:
+        """Rows worth scoring for a query, None to score all of them."""
+        return None
+
+
+class IVFVectorIndex(VectorIndex):
+    """Approximate search for large libraries: an inverted file (IVF) over the same on-disk vectors.
+
+    Rows are grouped by their nearest k-means centroid and a query only scores the rows of the `nprobe`
+    lists closest to it, roughly `nprobe / nlist` of the index. Until there are `train_min_rows` vectors,
+    and for filtered searches, this is exact brute-force search.
+
+    Args:
+        root: Index directory, shared layout with `VectorIndex`
+        nprobe: Lists scanned per query, the recall/latency knob
+        nlist: Number of lists, defaults to ~sqrt(rows) at training time
+        train_min_rows: Train the quantizer once the index reaches this many rows
+    """
+
+    def __init__(
+        self,
+        root: str | Path,
+        nprobe: int = DEFAULT_NPROBE,
+        nlist: int | None = None,
+        train_min_rows: int = IVF_TRAIN_MIN_ROWS,
+        **kwargs,
+    ):
+        self.nprobe = nprobe
+        self.nlist = nlist
+        self.train_min_rows = train_min_rows
+        super().__init__(root, **kwargs)
+
+    def add(self, chunk_ids: list[int], source_ids: list[int], vectors: np.ndarray, model: str) -> None:
+        with self._lock:
+            super().add(chunk_ids, source_ids, vectors, model)
+            ivf, rows = self._snapshot.ivf, len(self)
+            if (ivf is None and rows >= self.train_min_rows) or (ivf and rows > IVF_RETRAIN_FACTOR * ivf.trained_rows):
+                self.train()
+
+    def train(self, seed: int = 0) -> None:
+        """(Re)build the centroids from a sample of the live rows and reassign every row."""
+        with self._lock:
+            snapshot = self._snapshot
+            live = np.flatnonzero(snapshot.alive)
+            nlist = min(self.nlist or max(int(np.sqrt(len(live))), 1), len(live))
+            if nlist == 0:
+                return
+
+            rng = np.random.default_rng(seed)
+            sample_rows = np.sort(rng.choice(live, size=min(len(live), nlist * IVF_SAMPLE_PER_LIST), replace=False))
+            centroids = spherical_kmeans(np.asarray(snapshot.vectors[sample_rows]), nlist, seed=seed)
+            ivf = _InvertedLists.build(centroids, _nearest_centroid(snapshot.vectors, centroids), len(live))
+            self._save(_Snapshot(snapshot.vectors, snapshot.chunk_ids, snapshot.source_ids, snapshot.alive, ivf))
+
+    def _candidate_rows(self, snapshot: _Snapshot, query: np.ndarray) -> np.ndarray | None:
+        if snapshot.ivf is None:
+            return None
+        return snapshot.ivf.probe(query, self.nprobe)
+
+
+_vector_index: VectorIndex | None = None
+
+
+def get_vector_index() -> VectorIndex:
+    global _vector_index
+    if _vector_index is None:
+        index_cls = IVFVectorIndex if rag_vector_index_type == "ivf" else VectorIndex
+        _vector_index = index_cls(Path(rag_docs_file_dir) / "vectors")
+    return _vector_index
+
+
+def vector_search(
+    query: str, k: int = DEFAULT_TOP_K, source_ids: Iterable[int] | None = None
+) -> list[tuple[int, float]]:
+    """Embed a query and return the (chunk id, score) of the k most similar chunks."""
+    return get_vector_index().search(get_embedder().embed([query])[0], k=k, source_ids=source_ids)
@@ -1,6 +1,7 @@
 import reflex as rx
 
 from runbook.api_routes import api_route_kwargs
+from runbook.llm_tools import keep_model_warm, monitor_endpoints
 from runbook.page_chat.chat_page import chat_page
 from runbook.page_chat.chat_state import ChatState
 from runbook.utils import make_require_login
@@ -21,4 +22,6 @@ def index():
 
 
 app.api.add_api_route(**api_route_kwargs)
+app.register_lifespan_task(keep_model_warm)
+app.register_lifespan_task(monitor_endpoints)
 app.add_page(index, route="/", on_load=[ChatState.on_load_index])
@@ -51,11 +51,23 @@ def add_document_component():
         # URL Input section
         rx.form(
             rx.hstack(
-                rx.input(placeholder="Enter document URL...", name="url", width="100%"),
+                rx.input(placeholder="Enter document URL(s)...", name="url", width="100%"),
                 rx.button("Add", type="submit", loading=ChatState.processing_document),
             ),
             on_submit=ChatState.add_document,
         ),
+        # Crawl a whole docs site from a seed page or sitemap.xml
+        rx.form(
+            rx.hstack(
+                rx.input(placeholder="Crawl from seed URL or sitemap.xml...", name="seed_url", width="100%"),
+                rx.button("Crawl", type="submit", loading=ChatState.crawl_running),
+            ),
+            on_submit=ChatState.crawl_documents,
+        ),
+        rx.cond(
+            ChatState.crawl_status_text != "",
+            rx.text(ChatState.crawl_status_text, size="1", color=rx.color("slate", 11)),
+        ),
         width="100%",
         spacing="4",
     )
@@ -77,6 +89,10 @@ def use_document_library():
                 rx.hstack(
                     rx.text("Document Library"),
                     rx.spacer(),
+                    rx.box(
+                        rx.tooltip(badge_with_icon("refresh-cw"), content="refresh stale documents"),
+                        on_click=ChatState.refresh_stale_documents,
+                    ),
                     rx.dialog.close(rx.icon(tag="x", on_click=LibraryDocument.toggle_library)),
                 ),
                 rx.dialog.description("View loaded documents and add new ones by URL."),
@@ -120,16 +136,28 @@ def input_box(chat_state: ChatState, **kwargs):
                 display="flex",
                 align="center",
             ),
-            button_with_icon(
-                text=ChatState.send_message_text,
-                icon="send",
-                is_loading=chat_state.ai_loading,
-                on_click=chat_state.submit_prompt,
+            rx.cond(
+                chat_state.generating,
+                button_with_icon(text="Stop", icon="square", on_click=chat_state.stop_generation),
+                button_with_icon(
+                    text=ChatState.send_message_text,
+                    icon="send",
+                    is_loading=chat_state.ai_loading,
+                    on_click=chat_state.submit_prompt,
+                ),
             ),
             width="100%",
             display="flex",
             justify="between",
         ),
+        rx.cond(
+            chat_state.queue_position_text != "",
+            rx.text(chat_state.queue_position_text, size="1", color=rx.color("slate", 11)),
+        ),
+        rx.cond(
+            chat_state.response_timings_text != "",
+            rx.text(chat_state.response_timings_text, size="1", color=rx.color("slate", 11)),
+        ),
         width="100%",
         display="flex",
         align="start",
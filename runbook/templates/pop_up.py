@@ -4,6 +4,7 @@ import reflex as rx
 
 from runbook.components.badges import badge_with_icon
 from runbook.components.buttons import button_with_icon
+from runbook.page_chat.chat_state import ChatState
 from runbook.rag_tools import load_all_documents
 from runbook.templates.search_box import search_bar_with_sidebar_shortcut
 from runbook.templates.select import select_menu
@@ -46,7 +47,14 @@ def popup_menu():
 
     return rx.vstack(
         rx.hstack(
-            search_bar_with_sidebar_shortcut(width="100%"),
+            search_bar_with_sidebar_shortcut(
+                width="100%",
+                input_kwargs={
+                    "value": ChatState.library_query,
+                    "on_change": ChatState.search_library,
+                    "debounce_timeout": 150,
+                },
+            ),
             select_menu("list-filter", "Sort by"),
             width="100%",
         ),
@@ -119,6 +127,44 @@ def prompt_item(
     )
 
 
+def library_result_item(result: dict):
+    return rx.hstack(
+        rx.icon(
+            tag=rx.cond(result["kind"] == "runbook", "message-square", "file-text"),
+            size=16,
+            color=rx.color("slate", 11),
+        ),
+        rx.vstack(
+            rx.text(result["title"], weight="bold", color=rx.color("slate", 12)),
+            rx.text(result["snippet"], size="1", color=rx.color("slate", 11)),
+            spacing="1",
+            align="start",
+            overflow_x="hidden",
+        ),
+        width="100%",
+        align="start",
+        gap="12px",
+        cursor="pointer",
+        padding_bottom="12px",
+        on_click=[ChatState.open_library_result(result), LibraryPrompt.toggle_library],
+    )
+
+
+def list_library_results():
+    return rx.vstack(
+        rx.cond(
+            ChatState.library_results,
+            rx.foreach(ChatState.library_results, library_result_item),
+            rx.text("No matches.", color=rx.color("slate", 11)),
+        ),
+        width="100%",
+        height="30em",
+        overflow="scroll",
+        spacing="3",
+        padding="16px 0px",
+    )
+
+
 def list_prompt_component(prompt_items: list[dict]):
     return rx.vstack(
         *[prompt_item(title, description) for title, description in prompt_items],
@@ -181,6 +227,10 @@ def dialog_library_base(
 
 def dialog_library():
     return dialog_library_base(
-        list_prompt_component(prompt_items=__prompts__),
+        rx.cond(
+            ChatState.library_query != "",
+            list_library_results(),
+            list_prompt_component(prompt_items=__prompts__),
+        ),
         on_create_new_chat=PromptLibrary.create_new_prompt_entry,
     )
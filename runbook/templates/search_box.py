@@ -31,9 +31,12 @@ SearchBarStyle = BaseStyle(
 
 def _search_bar_base(
     *args,
+    input_kwargs: dict | None = None,
     **kwargs,
 ):
-    """Creates a common search box."""
+    """Creates a common search box.
+    - input_kwargs: Passed to the rx.input, e.g. `value` and `on_change` to wire up searching.
+    """
     return rx.hstack(
         rx.icon(
             tag="search",
@@ -49,6 +52,7 @@ def _search_bar_base(
             placeholder="Search for a runbook...",
             background_color="transparent",
             color=rx.color("slate", 11),
+            **(input_kwargs or {}),
         ),
         rx.spacer(),
         *args,
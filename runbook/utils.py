@@ -74,3 +74,13 @@ async def proc_ctx(state: type[rx.State], hooks: Sequence[Callable] = []) -> typ
             yield state
         finally:
             _ = await call_hooks()
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 chars per token), good enough for budgeting prompts without a tokenizer."""
+    return (len(text) + 3) // 4
+
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    """Cut `text` to at most `max_tokens` as counted by `estimate_tokens`."""
+    return text[: max(0, max_tokens) * 4]
@@ -10,6 +10,8 @@ saved_runbooks_dir = "./saved/runbooks"
 rag_docs_file_dir = "./saved/rag"
 # # table or file, file is easier to inspect
 rag_docs_storage_type = "table"  # StorageType.TABLE
+# flat (exact) or ivf (approximate, for libraries with hundreds of thousands of chunks)
+rag_vector_index_type = "flat"
 
 
 tz = timezone.utc
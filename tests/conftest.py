@@ -0,0 +1,35 @@
+import pytest
+
+from runbook import llm_tools
+from runbook.rag_tools import rag_blob, rag_bm25, rag_embed, rag_vector
+
+
+@pytest.fixture(autouse=True)
+def blob_store(tmp_path, monkeypatch):
+    """Keep document bodies written during tests out of the real `rag_docs_file_dir`."""
+    store = rag_blob.BlobStore(tmp_path / "blobs")
+    monkeypatch.setattr(rag_blob, "_blob_store", store)
+    return store
+
+
+@pytest.fixture(autouse=True)
+def vector_index(tmp_path, monkeypatch):
+    """Embed with the deterministic local embedder into a per-test vector index."""
+    monkeypatch.setattr(rag_embed, "_embedder", rag_embed.HashEmbedder())
+    index = rag_vector.VectorIndex(tmp_path / "vectors")
+    monkeypatch.setattr(rag_vector, "_vector_index", index)
+    return index
+
+
+@pytest.fixture(autouse=True)
+def keyword_index(tmp_path, monkeypatch):
+    index = rag_bm25.BM25Index(tmp_path / "bm25")
+    monkeypatch.setattr(rag_bm25, "_keyword_index", index)
+    return index
+
+
+@pytest.fixture(autouse=True)
+def response_cache(tmp_path, monkeypatch):
+    cache = llm_tools.ResponseCache(tmp_path / "llm_cache.sqlite3")
+    monkeypatch.setattr(llm_tools, "_response_cache", cache)
+    return cache
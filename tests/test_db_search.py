@@ -0,0 +1,96 @@
+import pytest
+from sqlmodel import Session, SQLModel, create_engine
+
+from runbook import db_ops
+from runbook.db_models import ChatInteraction, DocumentChunk, DocumentSource
+from runbook.db_ops import fetch_messages, fts_match_query, search_chat_interactions, search_documents
+
+
+@pytest.fixture
+def session(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'test.db'}")
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        yield session
+
+
+def chat(prompt: str, answer: str, user: str = "user") -> ChatInteraction:
+    return ChatInteraction(prompt=prompt, answer=answer, chat_participant_user_name=user, interaction_id=None)
+
+
+def test_fts_match_query_is_safe_and_prefixes_last_word():
+    assert fts_match_query('rotate "access" ke') == '"rotate" "access" "ke"*'
+    assert fts_match_query("NEAR(a b) OR -x") == '"NEAR" "a" "b" "OR" "x"*'
+    assert fts_match_query("  ?!  ") == ""
+
+
+def test_search_chat_interactions_ranks_and_tracks_changes(session):
+    # rows that exist before the fts table is created are indexed by the rebuild
+    session.add_all([chat("How do I rotate keys?", "Use the iam command."), chat("Cluster sizing", "Rotate rarely.")])
+    session.commit()
+
+    hits = search_chat_interactions("rotate key", session=session)
+    assert [c.prompt for c, _ in hits] == ["How do I rotate keys?"]  # porter stemming: keys -> key
+
+    new = chat("Spark tuning", "Set spark.sql.shuffle.partitions")
+    session.add(new)
+    session.commit()
+    assert [c.prompt for c, _ in search_chat_interactions("shuff", session=session)] == ["Spark tuning"]
+
+    new.answer = "Use adaptive query execution"
+    session.commit()
+    assert search_chat_interactions("shuffle", session=session) == []
+
+    session.delete(new)
+    session.commit()
+    assert search_chat_interactions("adaptive", session=session) == []
+
+    session.add(chat("How do I rotate keys?", "other user", user="someone"))
+    session.commit()
+    assert len(fetch_messages("user", "", filter_str="rotate keys", session=session)) == 1
+
+
+def test_search_documents_one_hit_per_live_document(session):
+    live = DocumentSource(path="https://docs.example.com/keys", title="Keys")
+    deleted = DocumentSource(path="https://docs.example.com/old", title="Old", is_deleted=True)
+    session.add_all([live, deleted])
+    session.commit()
+    session.add_all(
+        [
+            DocumentChunk(
+                source_id=live.id,
+                chunk_index=i,
+                text=f"rotate the access key, step {i}",
+                heading="Keys",
+                start_offset=0,
+                end_offset=1,
+                num_tokens=1,
+                source_hash="x",
+            )
+            for i in range(3)
+        ]
+        + [
+            DocumentChunk(
+                source_id=deleted.id,
+                chunk_index=0,
+                text="rotate the access key",
+                start_offset=0,
+                end_offset=1,
+                num_tokens=1,
+                source_hash="y",
+            )
+        ]
+    )
+    session.commit()
+
+    hits = search_documents("access key", session=session)
+    assert [(source.title, "access key" in snippet) for source, snippet in hits] == [("Keys", True)]
+
+
+def test_fallback_without_fts(session, monkeypatch):
+    monkeypatch.setattr(db_ops, "ensure_fts", lambda session: False)
+    session.add(chat("How do I rotate keys?", "Use the iam command."))
+    session.commit()
+
+    ((hit, snippet),) = search_chat_interactions("iam command", session=session)
+    assert hit.prompt == "How do I rotate keys?" and "iam command" in snippet
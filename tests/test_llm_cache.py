@@ -0,0 +1,198 @@
+import asyncio
+
+import ollama
+import pytest
+
+from runbook.llm_tools import (
+    AsyncLLMClient,
+    LLMClient,
+    LLMConfig,
+    ResponseCache,
+    in_hours,
+    keep_warm_hours,
+    response_cache_key,
+)
+
+MESSAGES = [{"role": "user", "content": [{"type": "text", "text": "rotate the access key"}]}]
+
+
+@pytest.fixture
+def client(monkeypatch):
+    """LLMClient whose model calls are counted, answering "chunk 0chunk 1..." (streamed chunk by chunk)."""
+    client = LLMClient(base_url="http://localhost:11434/v1")
+    client.calls = 0
+
+    def chat(model, messages, stream, options, keep_alive):
+        client.calls += 1
+        parts = [
+            ollama.ChatResponse(model=model, message={"role": "assistant", "content": f"chunk {i}"}) for i in range(3)
+        ]
+        if stream:
+            return iter(parts)
+        return ollama.ChatResponse(model=model, message={"role": "assistant", "content": "chunk 0chunk 1chunk 2"})
+
+    monkeypatch.setattr(client, "chat", chat)
+    return client
+
+
+def test_key_covers_model_messages_and_kwargs():
+    key = response_cache_key("ollama", "llama", MESSAGES, {"temperature": 0.5})
+    # openai style content parts hash like the plain string they are flattened into
+    assert key == response_cache_key(
+        "ollama", "llama", [{"role": "user", "content": "rotate the access key"}], {"temperature": 0.5}
+    )
+    assert key != response_cache_key("ollama", "mistral", MESSAGES, {"temperature": 0.5})
+    assert key != response_cache_key("ollama", "llama", MESSAGES, {"temperature": 0.7})
+
+
+def test_full_response_replayed(client, response_cache):
+    first = client.chat_completion("llama", MESSAGES, temperature=0.5)
+    second = client.chat_completion("llama", MESSAGES, temperature=0.5)
+
+    assert client.calls == 1
+    assert second.message.content == first.message.content
+    assert response_cache.stats == {"hits": 1, "misses": 1}
+
+
+def test_stream_replayed_only_once_complete(client):
+    stream = client.chat_completion("llama", MESSAGES, stream=True)
+    next(stream)  # abandoned half way, nothing cached
+    assert "".join(item.message.content for item in client.chat_completion("llama", MESSAGES, stream=True)) == (
+        "chunk 0chunk 1chunk 2"
+    )
+    assert client.calls == 2
+
+    replay = list(client.chat_completion("llama", MESSAGES, stream=True))
+    assert client.calls == 2
+    assert "".join(item.message.content for item in replay) == "chunk 0chunk 1chunk 2"
+
+
+def test_bypass_calls_the_model(client):
+    client.chat_completion("llama", MESSAGES)
+    client.chat_completion("llama", MESSAGES, cache=False)
+    assert client.calls == 2
+
+
+def test_requests_keep_the_model_loaded(client, monkeypatch):
+    sent = {}
+
+    def chat(**kwargs):
+        sent.update(kwargs)
+        return ollama.ChatResponse(model="llama", message={"role": "assistant", "content": "ok"})
+
+    monkeypatch.setattr(client, "chat", chat)
+    monkeypatch.setattr(LLMConfig, "ai_keep_alive", -1.0)
+    client.chat_completion("llama", MESSAGES)
+    assert sent["keep_alive"] == -1.0
+
+
+def test_context_window_sent_with_every_request(client, async_client, monkeypatch):
+    options = []
+
+    def chat(**kwargs):
+        options.append(kwargs["options"])
+        return ollama.ChatResponse(model="llama", message={"role": "assistant", "content": "ok"})
+
+    monkeypatch.setattr(client, "chat", chat)
+    client.chat_completion("llama", MESSAGES, max_tokens=64)
+    asyncio.run(stream_text(async_client))
+
+    assert options[0] == {"num_ctx": LLMConfig.ai_context_tokens, "num_predict": 64}
+    assert async_client.options["num_ctx"] == LLMConfig.ai_context_tokens
+
+
+def test_keep_warm_hours():
+    assert keep_warm_hours("") is None
+    assert [in_hours(hour, keep_warm_hours("8-18")) for hour in (7, 8, 17, 18)] == [False, True, True, False]
+    assert [in_hours(hour, keep_warm_hours("22-6")) for hour in (21, 22, 3, 6)] == [False, True, True, False]
+    # a typo in the setting falls back to the default rather than ending the keep warm task
+    assert keep_warm_hours("8am-6pm") == keep_warm_hours("8-18-20") == keep_warm_hours("8-30") == (8, 18)
+
+
+def test_lru_eviction(response_cache):
+    response_cache.max_bytes = 10
+    response_cache.put("a", "12345")
+    response_cache.put("b", "12345")
+    response_cache.get("a")  # `b` is now the least recently used
+    response_cache.put("c", "12345")
+
+    assert response_cache.get("b") is None
+    assert response_cache.get("a") == "12345" and response_cache.get("c") == "12345"
+
+
+def test_size_tracked_without_rescanning(tmp_path, response_cache):
+    response_cache.max_bytes = 100
+    response_cache.put("a", "12345")
+    response_cache.put("b", "123")
+    response_cache.put("a", "1")  # replacing an entry only counts its new size
+    assert response_cache.total_bytes == 4
+
+    response_cache.max_bytes = 3
+    response_cache.put("c", "12")
+    assert response_cache.total_bytes == 3 and response_cache.get("b") is None
+    # the running total is where a new connection starts from
+    assert ResponseCache(tmp_path / "llm_cache.sqlite3").total_bytes == 3
+
+
+def test_hits_written_in_batches(response_cache):
+    response_cache.touch_batch = 3
+    for key in "abc":
+        response_cache.put(key, key)
+    response_cache._conn.execute("UPDATE response SET accessed_at = 0")
+
+    def accessed_at() -> list[float]:
+        return [row[0] for row in response_cache._conn.execute("SELECT accessed_at FROM response ORDER BY key")]
+
+    for key in "aab":
+        response_cache.get(key)
+    response_cache.get("x")  # misses aren't noted
+    assert accessed_at() == [0, 0, 0]
+    response_cache.get("c")
+    assert all(accessed_at())
+
+
+@pytest.fixture
+def async_client(monkeypatch):
+    client = AsyncLLMClient(base_url="http://localhost:11434/v1")
+    client.calls = 0
+    client.closed = False
+
+    async def chat(model, messages, stream, options, keep_alive):
+        client.calls += 1
+        client.options = options
+
+        async def parts():
+            try:
+                for i in range(3):
+                    yield ollama.ChatResponse(model=model, message={"role": "assistant", "content": f"chunk {i}"})
+            finally:
+                client.closed = True
+
+        return parts()
+
+    monkeypatch.setattr(client, "chat", chat)
+    return client
+
+
+async def stream_text(client: AsyncLLMClient) -> str:
+    stream = await client.chat_completion("llama", MESSAGES, stream=True)
+    return "".join([item.message.content async for item in stream])
+
+
+def test_async_stream_replayed(async_client):
+    assert asyncio.run(stream_text(async_client)) == "chunk 0chunk 1chunk 2"
+    assert asyncio.run(stream_text(async_client)) == "chunk 0chunk 1chunk 2"
+    assert async_client.calls == 1
+
+
+def test_async_stream_closed_early_is_released_and_not_cached(async_client):
+    async def stop_after_first_chunk():
+        stream = await async_client.chat_completion("llama", MESSAGES, stream=True)
+        await anext(stream)
+        await stream.aclose()
+
+    asyncio.run(stop_after_first_chunk())
+    assert async_client.closed
+
+    asyncio.run(stream_text(async_client))
+    assert async_client.calls == 2
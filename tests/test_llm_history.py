@@ -0,0 +1,85 @@
+from runbook.db_models import ChatInteraction
+from runbook.llm_tools import (
+    batch_turns,
+    count_prompt_tokens,
+    create_messages_for_chat_completion,
+    history_fold_point,
+    history_overflow,
+)
+from runbook.utils import estimate_tokens
+
+
+def turn(i: int, chars: int = 400) -> ChatInteraction:
+    return ChatInteraction(prompt=f"question {i}", answer=f"answer {i} " + "x" * chars, chat_participant_user_name="u")
+
+
+def texts(messages) -> list[str]:
+    return [m["content"] if isinstance(m["content"], str) else m["content"][0]["text"] for m in messages]
+
+
+def test_history_overflow_keeps_newest_turns():
+    turns = [turn(i) for i in range(10)]  # ~105 tokens each
+    assert history_overflow(turns, budget_tokens=10_000) == 0
+    assert history_overflow(turns, budget_tokens=350) == 7
+    assert history_overflow(turns, budget_tokens=0) == 10
+
+
+def test_messages_fit_the_budget_and_drop_oldest_turns():
+    turns = [turn(i) for i in range(50)]
+    messages = create_messages_for_chat_completion(turns, "next question", max_prompt_tokens=1000)
+
+    assert count_prompt_tokens(messages) <= 1000
+    assert texts(messages)[-3:] == ["question 49", turns[49].answer, "next question"]
+    assert "question 0" not in texts(messages)
+
+
+def test_oversized_prompt_context_and_summary_are_cut_to_the_budget():
+    turns = [turn(i) for i in range(4)]
+    context, summary = "excerpt " * 2000, "summary " * 500
+    messages = create_messages_for_chat_completion(
+        turns, "next question", context=context, summary=summary, summarized_turns=2, max_prompt_tokens=1000
+    )
+
+    assert count_prompt_tokens(messages) <= 1000
+    assert texts(messages)[-1].startswith("Documentation excerpts:\n\nexcerpt")
+    assert texts(messages)[-1].endswith("next question")
+    assert "question 3" not in texts(messages)  # history goes first
+
+    # a prompt that alone is over budget keeps its start, nothing else is sent besides the instructions
+    messages = create_messages_for_chat_completion(turns, "long " * 2000, context=context, max_prompt_tokens=1000)
+    assert count_prompt_tokens(messages) <= 1000
+    assert len(messages) == 2 and texts(messages)[-1].startswith("long long")
+
+
+def test_summary_replaces_summarized_turns():
+    turns = [turn(i) for i in range(6)]
+    messages = create_messages_for_chat_completion(
+        turns, "next question", summary="The user is rotating keys.", summarized_turns=4, max_prompt_tokens=5000
+    )
+
+    # the summary follows the instructions instead of being part of them, they stay a stable prompt prefix
+    assert texts(messages)[0] == texts(create_messages_for_chat_completion(turns, "other question"))[0]
+    assert texts(messages)[1] == "Summary of the earlier conversation:\nThe user is rotating keys."
+    assert texts(messages)[2:] == ["question 4", turns[4].answer, "question 5", turns[5].answer, "next question"]
+
+
+def test_history_folds_in_steps():
+    per_turn = estimate_tokens(turn(0).prompt) + estimate_tokens(turn(0).answer)
+    budget = 6 * per_turn
+    turns = [turn(i) for i in range(6)]
+    assert history_fold_point(turns, 0, budget) == 0
+
+    # one turn over budget folds down to half of it, the next turns leave the summary as it is
+    turns.append(turn(6))
+    assert history_fold_point(turns, 0, budget) == 4
+    assert [history_fold_point(turns + [turn(i) for i in range(7, n)], 4, budget) for n in (7, 9, 10)] == [4, 4, 4]
+    assert history_fold_point(turns + [turn(i) for i in range(7, 11)], 4, budget) == 8
+
+
+def test_batch_turns_fit_budget():
+    turns = [turn(i) for i in range(7)]
+    per_turn = estimate_tokens(turns[0].prompt) + estimate_tokens(turns[0].answer)
+    batches = batch_turns(turns, budget_tokens=3 * per_turn)
+
+    assert [len(batch) for batch in batches] == [3, 3, 1]
+    assert [len(batch) for batch in batch_turns(turns, budget_tokens=1)] == [1] * 7
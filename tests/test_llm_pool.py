@@ -0,0 +1,171 @@
+import asyncio
+import json
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from runbook import llm_tools
+from runbook.llm_tools import AsyncLLMPool
+
+MESSAGES = [{"role": "user", "content": "rotate the access key"}]
+
+
+class StubOllama(BaseHTTPRequestHandler):
+    """Minimal ollama `/api/chat` answering with the server's name, after `delay` seconds."""
+
+    def do_GET(self):
+        self._send_json({"version": "stub"})
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        self.server.requests += 1
+        time.sleep(self.server.delay)
+        if not body.get("stream"):
+            self._send_json(self._chunk(self.server.name, done=True))
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.end_headers()
+        for part in (self.server.name, " says hi"):
+            self.wfile.write(json.dumps(self._chunk(part, done=False)).encode() + b"\n")
+        self.wfile.write(json.dumps(self._chunk("", done=True)).encode() + b"\n")
+
+    def _chunk(self, content: str, done: bool) -> dict:
+        return {"model": "stub", "message": {"role": "assistant", "content": content}, "done": done}
+
+    def _send_json(self, payload: dict):
+        data = json.dumps(payload).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub_servers():
+    servers = []
+
+    def start(name: str, delay: float = 0.0) -> str:
+        server = ThreadingHTTPServer(("127.0.0.1", 0), StubOllama)
+        server.name, server.delay, server.requests = name, delay, 0
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return f"http://127.0.0.1:{server.server_port}/v1"
+
+    yield start, servers
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def dead_url() -> str:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    return f"http://127.0.0.1:{port}/v1"
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+async def stream_text(pool: AsyncLLMPool) -> str:
+    stream = await pool.chat_completion("stub", MESSAGES, stream=True, cache=False)
+    return "".join([item.message.content async for item in stream])
+
+
+def test_requests_spread_over_least_busy_endpoints(stub_servers):
+    start, servers = stub_servers
+    pool = AsyncLLMPool([start("a", delay=0.2), start("b", delay=0.2)])
+
+    async def run():
+        return await asyncio.gather(*(pool.chat_completion("stub", MESSAGES, cache=False) for _ in range(4)))
+
+    answers = asyncio.run(run())
+    assert sorted(resp.message.content for resp in answers) == ["a", "a", "b", "b"]
+    assert [server.requests for server in servers] == [2, 2]
+    assert all(stats["in_flight"] == 0 and stats["requests"] == 2 for stats in pool.stats.values())
+
+
+def test_fails_over_from_unreachable_endpoint(stub_servers):
+    start, servers = stub_servers
+    clock = Clock()
+    dead = dead_url()
+    pool = AsyncLLMPool([dead, start("b")], health_check_interval=30, clock=clock)
+
+    assert asyncio.run(stream_text(pool)) == "b says hi"
+    assert pool.stats[dead]["healthy"] is False and pool.stats[dead]["errors"] == 1
+
+    # skipped while marked unhealthy, tried again once the interval passed
+    asyncio.run(stream_text(pool))
+    assert pool.stats[dead]["errors"] == 1
+    clock.now = 31
+    assert asyncio.run(stream_text(pool)) == "b says hi"
+    assert pool.stats[dead]["errors"] == 2
+    assert servers[0].requests == 3 and pool.stats[dead]["in_flight"] == 0
+
+
+def test_health_check_and_all_unreachable(stub_servers):
+    start, _ = stub_servers
+    live, dead = start("a"), dead_url()
+    pool = AsyncLLMPool([live, dead])
+    assert asyncio.run(pool.check_health()) == {live: True, dead: False}
+
+    with pytest.raises(ConnectionError):
+        asyncio.run(AsyncLLMPool([dead_url(), dead_url()]).chat_completion("stub", MESSAGES, cache=False))
+
+
+def test_endpoints_monitored_in_the_background(stub_servers, monkeypatch):
+    start, _ = stub_servers
+    live, dead = start("a"), dead_url()
+    monkeypatch.setattr(llm_tools, "_client_registry", llm_tools.ClientRegistry())
+    monkeypatch.setattr(llm_tools.LLMConfig, "ai_provider", "ollama")
+    monkeypatch.setattr(llm_tools.LLMConfig, "ai_provider_urls", [live, dead])
+    monkeypatch.setattr(llm_tools.LLMConfig, "ai_health_check_interval", 0.05)
+
+    async def run():
+        task = asyncio.create_task(llm_tools.monitor_endpoints())
+        await asyncio.sleep(0.3)
+        task.cancel()
+        pool = llm_tools.get_async_ai_client(
+            "ollama", live, llm_tools.LLMConfig.ai_provider_api_key, ai_provider_urls=[live, dead]
+        )
+        return pool.stats
+
+    stats = asyncio.run(run())
+    # the dead endpoint is found without any request being sent to it, and checked again every interval
+    assert stats[live]["healthy"] is True and stats[live]["requests"] == 0
+    assert stats[dead]["healthy"] is False and stats[dead]["errors"] > 1
+
+
+def test_registry_shares_clients_per_key_and_loop(monkeypatch):
+    registry = llm_tools.ClientRegistry()
+    monkeypatch.setattr(llm_tools, "_client_registry", registry)
+
+    with ThreadPoolExecutor(8) as pool:
+        clients = list(pool.map(lambda _: llm_tools.get_ai_client("ollama", "http://a:11434/v1", "key"), range(32)))
+    assert len({id(client) for client in clients}) == 1
+    assert llm_tools.get_ai_client("ollama", "http://b:11434/v1", "key") is not clients[0]
+
+    async def async_clients():
+        url = "http://a:11434/v1"
+        return llm_tools.get_async_ai_client("ollama", url), llm_tools.get_async_ai_client("ollama", url)
+
+    first, again = asyncio.run(async_clients())
+    assert first is again
+    # a new loop can't use the connections of the last one, it gets its own client and the old one is dropped
+    other, _ = asyncio.run(async_clients())
+    assert other is not first
+    assert (registry.created, len(registry)) == (4, 3)
@@ -0,0 +1,101 @@
+import asyncio
+
+from runbook.llm_tools import LLMScheduler, Priority
+
+
+async def request(scheduler: LLMScheduler, user: str, served: list[str], release: asyncio.Event, **kwargs):
+    async with scheduler.slot(user, **kwargs):
+        served.append(user)
+        await release.wait()
+
+
+async def settle():
+    for _ in range(10):
+        await asyncio.sleep(0)
+
+
+def test_concurrency_limit_and_round_robin_between_users():
+    async def run():
+        scheduler = LLMScheduler(concurrency=1)
+        served: list[str] = []
+        release = asyncio.Event()
+        # one user queues a batch of requests before another user asks once
+        tasks = [asyncio.create_task(request(scheduler, "a", served, release)) for _ in range(3)]
+        await settle()
+        tasks.append(asyncio.create_task(request(scheduler, "b", served, release)))
+        await settle()
+        assert (scheduler.running, scheduler.waiting) == (1, 3)
+
+        release.set()
+        await asyncio.gather(*tasks)
+        return served, scheduler
+
+    served, scheduler = asyncio.run(run())
+    assert served == ["a", "a", "b", "a"]
+    assert scheduler.running == 0 and scheduler.metrics.requests == 4
+
+
+def test_interactive_before_background():
+    async def run():
+        scheduler = LLMScheduler(concurrency=1)
+        served: list[str] = []
+        release = asyncio.Event()
+        tasks = [asyncio.create_task(request(scheduler, "running", served, release))]
+        await settle()
+        tasks.append(asyncio.create_task(request(scheduler, "convert", served, release, priority=Priority.BACKGROUND)))
+        tasks.append(asyncio.create_task(request(scheduler, "chat", served, release)))
+        await settle()
+        release.set()
+        await asyncio.gather(*tasks)
+        return served
+
+    assert asyncio.run(run()) == ["running", "chat", "convert"]
+
+
+def test_queue_positions_reported_while_waiting():
+    async def run():
+        scheduler = LLMScheduler(concurrency=1)
+        served: list[str] = []
+        positions: list[int] = []
+        first, second = asyncio.Event(), asyncio.Event()
+
+        async def on_wait(position: int) -> None:
+            positions.append(position)
+
+        tasks = [
+            asyncio.create_task(request(scheduler, "a", served, first)),
+            asyncio.create_task(request(scheduler, "b", served, second)),
+        ]
+        await settle()
+        tasks.append(asyncio.create_task(request(scheduler, "c", served, second, on_wait=on_wait)))
+        await settle()
+        first.set()
+        await settle()
+        second.set()
+        await asyncio.gather(*tasks)
+        return positions
+
+    assert asyncio.run(run()) == [2, 1]
+
+
+def test_cancelled_while_queued_frees_its_place():
+    async def run():
+        scheduler = LLMScheduler(concurrency=1)
+        served: list[str] = []
+        release = asyncio.Event()
+        running = asyncio.create_task(request(scheduler, "a", served, release))
+        await settle()
+        stopped = asyncio.create_task(request(scheduler, "b", served, release))
+        waiting = asyncio.create_task(request(scheduler, "c", served, release))
+        await settle()
+
+        stopped.cancel()
+        await settle()
+        assert scheduler.waiting == 1
+        release.set()
+        await asyncio.gather(running, waiting)
+        return served, scheduler
+
+    served, scheduler = asyncio.run(run())
+    assert served == ["a", "c"]
+    assert scheduler.running == 0 and scheduler.waiting == 0
@@ -0,0 +1,78 @@
+import asyncio
+
+from runbook.llm_tools import append_streamed, coalesce_deltas, until_stopped
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+async def deltas(clock: Clock, texts: list[str], step: float, closed: list[bool]):
+    try:
+        for text in texts:
+            clock.now += step
+            yield text
+    finally:
+        closed.append(True)
+
+
+def coalesce(texts: list[str], step: float, **kwargs) -> list[str]:
+    async def run():
+        clock = Clock()
+        stream = deltas(clock, texts, step, [])
+        return [text async for text in coalesce_deltas(stream, clock=clock, **kwargs)]
+
+    return asyncio.run(run())
+
+
+def test_flushes_on_time_window():
+    assert coalesce(list("abcdefg"), step=0.02, interval=0.05, max_chars=100) == ["abc", "def", "g"]
+
+
+def test_flushes_on_size():
+    assert coalesce(["aa", "bb", "cc", "d"], step=0.0, interval=1.0, max_chars=4) == ["aabb", "ccd"]
+
+
+def test_streamed_answer_settles_in_steps():
+    settled, tail, sent = "", "", []
+    for text in ["abc", "de", "fgh", "ij", "k"]:
+        settled, tail = append_streamed(settled, tail, text, settle_chars=5)
+        sent.append((settled, tail))
+    assert sent == [("", "abc"), ("abcde", ""), ("abcde", "fgh"), ("abcdefghij", ""), ("abcdefghij", "k")]
+
+
+def test_closing_early_closes_the_source():
+    async def run():
+        clock, closed = Clock(), []
+        stream = coalesce_deltas(deltas(clock, ["a"] * 10, 0.0, closed), max_chars=2, clock=clock)
+        assert await anext(stream) == "aa"
+        await stream.aclose()
+        return closed
+
+    assert asyncio.run(run()) == [True]
+
+
+def test_stop_interrupts_a_stream_waiting_for_its_next_item():
+    async def run():
+        closed = []
+
+        async def slow():
+            try:
+                yield "first"
+                await asyncio.sleep(60)
+                yield "never"
+            finally:
+                closed.append(True)
+
+        stop = asyncio.Event()
+        received = []
+        async for item in until_stopped(slow(), stop):
+            received.append(item)
+            asyncio.get_running_loop().call_later(0.01, stop.set)
+        return received, closed
+
+    assert asyncio.run(asyncio.wait_for(run(), timeout=5)) == (["first"], [True])
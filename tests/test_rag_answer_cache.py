@@ -0,0 +1,79 @@
+from runbook.rag_tools.rag_answer_cache import AnswerCache
+from runbook.rag_tools.rag_embed import HashEmbedder
+
+embedder = HashEmbedder()
+SCOPE = AnswerCache.scope("llama", embedder.model, [1, 2])
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def embed(text: str):
+    return embedder.embed([text])[0]
+
+
+def test_similar_prompt_hits_within_scope():
+    cache = AnswerCache(threshold=0.8)
+    cache.store(embed("how do I rotate credentials on the databricks workspace"), "q", "rotate them", SCOPE, 7)
+
+    hit = cache.lookup(embed("how do I rotate the credentials on databricks workspace"), SCOPE)
+    assert hit is not None
+    assert (hit.answer, hit.chat_interaction_id) == ("rotate them", 7)
+
+    assert cache.lookup(embed("which regions support serverless sql warehouses"), SCOPE) is None
+    assert cache.stats.hits == 1 and cache.stats.misses == 1
+    assert cache.stats.hit_rate == 0.5
+
+
+def test_other_model_or_documents_miss():
+    cache = AnswerCache(threshold=0.8)
+    vector = embed("how do I rotate credentials")
+    cache.store(vector, "q", "a", SCOPE)
+
+    assert cache.lookup(vector, AnswerCache.scope("mistral", embedder.model, [1, 2])) is None
+    assert cache.lookup(vector, AnswerCache.scope("llama", embedder.model, [1, 3])) is None
+    assert cache.lookup(vector, SCOPE) is not None
+
+
+def test_ttl_and_lru_eviction():
+    clock = Clock()
+    cache = AnswerCache(threshold=0.99, ttl=10, max_entries=2, clock=clock)
+    first, second, third = embed("rotate credentials"), embed("revoke tokens"), embed("create cluster")
+    cache.store(first, "first", "a", SCOPE)
+    cache.store(second, "second", "b", SCOPE)
+
+    # touching `first` makes `second` the least recently used
+    assert cache.lookup(first, SCOPE) is not None
+    cache.store(third, "third", "c", SCOPE)
+    assert cache.lookup(second, SCOPE) is None
+    assert cache.stats.evictions == 1
+
+    clock.now = 11
+    assert cache.lookup(first, SCOPE) is None
+    assert len(cache) == 0 and cache.stats.expirations == 2
+
+
+def test_invalidate_sources():
+    cache = AnswerCache()
+    cache.store(embed("a"), "a", "a", AnswerCache.scope("llama", embedder.model, [1]))
+    cache.store(embed("b"), "b", "b", AnswerCache.scope("llama", embedder.model, [2]))
+
+    assert cache.invalidate_sources([1, 5]) == 1
+    assert len(cache) == 1
+
+
+def test_follow_ups_only_hit_after_the_same_conversation():
+    cache = AnswerCache(threshold=0.8)
+    vector = embed("make that shorter")
+    first = [("how do I rotate credentials", "rotate them like this")]
+    other = [("how do I create a cluster", "create it like this")]
+    cache.store(vector, "make that shorter", "rotate them", AnswerCache.scope("llama", embedder.model, [], first))
+
+    assert cache.lookup(vector, AnswerCache.scope("llama", embedder.model, [], other)) is None
+    assert cache.lookup(vector, AnswerCache.scope("llama", embedder.model, [])) is None  # not a first prompt
+    assert cache.lookup(vector, AnswerCache.scope("llama", embedder.model, [], list(first))) is not None
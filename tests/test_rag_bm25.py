@@ -0,0 +1,105 @@
+import numpy as np
+import pytest
+from sqlmodel import Session, SQLModel, create_engine
+
+from runbook.db_models import DocumentSource
+from runbook.rag_tools import rag_bm25
+from runbook.rag_tools.rag_blob import atomic_write, get_blob_store
+from runbook.rag_tools.rag_bm25 import BM25Index, keyword_search, tokenize
+from runbook.rag_tools.rag_pipeline import process_documents, unindex_documents
+
+DOCS = [
+    "Set spark.sql.shuffle.partitions to 200 for small clusters.",
+    "Run `databricks clusters create --max-workers 8` to cap autoscaling.",
+    "ERR_CONN_RESET means the driver restarted, check the cluster event log.",
+    "Clusters autoscale between min and max workers.",
+]
+
+
+@pytest.fixture
+def session():
+    engine = create_engine("sqlite://")
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        yield session
+
+
+def test_tokenize_keeps_identifiers_and_their_parts():
+    tokens = tokenize("Use --max-workers and spark.sql.shuffle.partitions, see ERR_CONN_RESET")
+    assert {"max-workers", "max", "workers", "spark.sql.shuffle.partitions", "shuffle", "err_conn_reset"} <= set(tokens)
+    assert "and" not in tokens
+
+
+def test_search_ranks_exact_identifiers(tmp_path):
+    index = BM25Index(tmp_path / "bm25")
+    index.add([10, 11, 12, 13], [1, 1, 2, 2], DOCS)
+
+    assert index.search("ERR_CONN_RESET")[0][0] == 12
+    assert index.search("what does --max-workers do")[0][0] == 11
+    assert index.search("shuffle partitions", k=1)[0][0] == 10
+    assert {c for c, _ in index.search("clusters")} == {10, 11, 13}
+    assert [c for c, _ in index.search("clusters", source_ids=[2])] == [13]
+    assert index.search("nonexistent") == []
+
+
+def test_incremental_add_matches_bulk_build_and_survives_reload(tmp_path):
+    bulk = BM25Index(tmp_path / "bulk")
+    bulk.add([10, 11, 12, 13], [1, 1, 2, 2], DOCS)
+    incremental = BM25Index(tmp_path / "incremental")
+    for i, doc in enumerate(DOCS):
+        incremental.add([10 + i], [1 if i < 2 else 2], [doc])
+
+    reloaded = BM25Index(tmp_path / "incremental")
+    for query in ["clusters workers", "shuffle", "driver restarted event log"]:
+        assert incremental.search(query) == bulk.search(query) == reloaded.search(query)
+
+
+def test_remove_sources_soft_deletes_then_compacts(tmp_path):
+    index = BM25Index(tmp_path / "bm25", compact_ratio=0.6)
+    index.add([10, 11, 12, 13], [1, 1, 2, 2], DOCS)
+    postings = index.num_postings
+
+    assert index.remove_sources([2]) == 2
+    assert index.num_postings == postings  # masked only
+    assert index.search("ERR_CONN_RESET") == []
+    assert index.indexed_sources() == {1}
+
+    index.add([14], [3], ["Restart the driver after ERR_CONN_RESET."])
+    index.remove_sources([1])  # now over the ratio, dead rows are dropped
+    assert len(index._postings.alive) == 1 and index._postings.alive.all()
+    assert [c for c, _ in index.search("ERR_CONN_RESET driver")] == [14]
+    assert np.all(np.diff(index._postings.offsets) >= 0)
+
+
+def test_interrupted_save_keeps_the_previous_generation(tmp_path, monkeypatch):
+    index = BM25Index(tmp_path / "bm25")
+    index.add([10, 11], [1, 1], DOCS[:2])
+
+    def crash(path, write):
+        if path.name == "meta.json":
+            raise OSError("disk full")
+        atomic_write(path, write)
+
+    # the new postings and vocabulary are written, the process dies before the manifest is swapped
+    with monkeypatch.context() as patched, pytest.raises(OSError):
+        patched.setattr(rag_bm25, "atomic_write", crash)
+        index.add([12, 13], [2, 2], DOCS[2:])
+
+    reloaded = BM25Index(tmp_path / "bm25")
+    assert len(reloaded) == 2 and reloaded.search("ERR_CONN_RESET") == []
+    assert reloaded.search("shuffle partitions")[0][0] == 10
+    assert sorted(path.name for path in (tmp_path / "bm25").iterdir()) == sorted(
+        [*reloaded._files.values(), "meta.json"]
+    )
+
+
+def test_process_documents_keyword_indexes_chunks(session, keyword_index):
+    source = DocumentSource(path="https://docs.example.com/errors", parsed_blob=get_blob_store().put(DOCS[2]))
+    session.add(source)
+    session.commit()
+
+    process_documents([source.id], session=session)
+    assert keyword_search("ERR_CONN_RESET")
+
+    unindex_documents([source.id])
+    assert keyword_search("ERR_CONN_RESET") == []
@@ -0,0 +1,63 @@
+import pytest
+from sqlmodel import Session, SQLModel, create_engine, select
+
+from runbook.db_models import DocumentChunk, DocumentSource
+from runbook.rag_tools.rag_blob import get_blob_store
+from runbook.rag_tools.rag_chunk import chunk_markdown
+from runbook.rag_tools.rag_pipeline import process_documents
+
+MARKDOWN = "\n\n".join(
+    [
+        "# Credentials",
+        "Intro paragraph about credentials.",
+        "## Rotate",
+        *[f"Step {i}: " + "run the rotation command and verify it worked. " * 2 for i in range(8)],
+        "```bash\naws iam create-access-key\n\naws iam delete-access-key\n```",
+        "## Revoke",
+        "Revoke the old key.",
+    ]
+)
+
+
+@pytest.fixture
+def session():
+    engine = create_engine("sqlite://")
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        yield session
+
+
+def test_chunk_markdown_offsets_headings_and_budget():
+    chunks = chunk_markdown(MARKDOWN, max_tokens=80, overlap_tokens=40)
+
+    assert all(MARKDOWN[c.start : c.end] == c.text for c in chunks)
+    assert all(c.num_tokens <= 80 for c in chunks)
+    assert [c.index for c in chunks] == list(range(len(chunks)))
+    assert chunks[0].heading == "Credentials"
+    assert chunks[-1].heading == "Credentials > Revoke" and chunks[-1].text.startswith("## Revoke")
+    # code fences are never split
+    assert any("create-access-key\n\naws iam delete-access-key" in c.text for c in chunks)
+
+
+def test_chunk_markdown_overlap():
+    rotate = [c for c in chunk_markdown(MARKDOWN, max_tokens=80, overlap_tokens=40) if c.heading.endswith("Rotate")]
+    assert len(rotate) > 2
+    assert any(prev.end > nxt.start for prev, nxt in zip(rotate, rotate[1:]))
+
+
+def test_process_documents_is_idempotent(session):
+    source = DocumentSource(path="https://docs.example.com/creds", parsed_blob=get_blob_store().put(MARKDOWN))
+    session.add(source)
+    session.commit()
+
+    assert process_documents([source.id], session=session) == {source.id: True}
+    first = [(c.id, c.text) for c in session.exec(select(DocumentChunk)).all()]
+    assert first
+
+    assert process_documents([source.id], session=session) == {source.id: False}
+    assert [(c.id, c.text) for c in session.exec(select(DocumentChunk)).all()] == first
+
+    source.parsed_blob = get_blob_store().put(MARKDOWN + "\n\n## New section\n\nnew text")
+    session.commit()
+    assert process_documents([source.id], session=session) == {source.id: True}
+    assert session.exec(select(DocumentChunk).where(DocumentChunk.heading.contains("New section"))).first()
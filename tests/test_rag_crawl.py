@@ -0,0 +1,114 @@
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from runbook.rag_tools.rag_crawl import DocsCrawler, extract_links, parse_sitemap
+from runbook.rag_tools.rag_fetch import AsyncFetcher
+
+SITE = {
+    "/docs/index.html": ["/docs/a.html", "/docs/b.html", "/blog/post.html"],
+    "/docs/a.html": ["/docs/c.html", "/docs/index.html#top"],
+    "/docs/b.html": ["/docs/c.html", "https://elsewhere.example.com/docs/x.html"],
+    "/docs/c.html": [],
+    "/blog/post.html": [],
+}
+
+
+def _page(path: str) -> bytes:
+    links = "".join(f'<a href="{link}">{link}</a>' for link in SITE[path])
+    return f"<html><head><title>{path}</title></head><body>{links}</body></html>".encode()
+
+
+def _sitemap(base: str) -> bytes:
+    locs = "".join(f"<url><loc>{base}{path}</loc></url>" for path in ["/docs/a.html", "/docs/c.html"])
+    return f'<?xml version="1.0"?><urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">{locs}</urlset>'.encode()
+
+
+@pytest.fixture
+def local_site():
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            if self.path == "/sitemap.xml":
+                body = _sitemap(f"http://{self.headers['Host']}")
+            elif self.path in SITE:
+                body = _page(self.path)
+            else:
+                self.send_response(404)
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def _crawl(seed: str, existing: set[str] | None = None, **kwargs):
+    existing = existing or set()
+    saved_batches = []
+
+    def save_batch(batch):
+        saved_batches.append([source.path for source in batch])
+        return len(batch)
+
+    async def go():
+        async with AsyncFetcher() as fetcher:
+            crawler = DocsCrawler(
+                seed,
+                fetcher=fetcher,
+                politeness_delay=0.0,
+                exists_fn=lambda url: url in existing,
+                save_batch_fn=save_batch,
+                **kwargs,
+            )
+            return await crawler.run()
+
+    return asyncio.run(go()), saved_batches
+
+
+def test_extract_links_same_prefix():
+    html = '<a href="a.html#x">a</a><a href="/other/b.html">b</a><a href="a.html">again</a>'
+    assert extract_links("https://d.com/docs/index.html", html, "https://d.com/docs/") == ["https://d.com/docs/a.html"]
+
+
+def test_parse_sitemap_index():
+    data = '<sitemapindex xmlns="x"><sitemap><loc>https://d.com/s1.xml</loc></sitemap></sitemapindex>'
+    assert parse_sitemap(data) == (["https://d.com/s1.xml"], True)
+
+
+def test_crawl_follows_prefix_and_batches(local_site):
+    progress, batches = _crawl(f"{local_site}/docs/index.html", batch_size=2)
+
+    saved = sorted(path for batch in batches for path in batch)
+    assert saved == sorted(f"{local_site}/docs/{name}" for name in ["index.html", "a.html", "b.html", "c.html"])
+    assert all(len(batch) <= 2 for batch in batches)
+    assert progress.saved == progress.fetched == 4
+    assert progress.pages_per_sec > 0
+
+
+def test_crawl_dedupes_existing_and_respects_max_pages(local_site):
+    existing = {f"{local_site}/docs/a.html"}
+    progress, batches = _crawl(f"{local_site}/docs/index.html", existing=existing)
+    assert progress.skipped == 1
+    assert f"{local_site}/docs/a.html" not in [path for batch in batches for path in batch]
+
+    progress, _ = _crawl(f"{local_site}/docs/index.html", max_pages=2)
+    assert progress.discovered == 2
+
+
+def test_crawl_from_sitemap(local_site):
+    progress, batches = _crawl(f"{local_site}/sitemap.xml")
+    saved = {path for batch in batches for path in batch}
+    assert {f"{local_site}/docs/a.html", f"{local_site}/docs/c.html"} <= saved
+    assert progress.saved == len(saved) and progress.failed == 0
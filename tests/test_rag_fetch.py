@@ -0,0 +1,199 @@
+import asyncio
+import threading
+import time
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from sqlmodel import Session, SQLModel, create_engine
+
+from runbook.db_models import DocumentSource
+from runbook.rag_tools import document_body, fetch_sources
+from runbook.rag_tools.rag_db import load_refresh_candidates, mark_sources_checked
+from runbook.rag_tools.rag_fetch import AsyncFetcher
+from runbook.rag_tools.rag_refresh import RefreshOutcome, _refresh_candidates
+from rxconstants import tz
+
+PAGE = b"<html><head><title>Test Page</title><script>var x = 1;</script></head><body><p>hello</p></body></html>"
+
+
+class _Handler(BaseHTTPRequestHandler):
+    in_flight = 0
+    max_in_flight = 0
+    lock = threading.Lock()
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        with self.lock:
+            _Handler.in_flight += 1
+            _Handler.max_in_flight = max(_Handler.max_in_flight, _Handler.in_flight)
+        try:
+            if self.path.startswith("/slow"):
+                time.sleep(0.2)
+            if self.path == "/hang":
+                time.sleep(2)
+
+            if self.path == "/etag" and self.headers.get("If-None-Match") == '"v1"':
+                self.send_response(304)
+                self.end_headers()
+                return
+
+            if self.path in ("/bogus-charset", "/bad-length"):
+                self.send_response(200)
+                charset = "x-no-such-charset" if self.path == "/bogus-charset" else "utf-8"
+                self.send_header("Content-Type", f"text/html; charset={charset}")
+                self.send_header("Content-Length", str(len(PAGE)) if self.path == "/bogus-charset" else "12kb")
+                self.end_headers()
+                self.wfile.write(PAGE)
+                return
+
+            if self.path == "/missing":
+                self.send_response(404)
+                self.end_headers()
+                return
+
+            body = b"x" * 4096 if self.path == "/large" else PAGE
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("ETag", '"v1"')
+            if self.path != "/large":
+                self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        finally:
+            with self.lock:
+                _Handler.in_flight -= 1
+
+
+@pytest.fixture
+def local_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    _Handler.in_flight = _Handler.max_in_flight = 0
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def _run(coro):
+    return asyncio.run(coro)
+
+
+def test_fetch_ok(local_server):
+    async def go():
+        async with AsyncFetcher() as fetcher:
+            return await fetcher.fetch(f"{local_server}/page")
+
+    result = _run(go())
+    assert result.ok
+    assert result.status_code == 200
+    assert "Test Page" in result.content
+    assert result.num_bytes == len(PAGE)
+
+
+def test_fetch_errors_are_reported(local_server):
+    async def go():
+        async with AsyncFetcher(max_bytes=1024, timeout=0.5) as fetcher:
+            return await fetcher.fetch_many(
+                [f"{local_server}/missing", f"{local_server}/large", f"{local_server}/hang"],
+            )
+
+    missing, large, hang = _run(go())
+    assert not missing.ok and missing.status_code == 404
+    assert not large.ok and "too large" in large.error
+    assert not hang.ok and "timed out" in hang.error
+
+
+def test_malformed_responses_and_paths_do_not_raise(local_server):
+    async def go():
+        async with AsyncFetcher() as fetcher:
+            return await fetcher.fetch_many(
+                [f"{local_server}/bogus-charset", f"{local_server}/bad-length", "ftp://example.com/x", "http://"]
+            )
+
+    bogus_charset, bad_length, unsupported, invalid = _run(go())
+    assert bogus_charset.ok and "Test Page" in bogus_charset.content  # decoded as utf-8
+    assert bad_length.error or "Test Page" in bad_length.content
+    assert not unsupported.ok and unsupported.error
+    assert not invalid.ok and invalid.error
+
+
+def test_per_host_limit(local_server):
+    urls = [f"{local_server}/slow/{i}" for i in range(8)]
+
+    async def go():
+        async with AsyncFetcher(per_host_limit=2) as fetcher:
+            return await fetcher.fetch_many(urls)
+
+    results = _run(go())
+    assert all(r.ok for r in results)
+    assert [r.url for r in results] == urls
+    assert _Handler.max_in_flight <= 2
+
+
+def test_fetch_sources_bulk(local_server):
+    async def go():
+        async with AsyncFetcher() as fetcher:
+            return await fetch_sources([f"{local_server}/page", f"{local_server}/missing"], fetcher=fetcher)
+
+    ok, missing = _run(go())
+    assert ok.ok
+    assert ok.source.title == "Test Page"
+    assert ok.source.path.endswith("/page")
+    assert not missing.ok and missing.source is None
+
+
+def test_refresh_conditional_get(local_server):
+    saved, checked = {}, []
+
+    async def go():
+        async with AsyncFetcher() as fetcher:
+            first = await fetch_sources([f"{local_server}/etag"], fetcher=fetcher)
+            meta = first[0].source.meta
+            candidates = [
+                (1, f"{local_server}/etag", meta),  # 304
+                (2, f"{local_server}/page", {"content_hash": meta["content_hash"]}),  # same body, no validators
+                (3, f"{local_server}/page", {"content_hash": "stale"}),  # changed
+                (4, f"{local_server}/missing", {}),
+            ]
+            return meta, await _refresh_candidates(
+                candidates,
+                fetcher,
+                save_fn=lambda u: saved.update(u) or len(u),
+                checked_fn=lambda ids: checked.extend(ids) or len(ids),
+            )
+
+    meta, outcomes = _run(go())
+    assert meta["etag"] == '"v1"'
+    assert outcomes == {RefreshOutcome.UNCHANGED: 2, RefreshOutcome.UPDATED: 1, RefreshOutcome.FAILED: 1}
+    assert list(saved) == [3]
+    assert checked == [1, 2, 3, 4]  # whatever the outcome
+    assert saved[3]["meta"]["content_hash"] == meta["content_hash"]
+    assert "<script>" not in document_body(DocumentSource(path="", **saved[3]), "content")
+
+
+def test_stale_sweep_skips_recently_checked_sources():
+    engine = create_engine("sqlite://")
+    SQLModel.metadata.create_all(engine)
+    long_ago = datetime.now(tz=tz) - timedelta(days=30)
+    with Session(engine) as session:
+        session.add_all(
+            [
+                DocumentSource(path="never-checked", updated_at=long_ago),
+                DocumentSource(path="checked-unchanged", updated_at=long_ago, checked_at=datetime.now(tz=tz)),
+                DocumentSource(path="checked-long-ago", updated_at=long_ago, checked_at=long_ago),
+            ]
+        )
+        session.commit()
+
+        def stale() -> list[str]:
+            before = datetime.now(tz=tz) - timedelta(days=1)
+            return [path for _, path, _ in load_refresh_candidates(checked_before=before, session=session)]
+
+        assert stale() == ["never-checked", "checked-long-ago"]
+        # a 304 leaves `updated_at` as it was, the source still drops out of the next sweep
+        assert mark_sources_checked([1, 3], session=session) == 2
+        assert stale() == []
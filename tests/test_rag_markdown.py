@@ -0,0 +1,78 @@
+import asyncio
+
+from runbook.rag_tools.rag_mapreduce import (
+    convert_in_chunks,
+    split_html_sections,
+    split_markdown_sections,
+)
+from runbook.rag_tools.rag_markdown import html_to_markdown, iter_markdown
+from runbook.utils import estimate_tokens
+
+HTML = """<html><head><title>Doc</title><style>p { color: red; }</style></head><body>
+<h1>Rotate <code>credentials</code></h1>
+<p>Intro <strong>with bold text</strong> and a <a href="https://example.com/ref">link</a>.</p>
+<ul><li>First item</li><li>Second item<ol><li>nested</li></ol></li></ul>
+<pre><code class="language-bash">aws iam update-access-key --status Inactive</code></pre>
+<table><tr><th>Flag</th><th>Meaning</th></tr><tr><td><code>--force</code></td><td>skip a | b</td></tr></table>
+<script>alert(1)</script>
+</body></html>"""
+
+
+def test_html_to_markdown_structure():
+    markdown = html_to_markdown(HTML)
+
+    assert markdown.startswith("# Rotate `credentials`\n")
+    assert "Intro **with bold text** and a [link](https://example.com/ref)." in markdown
+    assert "- First item\n- Second item\n  1. nested" in markdown
+    assert "```bash\naws iam update-access-key --status Inactive\n```" in markdown
+    assert "| Flag | Meaning |\n| --- | --- |\n| `--force` | skip a \\| b |" in markdown
+    assert "alert" not in markdown and "color" not in markdown
+
+
+def test_iter_markdown_is_deterministic_and_streams_blocks():
+    blocks = list(iter_markdown(HTML))
+    assert blocks[0] == "# Rotate `credentials`"
+    assert len(blocks) == 5
+    assert html_to_markdown(HTML) == html_to_markdown(HTML)
+
+
+def test_split_html_sections_budget_and_headings():
+    sections = "".join(f"<h2>Section {i}</h2><p>{'word ' * 60}</p>" for i in range(10))
+    chunks = split_html_sections(f"<html><body><div>{sections}</div><script>x</script></body></html>", 200)
+
+    assert len(chunks) > 1
+    assert all(estimate_tokens(chunk) <= 200 for chunk in chunks)
+    assert all(chunk.startswith("<h2>") for chunk in chunks)
+    assert "<script>" not in "".join(chunks)
+
+
+def test_split_markdown_keeps_code_fences_whole():
+    markdown = "# A\n\n" + "text " * 50 + "\n\n```\nline one\n\nline two\n```\n\n# B\n\nend"
+    chunks = split_markdown_sections(markdown, 80)
+    assert any("line one\n\nline two" in chunk for chunk in chunks)
+    assert chunks[-1].startswith("# B")
+
+
+def test_convert_in_chunks_order_concurrency_and_resume():
+    in_flight = max_in_flight = 0
+    finished = []
+
+    async def convert(chunk: str) -> str:
+        nonlocal in_flight, max_in_flight
+        in_flight += 1
+        max_in_flight = max(max_in_flight, in_flight)
+        await asyncio.sleep(0.01 * (5 - int(chunk)))
+        in_flight -= 1
+        return f"<{chunk}>"
+
+    async def on_done(idx: int, text: str):
+        finished.append(idx)
+
+    chunks = [str(i) for i in range(5)]
+    results = asyncio.run(
+        convert_in_chunks(chunks, convert, done={1: "<cached>"}, concurrency=2, on_chunk_done=on_done)
+    )
+
+    assert results == ["<0>", "<cached>", "<2>", "<3>", "<4>"]
+    assert sorted(finished) == [0, 2, 3, 4]
+    assert max_in_flight <= 2
@@ -0,0 +1,67 @@
+from bs4 import BeautifulSoup
+
+from runbook.db_models import DocumentSource
+from runbook.rag_tools.rag_blob import document_body
+from runbook.rag_tools.rag_extract import extract_main_content
+from runbook.rag_tools.rag_parse import parse_html_document, source_from_html
+
+BODY = "Rotate the access key before disabling the old one, then update every consumer. " * 5
+
+PAGE = f"""<html><head><title>Rotate keys</title><style>.x {{ color: red }}</style></head><body>
+<header class="site-header"><a href="/">Docs home</a></header>
+<nav class="sidebar"><ul><li><a href="/a">A</a></li><li><a href="/b">B</a></li></ul></nav>
+<div class="cookie-banner">We use cookies to improve your experience on this site, accept them all.</div>
+<div class="content" style="padding: 4px" id="wrapper">
+  <h1 class="title">Rotate keys</h1>
+  <p>{BODY}</p>
+  <pre class="language-bash highlight" data-x="1">aws iam create-access-key</pre>
+  <div class="share-buttons"><a href="https://twitter.com">share</a></div>
+</div>
+<footer>Copyright 2024, every right reserved, see the terms of service for details.</footer>
+<script>track()</script><svg><path d="M0 0"/></svg>
+</body></html>"""
+
+
+def test_extract_main_content_by_density():
+    main = str(extract_main_content(BeautifulSoup(PAGE, "html.parser")))
+
+    assert "Rotate the access key" in main and "aws iam create-access-key" in main
+    for boilerplate in ["Docs home", "cookies", "Copyright", "share", "track()", "<svg", "sidebar", "style="]:
+        assert boilerplate not in main
+    assert '<pre class="language-bash">' in main
+
+
+def test_extract_prefers_main_element():
+    html = (
+        f"<body><div><p>{BODY}</p></div>"
+        "<main><article><header><h1>Title</h1></header><p>short text body here and more</p></article></main></body>"
+    )
+    main = extract_main_content(BeautifulSoup(html, "html.parser"))
+    assert main.name == "main"
+    assert "<h1>Title</h1>" in str(main)
+
+
+def test_parse_html_document_stats():
+    parsed = parse_html_document("https://docs.example.com/rotate", PAGE)
+
+    assert parsed.title == "Rotate keys"
+    assert parsed.stats["raw_bytes"] == len(PAGE.encode())
+    assert parsed.stats["content_bytes"] < parsed.stats["raw_bytes"]
+
+
+def test_source_bodies_are_content_addressed(blob_store):
+    first = source_from_html("https://docs.example.com/rotate", PAGE)
+    mirror = source_from_html("https://mirror.example.com/rotate", PAGE)
+
+    assert first.content == "" and first.raw_blob and first.content_blob
+    assert (first.raw_blob, first.content_blob) == (mirror.raw_blob, mirror.content_blob)
+    assert len(list(blob_store.root.rglob("*.gz"))) == 2
+    assert document_body(first, "raw") == PAGE
+    assert "Rotate the access key" in document_body(first, "content")
+    assert first.meta["raw_compressed_bytes"] < first.meta["raw_bytes"]
+
+
+def test_document_body_falls_back_to_inline_content():
+    legacy = DocumentSource(path="https://docs.example.com/old", content="<p>inline</p>")
+    assert document_body(legacy, "content") == "<p>inline</p>"
+    assert document_body(legacy, "parsed") == ""
@@ -0,0 +1,106 @@
+import asyncio
+
+import pytest
+from sqlalchemy.pool import StaticPool
+from sqlmodel import Session, SQLModel, create_engine
+
+from runbook import db_ops
+from runbook.db_models import DocumentSource
+from runbook.llm_tools import create_messages_for_chat_completion
+from runbook.rag_tools.rag_blob import get_blob_store
+from runbook.rag_tools.rag_pipeline import process_documents
+from runbook.rag_tools.rag_retrieve import (
+    Passage,
+    merge_overlapping,
+    pack_context,
+    reciprocal_rank_fusion,
+    retrieve_context,
+)
+
+MARKDOWN = (
+    "# Access keys\n\nRotate the access key with `aws iam create-access-key`.\n\n## Revoke\n\nDelete the old key."
+)
+
+
+@pytest.fixture
+def session():
+    # retrieval loads passages in a worker thread
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        yield session
+
+
+def passage(source_id: int, start: int, end: int, score: float, text: str | None = None) -> Passage:
+    return Passage(source_id, "Title", "https://x", "", text or "x" * (end - start), start, end, score)
+
+
+def test_reciprocal_rank_fusion_rewards_agreement():
+    keyword = [(1, 12.0), (2, 9.0), (3, 1.0)]
+    vector = [(3, 0.9), (1, 0.8)]
+    assert [item for item, _ in reciprocal_rank_fusion([keyword, vector])] == [1, 3, 2]
+    assert reciprocal_rank_fusion([]) == []
+
+
+def test_merge_overlapping_splices_neighbouring_chunks():
+    markdown = "0123456789abcdefghij"
+    merged = merge_overlapping(
+        [
+            passage(1, 0, 8, 0.5, markdown[0:8]),
+            passage(1, 6, 14, 0.9, markdown[6:14]),
+            passage(1, 16, 20, 0.1, markdown[16:20]),  # gap, stays separate
+            passage(2, 0, 8, 0.7, markdown[0:8]),
+        ]
+    )
+    assert [(p.source_id, p.text, p.score) for p in merged] == [
+        (1, markdown[0:14], 0.9),
+        (2, markdown[0:8], 0.7),
+        (1, markdown[16:20], 0.1),
+    ]
+
+
+def test_pack_context_respects_budget_and_numbers_citations():
+    passages = [passage(1, 0, 400, 0.9), passage(2, 0, 4000, 0.8), passage(3, 0, 40, 0.7)]
+    packed, context = pack_context(passages, max_tokens=200)
+    assert [p.source_id for p in packed] == [1, 3]  # the oversized passage is skipped, not truncated
+    assert context.startswith("[1] Title (https://x)") and "\n\n[2] Title" in context
+
+
+def test_pack_context_lists_passages_in_document_order():
+    passages = [passage(2, 0, 40, 0.9), passage(1, 100, 140, 0.8), passage(1, 0, 40, 0.7)]
+    packed, context = pack_context(passages)
+    assert [(p.source_id, p.start) for p in packed] == [(1, 0), (1, 100), (2, 0)]
+    assert pack_context(list(reversed(passages)))[1] == context
+
+
+def test_retrieve_context_end_to_end(session):
+    source = DocumentSource(
+        path="https://docs.example.com/keys", title="Keys", parsed_blob=get_blob_store().put(MARKDOWN)
+    )
+    session.add(source)
+    session.commit()
+    process_documents([source.id], session=session)
+
+    result = asyncio.run(retrieve_context("create-access-key", session=session))
+    assert result.passages and result.passages[0].path == "https://docs.example.com/keys"
+    assert "aws iam create-access-key" in result.context
+    assert {"keyword", "vector", "total"} <= set(result.timings)
+    # both sections of the page were retrieved, they share a citation line
+    assert result.citations() == "- [1], [2] [Keys](https://docs.example.com/keys)"
+
+    messages = create_messages_for_chat_completion([], "create-access-key", context=result.context)
+    assert messages[-1]["content"].startswith("Documentation excerpts:\n\n[1] Keys")
+
+
+def test_retrieve_context_opens_its_own_session(session, monkeypatch):
+    # the chat calls it without a session, the passages are loaded in a session of their own
+    source = DocumentSource(
+        path="https://docs.example.com/keys", title="Keys", parsed_blob=get_blob_store().put(MARKDOWN)
+    )
+    session.add(source)
+    session.commit()
+    process_documents([source.id], session=session)
+    monkeypatch.setattr(db_ops.rx, "session", lambda: Session(session.get_bind()))
+
+    result = asyncio.run(retrieve_context("create-access-key"))
+    assert result.passages and "aws iam create-access-key" in result.context
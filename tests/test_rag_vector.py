@@ -0,0 +1,154 @@
+import numpy as np
+import pytest
+from sqlmodel import Session, SQLModel, create_engine
+
+from runbook.db_models import DocumentSource
+from runbook.rag_tools import rag_vector
+from runbook.rag_tools.rag_blob import atomic_write, get_blob_store
+from runbook.rag_tools.rag_embed import HashEmbedder, normalize
+from runbook.rag_tools.rag_pipeline import process_documents, unindex_documents
+from runbook.rag_tools.rag_vector import IVFVectorIndex, VectorIndex, vector_search
+
+
+@pytest.fixture
+def session():
+    engine = create_engine("sqlite://")
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        yield session
+
+
+def test_hash_embedder_is_deterministic_and_normalized():
+    embedder = HashEmbedder(dim=64)
+    vectors = embedder.embed(["rotate the access key", "rotate the access key", ""])
+
+    assert vectors.shape == (3, 64) and vectors.dtype == np.float32
+    np.testing.assert_array_equal(vectors[0], vectors[1])
+    assert np.isclose(np.linalg.norm(vectors[0]), 1.0)
+    assert not vectors[2].any()
+
+
+def test_search_matches_brute_force_and_survives_reload(tmp_path):
+    rng = np.random.default_rng(0)
+    vectors = normalize(rng.standard_normal((500, 32)))
+    index = VectorIndex(tmp_path / "index")
+    index.add(list(range(250)), [1] * 250, vectors[:250], model="test")
+    index.add(list(range(250, 500)), [2] * 250, vectors[250:], model="test")
+
+    query = vectors[42]
+    expected = np.argsort(-(vectors @ query))[:5].tolist()
+    assert [chunk_id for chunk_id, _ in index.search(query, k=5)] == expected
+
+    reloaded = VectorIndex(tmp_path / "index")
+    assert isinstance(reloaded._snapshot.vectors, np.memmap)
+    assert reloaded.search(query, k=5) == index.search(query, k=5)
+    assert all(chunk_id >= 250 for chunk_id, _ in reloaded.search(query, k=5, source_ids=[2]))
+
+
+def test_remove_sources_soft_deletes_then_compacts(tmp_path):
+    vectors = normalize(np.eye(10, dtype=np.float32))
+    index = VectorIndex(tmp_path / "index", compact_ratio=0.5)
+    index.add(list(range(10)), [0, 0, 1, 1, 1, 1, 1, 1, 1, 1], vectors, model="test")
+
+    assert index.remove_sources([0]) == 2
+    assert len(index._snapshot.chunk_ids) == 10  # below the compaction ratio, rows only masked
+    assert index.search(vectors[0], k=1)[0][0] != 0
+    assert index.indexed_sources() == {1}
+
+    index.remove_sources([1])
+    assert len(index._snapshot.chunk_ids) == 0 and index.search(vectors[5]) == []
+    assert index._vectors_path.stat().st_size == 0
+    assert sorted(path.name for path in (tmp_path / "index").iterdir() if path.suffix == ".f32") == [
+        index._vectors_path.name
+    ]
+
+
+def test_interrupted_compaction_keeps_the_previous_generation(tmp_path, monkeypatch):
+    vectors = normalize(np.eye(10, dtype=np.float32))
+    index = VectorIndex(tmp_path / "index", compact_ratio=0.5)
+    index.add(list(range(10)), [0] * 4 + [1] * 6, vectors, model="test")
+    index.remove_sources([0])
+
+    def crash(path, write):
+        if path.name == "meta.json":
+            raise OSError("disk full")
+        atomic_write(path, write)
+
+    # the compacted vectors and ids are written, the process dies before the manifest is swapped
+    with monkeypatch.context() as patched, pytest.raises(OSError):
+        patched.setattr(rag_vector, "atomic_write", crash)
+        index.remove_sources([1])
+
+    reloaded = VectorIndex(tmp_path / "index")
+    assert len(reloaded._snapshot.chunk_ids) == 10 and reloaded.indexed_sources() == {1}
+    assert reloaded.search(vectors[7], k=1)[0][0] == 7
+    assert sorted(path.name for path in (tmp_path / "index").iterdir()) == sorted(
+        [*reloaded._files.values(), "meta.json"]
+    )
+
+
+def test_process_documents_embeds_chunks(session, vector_index):
+    docs = {
+        "keys": "# Access keys\n\nRotate the access key with the iam command.",
+        "clusters": "# Clusters\n\nA cluster runs spark jobs on worker nodes.",
+    }
+    sources = [
+        DocumentSource(path=f"https://docs.example.com/{name}", parsed_blob=get_blob_store().put(md))
+        for name, md in docs.items()
+    ]
+    session.add_all(sources)
+    session.commit()
+    keys, clusters = sources
+
+    process_documents([keys.id, clusters.id], session=session)
+    assert vector_index.indexed_sources() == {keys.id, clusters.id}
+
+    (best_chunk, _), *_ = vector_search("how do I rotate an access key", k=2)
+    assert vector_index._snapshot.source_ids[vector_index._snapshot.chunk_ids == best_chunk][0] == keys.id
+
+    unindex_documents([keys.id])
+    assert vector_index.indexed_sources() == {clusters.id}
+
+    # missing vectors are rebuilt even though the chunks themselves are unchanged
+    assert process_documents([keys.id], session=session) == {keys.id: False}
+    assert vector_index.indexed_sources() == {keys.id, clusters.id}
+
+
+def clustered_vectors(n: int, dim: int, clusters: int, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim))
+    return normalize(centers[rng.integers(clusters, size=n)] + 0.3 * rng.standard_normal((n, dim)))
+
+
+def test_ivf_index_trains_and_matches_exact_search(tmp_path):
+    vectors = clustered_vectors(2000, 16, clusters=20)
+    ivf = IVFVectorIndex(tmp_path / "ivf", nlist=20, nprobe=20, train_min_rows=1000)
+    ivf.add(list(range(1000)), [1] * 1000, vectors[:1000], model="test")
+    assert ivf._snapshot.ivf is not None
+    ivf.add(list(range(1000, 2000)), [2] * 1000, vectors[1000:], model="test")  # assigned to existing lists
+
+    exact = VectorIndex(tmp_path / "ivf")  # same files, brute-force search
+    for query in vectors[:20]:
+        # probing every list is exhaustive
+        assert ivf.search(query, k=10) == exact.search(query, k=10)
+
+    ivf.nprobe = 3
+    recall = np.mean(
+        [len({c for c, _ in ivf.search(q, k=10)} & {c for c, _ in exact.search(q, k=10)}) / 10 for q in vectors[:50]]
+    )
+    assert recall > 0.8
+
+
+def test_ivf_index_reload_and_remove(tmp_path):
+    vectors = clustered_vectors(600, 16, clusters=8)
+    ivf = IVFVectorIndex(tmp_path / "ivf", nlist=8, nprobe=8, train_min_rows=100, compact_ratio=0.1)
+    ivf.add(list(range(600)), [i % 3 for i in range(600)], vectors, model="test")
+
+    reloaded = IVFVectorIndex(tmp_path / "ivf", nprobe=8)
+    assert reloaded._snapshot.ivf is not None
+    np.testing.assert_array_equal(reloaded._snapshot.ivf.lists, ivf._snapshot.ivf.lists)
+
+    ivf.remove_sources([0])  # compacts, the lists must follow the surviving rows
+    assert len(ivf._snapshot.ivf.lists) == 400
+    assert all(chunk_id % 3 != 0 for chunk_id, _ in ivf.search(vectors[0], k=50))
+    assert all(chunk_id % 3 == 2 for chunk_id, _ in ivf.search(vectors[0], k=50, source_ids=[2]))